@@ -0,0 +1,83 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class SemanticAnswerCache:
+    """LRU/TTL cache of answers looked up by query embedding similarity.
+
+    Entries are scoped to an answer source and tagged with the index version
+    they were answered from; entries from another version never match and are
+    dropped on the next lookup. Embeddings are expected to be L2-normalized,
+    so the dot product is the cosine similarity.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=512, ttl=3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def _evict_stale(self, index_version, now):
+        stale = [
+            key for key, entry in self._entries.items()
+            if now - entry["created"] > self.ttl
+            or (entry["index_version"] is not None and index_version is not None
+                and entry["index_version"] != index_version)
+        ]
+        for key in stale:
+            del self._entries[key]
+
+    def lookup(self, embedding, scope, index_version=None):
+        """Return (answer, sources) of the most similar cached query, or None"""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        with self._lock:
+            self._evict_stale(index_version, time.time())
+            keys = [key for key, entry in self._entries.items()
+                    if entry["scope"] == scope and entry["index_version"] == index_version]
+            if keys:
+                matrix = np.stack([self._entries[key]["embedding"] for key in keys])
+                scores = matrix @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    entry = self._entries[keys[best]]
+                    return entry["answer"], entry["sources"]
+            self.misses += 1
+            return None
+
+    def store(self, embedding, scope, answer, sources, index_version=None):
+        """Cache an answer for a query embedding"""
+        with self._lock:
+            self._entries[self._next_key] = {
+                "embedding": np.asarray(embedding, dtype=np.float32).ravel(),
+                "scope": scope,
+                "index_version": index_version,
+                "answer": answer,
+                "sources": sources,
+                "created": time.time(),
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
@@ -3,25 +3,27 @@ import datetime
 import os
 import logging
 from firebase_admin import firestore
-from config import setup_firebase, setup_models, initialize_storage
-from auth import check_user_role, handle_authentication
-from file_processing import process_uploaded_files, process_url_input
-from chat import handle_chat_interaction
-from session_management import create_session, get_session_chats, handle_session_history
+from config import setup_firebase, setup_models, initialize_storage, CRAWL_MAX_DEPTH, REPLACE_BY_FILENAME
+from auth import check_user_role, handle_authentication, handle_role_management
+from ingest_jobs import get_ingest_workers, enqueue_ingest, enqueue_crawl, show_ingest_jobs, manage_documents
+from chat import handle_chat_interaction, source_filter_controls
+from session_management import create_session, get_session_chats, handle_session_history, load_earlier_chats
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 
 # Initialize Firebase and Models
 auth, db, bucket = setup_firebase()
-faiss_index, embedding_model, model = setup_models()
+index_store, embedding_model, model = setup_models()
 UPLOAD_DIR = initialize_storage()
 
 def main():
     st.title("📜 RaiLChatBot 🤖")
     
     # Authentication
-    user_role = handle_authentication(auth)
+    user_role = handle_authentication(auth, db)
+    if user_role == "Superadmin":
+        handle_role_management(db)
     
     # File Upload Section (Admin/Superadmin only)
     if user_role in ["Admin", "Superadmin"] and st.session_state.user:
@@ -29,15 +31,44 @@ def main():
         uploaded_files = st.sidebar.file_uploader(
             "Upload PDFs", type=["pdf"], accept_multiple_files=True
         )
+        replace_by_name = st.sidebar.checkbox(
+            "Replace earlier uploads with the same file name", value=REPLACE_BY_FILENAME
+        )
         url_input = st.sidebar.text_input("Enter a URL to scrape content")
+        crawl_mode = st.sidebar.checkbox("Crawl linked pages on the same site")
         
-        # Process uploads
-        if uploaded_files:
-            process_uploaded_files(uploaded_files, UPLOAD_DIR, faiss_index, embedding_model, bucket)
+        # Queue uploads and the URL for the background workers; the index
+        # reloads automatically once a job publishes a new version
+        ingest_workers = get_ingest_workers(bucket)
+        if (uploaded_files or (url_input and not crawl_mode)) and st.sidebar.button("Ingest in background"):
+            job_id = enqueue_ingest(
+                ingest_workers,
+                uploaded_files or [],
+                [url_input] if url_input and not crawl_mode else [],
+                index_store.manifest,
+                UPLOAD_DIR,
+                replace_by_name=replace_by_name
+            )
+            if job_id:
+                st.sidebar.success(f"Queued ingestion job #{job_id}")
+            else:
+                st.sidebar.info("These files are already indexed")
+        with st.sidebar:
+            show_ingest_jobs(ingest_workers.queue)
+            manage_documents(ingest_workers, index_store.manifest)
         
-        # Process URL
-        if url_input:
-            process_url_input(url_input, UPLOAD_DIR, faiss_index, embedding_model)
+        # Crawl documentation portals from the URL and/or a sitemap
+        if crawl_mode:
+            crawl_depth = st.sidebar.number_input("Crawl depth", min_value=0, max_value=5, value=CRAWL_MAX_DEPTH)
+            sitemap_url = st.sidebar.text_input("Sitemap URL (optional)")
+            if st.sidebar.button("Start crawl") and (url_input or sitemap_url):
+                job_id = enqueue_crawl(
+                    ingest_workers,
+                    [url_input] if url_input else [],
+                    sitemap_url,
+                    int(crawl_depth)
+                )
+                st.sidebar.success(f"Queued crawl job #{job_id}")
     
     # Chatbot Interface
     st.markdown("💬 **Ask me anything about the uploaded files or websites:**")
@@ -45,6 +76,7 @@ def main():
         "Select Answer Source",
         ["Working Model (Uploaded PDFs)", "Gemini (Uploaded PDFs)", "Gemini AI (General Knowledge)"]
     )
+    filters = source_filter_controls(index_store) if answer_source != "Gemini AI (General Knowledge)" else None
     
     # Initialize chat state
     if "chat_history" not in st.session_state:
@@ -58,10 +90,11 @@ def main():
         handle_chat_interaction(
             query,
             answer_source,
-            faiss_index,
+            index_store,
             model,
             embedding_model,
-            db
+            db,
+            filters
         )
     
     # Session History
@@ -70,6 +103,8 @@ def main():
     
     # Display Chat History
     st.subheader("📜 Chat History")
+    if st.session_state.get("history_has_more") and st.button("Load earlier messages"):
+        load_earlier_chats(db)
     for chat in st.session_state.chat_history:
         st.markdown(f"**🕒 {chat['time']} | You:** {chat['user']}")
         st.markdown(f"**🤖 AI:** {chat['bot']}")
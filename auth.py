@@ -1,19 +1,50 @@
 import streamlit as st
 from firebase_admin import auth
 import datetime
+from config import ROLE_CACHE_TTL
+from role_cache import RoleCache
+
+ROLES = ["User", "Admin", "Superadmin"]
+
+@st.cache_resource
+def get_role_cache():
+    """Process-wide role cache shared by all sessions"""
+    return RoleCache(ROLE_CACHE_TTL)
 
 def check_user_role(user_uid, db):
-    """Check user role from Firestore database"""
+    """Check user role, reading Firestore only when the cached role is missing or expired"""
+    role_cache = get_role_cache()
+    role = role_cache.get(user_uid)
+    if role is not None:
+        return role
     try:
         user_doc = db.collection('users').document(user_uid).get()
-        if user_doc.exists:
-            return user_doc.to_dict().get('role', 'User')
-        return 'User'
+        role = user_doc.to_dict().get('role', 'User') if user_doc.exists else 'User'
+        role_cache.set(user_uid, role)
+        return role
     except Exception as e:
+        # Not cached, so the next rerun retries
         st.error(f"Error checking user role: {e}")
         return 'User'
 
-def handle_authentication(auth_instance):
+def set_user_role(user_uid, role, db):
+    """Change a user's role in Firestore and drop the cached one"""
+    db.collection('users').document(user_uid).set({'role': role}, merge=True)
+    get_role_cache().invalidate(user_uid)
+
+def handle_role_management(db):
+    """Let a Superadmin change another user's role"""
+    with st.sidebar.expander("🛡️ Manage Roles"):
+        user_uid = st.text_input("User ID")
+        role = st.selectbox("Role", ROLES)
+        if st.button("Update Role") and user_uid:
+            try:
+                set_user_role(user_uid, role, db)
+                st.success(f"Role of {user_uid} set to {role}")
+            except Exception as e:
+                st.error(f"Error updating role: {e}")
+
+def handle_authentication(auth_instance, db):
     """Handle user authentication logic"""
     if 'user' not in st.session_state:
         st.session_state.user = None
@@ -29,6 +60,8 @@ def handle_authentication(auth_instance):
                 try:
                     user = auth_instance.sign_in_with_email_and_password(email, password)
                     st.session_state.user = user
+                    # Fill the role cache now so reruns don't read Firestore
+                    check_user_role(user['localId'], db)
                     st.success("Login successful!")
                     st.rerun()
                 except Exception as e:
@@ -1,12 +1,97 @@
 import streamlit as st
+import time
 import datetime
+import logging
 import numpy as np
+import faiss
+from config import STREAM_ANSWERS, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, get_chat_writer
+from config import HYBRID_SEARCH, RETRIEVAL_CANDIDATES, RRF_K, RERANK_CANDIDATES, load_reranker
+from config import CONTEXT_CANDIDATES, CONTEXT_TOKEN_BUDGET, MMR_LAMBDA, load_tokenizer
+from answer_cache import SemanticAnswerCache
+from retrieval import retrieve_records, format_retrieval_timings
+from context_builder import build_context
+from vector_index import chunk_vectors
+from chunk_metadata import filter_key
+
+GENERAL_KNOWLEDGE = "Gemini AI (General Knowledge)"
+SOURCE_TYPE_LABELS = {"pdf": "Uploaded PDFs", "url": "Web pages"}
+
+@st.cache_resource
+def get_answer_cache():
+    """Process-wide semantic answer cache shared by all sessions"""
+    return SemanticAnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+
+def embed_query(query, embedding_model):
+    """Encode a query into a normalized float32 row, like the indexed chunks"""
+    query_embedding = np.asarray(embedding_model.encode([query]), dtype=np.float32)
+    faiss.normalize_L2(query_embedding)
+    return query_embedding
+
+def search_by_embedding(query_embedding, faiss_index, k=5):
+    """Search the FAISS index with an already encoded query"""
+    D, I = faiss_index.search(query_embedding, k)
+    return D[0], I[0]
 
 def search_similar_chunks(query, faiss_index, embedding_model, k=5):
     """Search for similar text chunks using FAISS"""
-    query_embedding = embedding_model.encode([query])[0]
-    D, I = faiss_index.search(np.array([query_embedding]), k)
-    return D[0], I[0]
+    return search_by_embedding(embed_query(query, embedding_model), faiss_index, k)
+
+def source_filter_controls(index_store):
+    """Let the user limit answers to chosen documents, source types and ingest dates; returns the filters or None"""
+    documents = index_store.manifest.documents
+    with st.expander("🔍 Limit sources"):
+        selected = st.multiselect(
+            "Documents", sorted(documents, key=lambda key: documents[key]["name"]),
+            format_func=lambda key: documents[key]["name"]
+        )
+        source_types = st.multiselect(
+            "Source types", index_store.metadata.source_types,
+            format_func=lambda kind: SOURCE_TYPE_LABELS.get(kind, kind)
+        )
+        since = until = None
+        if st.checkbox("Only documents added between"):
+            today = datetime.date.today()
+            dates = st.date_input("Added between", (today - datetime.timedelta(days=30), today))
+            if len(dates) == 2:
+                since = datetime.datetime.combine(dates[0], datetime.time()).timestamp()
+                until = datetime.datetime.combine(dates[1] + datetime.timedelta(days=1), datetime.time()).timestamp()
+    filters = {"documents": selected, "source_types": source_types, "since": since, "until": until}
+    return filters if filter_key(filters) else None
+
+def retrieve_context(query, query_embedding, index_store, k=CONTEXT_CANDIDATES, token_budget=CONTEXT_TOKEN_BUDGET,
+                     filters=None):
+    """Retrieve the k best chunks and pack them, deduplicated and MMR-ordered, into token_budget tokens.
+
+    filters restrict retrieval to matching chunks (see source_filter_controls).
+    Returns the context, its files, stage latencies and the tokens used.
+    """
+    records, timings = retrieve_records(
+        query, query_embedding, index_store, k, RETRIEVAL_CANDIDATES, RRF_K, lexical=HYBRID_SEARCH,
+        reranker=load_reranker(), rerank_candidates=RERANK_CANDIDATES, filters=filters
+    )
+    start = time.perf_counter()
+    vectors = chunk_vectors(index_store.index, [record["id"] for record in records]) if records else None
+    context, records, tokens = build_context(
+        records, query_embedding, vectors, load_tokenizer(), token_budget, MMR_LAMBDA
+    )
+    timings["context"] = time.perf_counter() - start
+    files = sorted({record["file"] for record in records})
+    return context, files, timings, tokens
+
+def retrieval_caption(timings, tokens, token_budget=CONTEXT_TOKEN_BUDGET):
+    return f"🔎 Retrieval: {format_retrieval_timings(timings)} · context {tokens}/{token_budget} tokens"
+
+def iter_response_text(model, prompt):
+    """Yield answer text from the model as it is generated"""
+    for chunk in model.generate_content(prompt, stream=True):
+        if chunk.text:
+            yield chunk.text
+
+def generate_answer(model, prompt, stream=STREAM_ANSWERS):
+    """Generate an answer, rendering it token by token when streaming"""
+    if not stream:
+        return model.generate_content(prompt).text
+    return st.write_stream(iter_response_text(model, prompt))
 
 def format_response(response, sources):
     """Format the chat response with sources"""
@@ -17,46 +102,62 @@ def format_response(response, sources):
         'sources': sources
     }
 
-def handle_chat_interaction(query, answer_source, faiss_index, model, embedding_model, db):
+def generate_response(query, query_embedding, answer_source, index_store, model, filters=None):
+    """Generate a response and its sources for the selected answer source"""
+    if answer_source == "Working Model (Uploaded PDFs)":
+        # Search similar chunks
+        context, files, timings, tokens = retrieve_context(query, query_embedding, index_store, filters=filters)
+        st.caption(retrieval_caption(timings, tokens))
+
+        # Generate response using context
+        response = generate_answer(model, f"Based on this context: {context}\n\nQuestion: {query}")
+        return response, ", ".join(files) or "PDF Documents"
+
+    if answer_source == "Gemini (Uploaded PDFs)":
+        # Similar to above but with different prompt
+        context, files, timings, tokens = retrieve_context(query, query_embedding, index_store, filters=filters)
+        st.caption(retrieval_caption(timings, tokens))
+
+        response = generate_answer(
+            model,
+            f"Using only the following context, answer the question. If the answer isn't in the context, say so.\n\nContext: {context}\n\nQuestion: {query}"
+        )
+        return response, "Gemini + " + (", ".join(files) or "PDF Documents")
+
+    # Gemini AI (General Knowledge)
+    return generate_answer(model, query), "Gemini AI"
+
+def handle_chat_interaction(query, answer_source, index_store, model, embedding_model, db, filters=None):
     """Handle chat interactions based on selected answer source"""
     try:
         if not query:
             st.warning("Please enter a question.")
             return
 
-        response = ""
-        sources = ""
-
-        if answer_source == "Working Model (Uploaded PDFs)":
-            # Search similar chunks
-            distances, indices = search_similar_chunks(query, faiss_index, embedding_model)
-            context = "Context from documents: " + " ".join([str(idx) for idx in indices])
-            
-            # Generate response using context
-            response = model.generate_content(f"Based on this context: {context}\n\nQuestion: {query}").text
-            sources = "PDF Documents"
-
-        elif answer_source == "Gemini (Uploaded PDFs)":
-            # Similar to above but with different prompt
-            distances, indices = search_similar_chunks(query, faiss_index, embedding_model)
-            context = "Context from documents: " + " ".join([str(idx) for idx in indices])
-            
-            response = model.generate_content(
-                f"Using only the following context, answer the question. If the answer isn't in the context, say so.\n\nContext: {context}\n\nQuestion: {query}"
-            ).text
-            sources = "Gemini + PDF Documents"
-
-        else:  # Gemini AI (General Knowledge)
-            response = model.generate_content(query).text
-            sources = "Gemini AI"
+        # Answers grounded in documents are only valid for the index they came from
+        query_embedding = embed_query(query, embedding_model)
+        index_version = None if answer_source == GENERAL_KNOWLEDGE else index_store.version
+        # Filtered answers are cached apart from unfiltered ones
+        scope = answer_source if answer_source == GENERAL_KNOWLEDGE else (answer_source, filter_key(filters))
+        answer_cache = get_answer_cache()
+
+        cached = answer_cache.lookup(query_embedding, scope, index_version)
+        if cached:
+            response, sources = cached
+            st.caption("♻️ Answer served from cache")
+            logging.info(f"Answer cache hit: {answer_cache.stats()}")
+        else:
+            response, sources = generate_response(query, query_embedding, answer_source, index_store, model, filters)
+            answer_cache.store(query_embedding, scope, response, sources, index_version)
 
         # Update chat history
         chat_response = format_response(response, sources)
         st.session_state.chat_history.append(chat_response)
 
-        # Save to database if user is logged in
+        # Queue the record for a batched background write if the user is logged in
         if st.session_state.user and st.session_state.current_session:
-            db.collection('chat_sessions').document(st.session_state.current_session).collection('chats').add({
+            chats = db.collection('chat_sessions').document(st.session_state.current_session).collection('chats')
+            get_chat_writer(db).add(chats, {
                 'timestamp': datetime.datetime.now(),
                 'user_message': query,
                 'ai_response': response,
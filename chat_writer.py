@@ -0,0 +1,125 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+_FLUSH = object()
+_STOP = object()
+
+class ChatWriter:
+    """Write-behind persistence for chat records.
+
+    add() assigns the document id and returns immediately; a background
+    thread groups queued records into Firestore batched writes, committing
+    when batch_size records are waiting or flush_interval seconds have
+    passed. Failed commits are retried with exponential backoff, and because
+    ids are fixed up front a retried batch never duplicates a record. Queued
+    records are flushed at interpreter exit.
+    """
+
+    def __init__(self, db, batch_size=100, flush_interval=0.5, max_retries=5, backoff=0.5):
+        self.db = db
+        self.batch_size = min(batch_size, MAX_BATCH_WRITES)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self._pending = 0
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, collection_ref, data):
+        """Queue a new document in collection_ref and return its reference"""
+        doc_ref = collection_ref.document()
+        with self._cond:
+            self._pending += 1
+        self._queue.put((doc_ref, data))
+        return doc_ref
+
+    def _next_batch(self):
+        """Block for the next record, then gather more until the batch is full or the interval passes"""
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        writes = [] if item is _FLUSH else [item]
+        deadline = time.monotonic() + self.flush_interval
+        while item is not _FLUSH and len(writes) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Commit what we have; close() has already stopped new records
+                self._queue.put(_STOP)
+                break
+            if item is not _FLUSH:
+                writes.append(item)
+        return writes
+
+    def _commit(self, writes):
+        for attempt in range(self.max_retries + 1):
+            try:
+                batch = self.db.batch()
+                for doc_ref, data in writes:
+                    batch.set(doc_ref, data)
+                batch.commit()
+                self.written += len(writes)
+                self.batches += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error(f"Dropping {len(writes)} chat records after {attempt + 1} failed commits: {e}")
+                    self.failed += len(writes)
+                    return
+                delay = self.backoff * 2 ** attempt
+                logging.warning(f"Chat batch commit failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _run(self):
+        while True:
+            writes = self._next_batch()
+            if writes is None:
+                return
+            if writes:
+                try:
+                    self._commit(writes)
+                finally:
+                    with self._cond:
+                        self._pending -= len(writes)
+                        self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Commit queued records now and wait until they are written; False on timeout"""
+        self._queue.put(_FLUSH)
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=10):
+        """Flush queued records and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        flushed = self.flush(timeout)
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if not flushed:
+            logging.error(f"Chat writer closed with {self._pending} records unwritten")
+
+    def stats(self):
+        """Return pending, written and failed record counts and committed batches"""
+        with self._cond:
+            pending = self._pending
+        return {"pending": pending, "written": self.written, "failed": self.failed, "batches": self.batches}
@@ -0,0 +1,192 @@
+import time
+import threading
+from array import array
+from collections import OrderedDict
+import numpy as np
+from atomic_io import atomic_write
+
+# Masks kept per ChunkMetadata, keyed by filter
+MASK_CACHE_SIZE = 32
+
+# Chunk states: deleted chunks keep their vector in the index until compaction purges it
+LIVE, DELETED, PURGED = 0, 1, 2
+
+def source_type(doc_key):
+    """Source type of a manifest key: "pdf" for uploaded files, "url" for web pages"""
+    if doc_key.startswith("sha256:"):
+        return "pdf"
+    if doc_key.startswith("url:"):
+        return "url"
+    return "other"
+
+def filter_key(filters):
+    """Hashable, order-independent form of a filters dict (None when it filters nothing)"""
+    if not filters:
+        return None
+    key = (
+        tuple(sorted(filters.get("documents") or ())),
+        tuple(sorted(filters.get("source_types") or ())),
+        filters.get("since"),
+        filters.get("until"),
+    )
+    return None if key == ((), (), None, None) else key
+
+class ChunkMetadata:
+    """Document, source type, ingest time, page and deletion state of every chunk, as arrays indexed by chunk id.
+
+    Filters are dicts with optional "documents" (manifest keys),
+    "source_types", and "since"/"until" (epoch seconds). mask() turns one
+    into a boolean array over chunk ids with a few vectorized comparisons,
+    and the last few masks are cached until chunks are added or removed.
+    Chunk ids are never reused: a deleted chunk is tombstoned and masked
+    out of every search, then marked purged once compaction has dropped its
+    vector from the index.
+    """
+
+    def __init__(self):
+        self.doc_keys = []
+        self.source_types = []
+        self.docs = array("i")
+        self.sources = array("B")
+        self.added_at = array("d")
+        self.pages = array("i")
+        self.states = array("B")
+        self._doc_codes = {}
+        self._source_codes = {}
+        self._masks = OrderedDict()
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _code(self, value, values, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def add(self, records, first_id=None, added_at=None):
+        """Append metadata for chunk records ("doc_key", "page") as consecutive ids starting at first_id"""
+        if first_id is not None and first_id != len(self):
+            raise ValueError(f"Chunk metadata holds {len(self)} chunks, cannot add at id {first_id}")
+        added_at = time.time() if added_at is None else added_at
+        for record in records:
+            doc_key = record.get("doc_key") or ""
+            kind = record.get("source_type") or source_type(doc_key)
+            self.docs.append(self._code(doc_key, self.doc_keys, self._doc_codes))
+            self.sources.append(self._code(kind, self.source_types, self._source_codes))
+            self.added_at.append(record.get("added_at", added_at))
+            page = record.get("page")
+            self.pages.append(-1 if page is None else int(page))
+            self.states.append(LIVE)
+        with self._lock:
+            self._masks.clear()
+
+    def _set_state(self, ids, state, current):
+        states = np.frombuffer(self.states, dtype=np.uint8)
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < len(self))]
+        ids = ids[states[ids] == current]
+        states[ids] = state
+        with self._lock:
+            self._masks.clear()
+            self._stale = int(np.count_nonzero(states == DELETED))
+        return len(ids)
+
+    def delete(self, ids):
+        """Tombstone live chunks so searches skip them; returns how many were live"""
+        return self._set_state(ids, DELETED, LIVE)
+
+    def purge(self, ids):
+        """Mark tombstoned chunks whose vectors compaction removed from the index"""
+        return self._set_state(ids, PURGED, DELETED)
+
+    def deleted_ids(self):
+        """Ids of tombstoned chunks whose vectors are still in the index"""
+        return np.flatnonzero(np.frombuffer(self.states, dtype=np.uint8) == DELETED)
+
+    def stale_count(self):
+        """Number of tombstoned chunks whose vectors are still in the index"""
+        return self._stale
+
+    def live_count(self):
+        return int(np.count_nonzero(np.frombuffer(self.states, dtype=np.uint8) == LIVE))
+
+    def truncate(self, count):
+        """Drop metadata of chunks with ids >= count"""
+        if len(self) <= count:
+            return
+        for values in (self.docs, self.sources, self.added_at, self.pages, self.states):
+            del values[count:]
+        with self._lock:
+            self._masks.clear()
+            self._stale = int(np.count_nonzero(np.frombuffer(self.states, dtype=np.uint8) == DELETED))
+
+    def mask(self, filters):
+        """Return a boolean array marking the live chunks that pass filters.
+
+        None means every chunk in the index qualifies: no filter and no
+        tombstoned vectors left in the index.
+        """
+        key = filter_key(filters)
+        if key is None and not self._stale:
+            return None
+        with self._lock:
+            if key in self._masks:
+                self._masks.move_to_end(key)
+                return self._masks[key]
+        documents, source_types, since, until = key or ((), (), None, None)
+        mask = np.frombuffer(self.states, dtype=np.uint8) == LIVE
+        if documents:
+            codes = [self._doc_codes[doc_key] for doc_key in documents if doc_key in self._doc_codes]
+            mask &= np.isin(np.frombuffer(self.docs, dtype=np.int32), codes)
+        if source_types:
+            codes = [self._source_codes[kind] for kind in source_types if kind in self._source_codes]
+            mask &= np.isin(np.frombuffer(self.sources, dtype=np.uint8), codes)
+        if since is not None or until is not None:
+            added_at = np.frombuffer(self.added_at, dtype=np.float64)
+            if since is not None:
+                mask &= added_at >= since
+            if until is not None:
+                mask &= added_at < until
+        mask.flags.writeable = False
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    def save(self, path):
+        """Atomically write the arrays and their lookup tables as one .npz file"""
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    doc_keys=np.array(self.doc_keys, dtype=str),
+                    source_types=np.array(self.source_types, dtype=str),
+                    docs=np.frombuffer(self.docs, dtype=np.int32),
+                    sources=np.frombuffer(self.sources, dtype=np.uint8),
+                    added_at=np.frombuffer(self.added_at, dtype=np.float64),
+                    pages=np.frombuffer(self.pages, dtype=np.int32),
+                    states=np.frombuffer(self.states, dtype=np.uint8),
+                )
+        atomic_write(path, write)
+
+    @classmethod
+    def load(cls, path):
+        metadata = cls()
+        with np.load(path) as data:
+            metadata.doc_keys = data["doc_keys"].tolist()
+            metadata.source_types = data["source_types"].tolist()
+            metadata.docs = array("i", data["docs"].astype(np.int32).tobytes())
+            metadata.sources = array("B", data["sources"].astype(np.uint8).tobytes())
+            metadata.added_at = array("d", data["added_at"].astype(np.float64).tobytes())
+            metadata.pages = array("i", data["pages"].astype(np.int32).tobytes())
+            states = data["states"] if "states" in data.files else np.zeros(len(metadata.docs), dtype=np.uint8)
+            metadata.states = array("B", states.astype(np.uint8).tobytes())
+        metadata._stale = len(metadata.deleted_ids())
+        metadata._doc_codes = {doc_key: code for code, doc_key in enumerate(metadata.doc_keys)}
+        metadata._source_codes = {kind: code for code, kind in enumerate(metadata.source_types)}
+        return metadata
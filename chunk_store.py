@@ -0,0 +1,95 @@
+import os
+import json
+import mmap
+import struct
+
+BLOB_FILENAME = "chunks.bin"
+OFFSETS_FILENAME = "chunks.idx"
+
+# (offset, length) of each JSON-encoded chunk record inside the blob
+OFFSET_RECORD = struct.Struct("<QQ")
+
+class ChunkStore:
+    """Append-only chunk records stored as a text blob plus a fixed-width offset table.
+
+    Chunk ids are positions in the offset table, matching FAISS ids. Reads go
+    through mmap so only the pages holding the requested chunks are touched.
+    Files only ever grow, since other store instances may have them mapped:
+    the number of valid records is kept by the owner (the index manifest)
+    and set through truncate(), and records past it are overwritten by the
+    next append.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.blob_path = os.path.join(directory, BLOB_FILENAME)
+        self.offsets_path = os.path.join(directory, OFFSETS_FILENAME)
+        self._blob_map = None
+        self._offsets_map = None
+        self.count = None
+
+    def _file_count(self):
+        try:
+            return os.path.getsize(self.offsets_path) // OFFSET_RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def __len__(self):
+        return self._file_count() if self.count is None else self.count
+
+    def _map(self, path, current):
+        """Return an mmap of path, re-mapping if the file has grown"""
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size == 0:
+            return None
+        if current is not None and len(current) == size:
+            return current
+        # The old map is left to the garbage collector: another thread may still be reading it
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def append(self, records):
+        """Append chunk record dicts and return their ids"""
+        os.makedirs(self.directory, exist_ok=True)
+        first_id = len(self)
+        entries = []
+        with open(self.blob_path, "ab") as blob:
+            offset = blob.tell()
+            for record in records:
+                data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+                blob.write(data)
+                entries.append(OFFSET_RECORD.pack(offset, len(data)))
+                offset += len(data)
+            blob.flush()
+            os.fsync(blob.fileno())
+        # The offset table is written last so readers never see a partial record;
+        # entries of orphaned records past first_id are overwritten in place
+        with os.fdopen(os.open(self.offsets_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)), "r+b") as offsets:
+            offsets.seek(first_id * OFFSET_RECORD.size)
+            offsets.write(b"".join(entries))
+            offsets.flush()
+            os.fsync(offsets.fileno())
+        self.count = first_id + len(entries)
+        return list(range(first_id, self.count))
+
+    def truncate(self, count):
+        """Treat records past count as orphaned, e.g. ones whose vectors were never saved.
+
+        Only the valid length changes; the files keep their size.
+        """
+        self.count = min(count, self._file_count())
+
+    def get(self, ids):
+        """Return the records for the given ids, with None for unknown ids"""
+        self._offsets_map = self._map(self.offsets_path, self._offsets_map)
+        self._blob_map = self._map(self.blob_path, self._blob_map)
+        count = min(len(self._offsets_map) // OFFSET_RECORD.size if self._offsets_map else 0, len(self))
+        records = []
+        for chunk_id in ids:
+            chunk_id = int(chunk_id)
+            if chunk_id < 0 or chunk_id >= count:
+                records.append(None)
+                continue
+            offset, length = OFFSET_RECORD.unpack_from(self._offsets_map, chunk_id * OFFSET_RECORD.size)
+            records.append(json.loads(self._blob_map[offset:offset + length].decode("utf-8")))
+        return records
@@ -0,0 +1,84 @@
+import re
+
+# Sentence ends (., ! or ? followed by whitespace) and blank lines
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+WORD = re.compile(r"\S+")
+
+def count_tokens(text, tokenizer):
+    """Count tokens with the embedding model's tokenizer (whitespace words if None)"""
+    if tokenizer is None:
+        return len(text.split())
+    return len(tokenizer.tokenize(text))
+
+def _spans(pattern, text, start=0, end=None):
+    """Split text[start:end] on pattern into (start, end) spans of non-empty pieces"""
+    end = len(text) if end is None else end
+    position = start
+    for match in pattern.finditer(text, start, end):
+        if text[position:match.start()].strip():
+            yield position, match.start()
+        position = match.end()
+    if text[position:end].strip():
+        yield position, end
+
+def _units(text, tokenizer, max_tokens):
+    """Yield (start, end, tokens) sentence spans, splitting over-long sentences into word runs"""
+    for start, end in _spans(SENTENCE_BOUNDARY, text):
+        tokens = count_tokens(text[start:end], tokenizer)
+        if tokens <= max_tokens:
+            yield start, end, tokens
+            continue
+        run_start = run_end = None
+        run_tokens = 0
+        for match in WORD.finditer(text, start, end):
+            word_tokens = count_tokens(match.group(), tokenizer)
+            if run_start is not None and run_tokens + word_tokens > max_tokens:
+                yield run_start, run_end, run_tokens
+                run_start, run_tokens = None, 0
+            if run_start is None:
+                run_start = match.start()
+            run_end = match.end()
+            run_tokens += word_tokens
+        if run_start is not None:
+            yield run_start, run_end, run_tokens
+
+def chunk_text(text, tokenizer, chunk_tokens=200, overlap_tokens=40):
+    """Yield (start, end, tokens) chunks of whole sentences within a token budget.
+
+    Consecutive chunks share trailing sentences worth up to overlap_tokens.
+    """
+    window = []
+    window_tokens = 0
+    for unit in _units(text, tokenizer, chunk_tokens):
+        if window and window_tokens + unit[2] > chunk_tokens:
+            yield window[0][0], window[-1][1], window_tokens
+            # Carry trailing sentences over as overlap
+            carried = []
+            carried_tokens = 0
+            for previous in reversed(window):
+                if carried_tokens + previous[2] > overlap_tokens or carried_tokens + previous[2] + unit[2] > chunk_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[2]
+            window, window_tokens = carried, carried_tokens
+        window.append(unit)
+        window_tokens += unit[2]
+    if window:
+        yield window[0][0], window[-1][1], window_tokens
+
+def chunk_pages(pages, tokenizer, chunk_tokens=200, overlap_tokens=40):
+    """Lazily chunk an iterable of {"page", "text"} dicts; chunks never span pages.
+
+    Yields chunk dicts with "text", "page", character "start"/"end" offsets
+    within the page and a "tokens" count.
+    """
+    for page in pages:
+        text = page["text"]
+        for start, end, tokens in chunk_text(text, tokenizer, chunk_tokens, overlap_tokens):
+            yield {
+                "text": text[start:end],
+                "page": page.get("page"),
+                "start": start,
+                "end": end,
+                "tokens": tokens,
+            }
@@ -1,13 +1,136 @@
 import os
+import logging
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, auth, firestore, storage
-import faiss
 from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
 import google.generativeai as genai
+from index_store import IndexStore
+from vector_index import configure_search, ensure_direct_map
+from storage_upload import StorageUploader
+from chat_writer import ChatWriter
+from reranker import CrossEncoderReranker
+from scraping import Scraper
+from embedding_service import BatchingEmbeddingModel, RemoteEmbeddingModel
 
+# Directory holding the persisted FAISS index and its manifest
+INDEX_DIR = "index_data"
+EMBEDDING_DIM = 384
+
+# Index mode ("flat", "ivf" or "hnsw") and vector encoding ("float32", "fp16",
+# "sq8" or "pq" with PQ_SUBQUANTIZERS bytes per vector). New indexes are always
+# float32 flat (compressed encodings need vectors to train on); they are only
+# rebuilt in this mode and encoding once they hold ANN_PROMOTION_THRESHOLD
+# vectors. `python migrate_index.py --encoding` converts an index right away.
+INDEX_MODE = "flat"
+INDEX_ENCODING = "float32"
+PQ_SUBQUANTIZERS = 48
+ANN_PROMOTION_THRESHOLD = 50000
+IVF_NPROBE = 16
+HNSW_EF_SEARCH = 64
+
+# Render LLM answers token by token as they arrive
+STREAM_ANSWERS = True
+
+# Semantic answer cache: minimum cosine similarity for a hit, size and TTL (seconds)
+ANSWER_CACHE_THRESHOLD = 0.92
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL = 3600
+
+# Shared embedding service (Unix socket path or loopback "host:port", with the
+# shared secret in RAILGPT_EMBEDDING_AUTHKEY); when unset each process loads its own model
+EMBEDDING_SERVICE_ADDRESS = os.environ.get("RAILGPT_EMBEDDING_SERVICE")
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# OCR: concurrent requests (also the number of page images held in memory),
+# render resolution and on-disk cache of results keyed by page image hash
+OCR_MAX_CONCURRENCY = 4
+OCR_DPI = 200
+OCR_CACHE_DIR = "ocr_cache"
+
+# Chunk size and overlap in embedding-model tokens (MiniLM truncates at 256)
+CHUNK_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 40
+
+# Web scraping: concurrent fetches, per-host limit, (connect, read) timeout and retries
+SCRAPE_MAX_WORKERS = 8
+SCRAPE_PER_HOST = 2
+SCRAPE_TIMEOUT = (5, 20)
+SCRAPE_RETRIES = 3
+SCRAPE_MIN_INTERVAL = 0.2  # Seconds between requests to the same host
+SCRAPE_DEADLINE = 60  # Total seconds per URL, retries included
+
+# Site crawling: default link depth, page cap, and chunks embedded per batch
+CRAWL_MAX_DEPTH = 2
+CRAWL_MAX_PAGES = 500
+CRAWL_FLUSH_CHUNKS = 512
+
+# Background ingestion: worker threads, on-disk job queue (inside INDEX_DIR)
+# and how often the UI refreshes job status (seconds)
+INGEST_WORKERS = 2
+INGEST_QUEUE_FILENAME = "ingest_jobs.sqlite3"
+INGEST_POLL_SECONDS = 2
+
+# Chat persistence: records per Firestore batched write, seconds to wait for
+# a batch to fill, and commit retries before records are dropped
+CHAT_WRITE_BATCH_SIZE = 100
+CHAT_WRITE_FLUSH_INTERVAL = 0.5
+CHAT_WRITE_RETRIES = 5
+
+# Session sidebar: sessions per page, seconds a user's cached list stays fresh,
+# and chat messages loaded per page when opening a session
+SESSION_PAGE_SIZE = 20
+SESSION_CACHE_TTL = 300
+MESSAGE_PAGE_SIZE = 50
+
+# Seconds a user's role stays cached before it is read from Firestore again
+ROLE_CACHE_TTL = 600
+
+# Firebase Storage uploads: files uploaded in parallel, and files larger than
+# the threshold are sent as resumable uploads in chunks of this many bytes
+UPLOAD_MAX_WORKERS = 4
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+
+# Hybrid retrieval: run BM25 next to vector search and fuse the rankings with
+# reciprocal rank fusion (constant RRF_K) over this many candidates from each
+HYBRID_SEARCH = True
+RETRIEVAL_CANDIDATES = 50
+RRF_K = 60
+
+# Cross-encoder reranking of the top RERANK_CANDIDATES fused hits; when scoring
+# takes longer than RERANK_BUDGET seconds the retrieval order is used instead.
+# Off by default: on a CPU the cross-encoder competes with searches for cores
+RERANK = False
+RERANK_CANDIDATES = 50
+RERANK_BUDGET = 0.5
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Prompt context: chunks retrieved per question, the token budget they are
+# packed into, and the MMR trade-off (1.0 = pure relevance, lower = more diverse)
+CONTEXT_CANDIDATES = 12
+CONTEXT_TOKEN_BUDGET = 1500
+MMR_LAMBDA = 0.7
+
+# Deleted or replaced documents are tombstoned at once; the index is compacted
+# in the background once tombstoned vectors make up this fraction of it.
+# REPLACE_BY_FILENAME is the default of the upload form's option to replace
+# earlier uploads with the same file name (off: common names like "manual.pdf"
+# would otherwise tombstone unrelated documents).
+COMPACTION_THRESHOLD = 0.2
+REPLACE_BY_FILENAME = False
+# Compaction runs in the app process: OpenMP threads it may use and the pause
+# (seconds) between batches, so searches keep most of the CPU
+COMPACTION_THREADS = 1
+COMPACTION_PAUSE = 0.01
+
+# Number of chunks encoded per embedding model call during ingestion
+EMBEDDING_BATCH_SIZE = 64
+
+@st.cache_resource
 def setup_firebase():
-    """Initialize Firebase services"""
+    """Initialize Firebase services once per process"""
     cred = credentials.Certificate({
         "type": st.secrets["firebase"]["type"],
         "project_id": st.secrets["firebase"]["project_id"],
@@ -26,22 +149,94 @@ def setup_firebase():
             'storageBucket': st.secrets["firebase"]["storage_bucket"]
         })
     
-    return auth, firestore.client(), storage.bucket()
+    # Set FIRESTORE_EMULATOR_HOST to use the emulator, or RAILGPT_FAKE_FIRESTORE for an in-memory store
+    if os.environ.get("RAILGPT_FAKE_FIRESTORE"):
+        from fakes import FakeFirestoreClient
+        logging.warning("RAILGPT_FAKE_FIRESTORE is set: chat history is kept in memory only")
+        db = FakeFirestoreClient()
+    else:
+        db = firestore.client()
+    # RAILGPT_FAKE_STORAGE names a local directory that stands in for the bucket
+    fake_storage = os.environ.get("RAILGPT_FAKE_STORAGE")
+    if fake_storage:
+        from fakes import FakeBucket
+        logging.warning(f"RAILGPT_FAKE_STORAGE is set: uploads go to {fake_storage}, not Firebase Storage")
+        bucket = FakeBucket(directory=fake_storage)
+    else:
+        bucket = storage.bucket()
+    return auth, db, bucket
 
-def setup_models():
-    """Initialize ML models"""
-    # Initialize FAISS index
-    embedding_dim = 384
-    faiss_index = faiss.IndexFlatL2(embedding_dim)
-    
-    # Initialize Sentence Transformer
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    # Initialize Gemini
+@st.cache_resource
+def get_uploader(_bucket):
+    """Process-wide parallel, content-addressed uploader for the storage bucket"""
+    return StorageUploader(_bucket, UPLOAD_MAX_WORKERS, UPLOAD_CHUNK_SIZE, RESUMABLE_UPLOAD_THRESHOLD)
+
+@st.cache_resource
+def get_chat_writer(_db):
+    """Process-wide write-behind queue for chat records"""
+    return ChatWriter(_db, CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_FLUSH_INTERVAL, CHAT_WRITE_RETRIES)
+
+@st.cache_resource
+def load_embedding_model():
+    """Connect to the shared embedding service, or load a local micro-batched model"""
+    if EMBEDDING_SERVICE_ADDRESS:
+        return RemoteEmbeddingModel(EMBEDDING_SERVICE_ADDRESS)
+    return BatchingEmbeddingModel(SentenceTransformer(EMBEDDING_MODEL_NAME))
+
+@st.cache_resource
+def load_reranker():
+    """Load the cross-encoder reranker once per process; None when reranking is off"""
+    if not RERANK:
+        return None
+    if os.environ.get("RAILGPT_FAKE_RERANKER"):
+        from fakes import FakeCrossEncoder
+        logging.warning("RAILGPT_FAKE_RERANKER is set: reranking with word overlap")
+        return CrossEncoderReranker(FakeCrossEncoder(), RERANK_BUDGET)
+    from sentence_transformers import CrossEncoder
+    return CrossEncoderReranker(CrossEncoder(RERANKER_MODEL_NAME, max_length=256, device="cpu"), RERANK_BUDGET)
+
+@st.cache_resource
+def load_tokenizer():
+    """Load the embedding model's tokenizer for token-aware chunking"""
+    return AutoTokenizer.from_pretrained(f"sentence-transformers/{EMBEDDING_MODEL_NAME}")
+
+@st.cache_resource
+def get_scraper():
+    """Shared scraper so every session reuses the same connection pool"""
+    return Scraper(
+        SCRAPE_MAX_WORKERS, SCRAPE_PER_HOST, SCRAPE_TIMEOUT, SCRAPE_RETRIES, min_interval=SCRAPE_MIN_INTERVAL,
+        deadline=SCRAPE_DEADLINE
+    )
+
+@st.cache_resource
+def load_llm(model_name='gemini-pro'):
+    """Configure Gemini once per process (or a local stand-in for offline runs)"""
+    if os.environ.get("RAILGPT_FAKE_LLM"):
+        from fakes import FakeGenerativeModel
+        logging.warning("RAILGPT_FAKE_LLM is set: answers echo the prompt")
+        return FakeGenerativeModel()
     genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-    model = genai.GenerativeModel('gemini-pro')
-    
-    return faiss_index, embedding_model, model
+    return genai.GenerativeModel(model_name)
+
+@st.cache_resource(max_entries=1)
+def load_index_store(index_dir, version):
+    """Load the persisted FAISS index; cached per on-disk version.
+
+    Search settings and the IVF direct map are set up here, before the index
+    is shared, so query threads only ever read it.
+    """
+    index_store = IndexStore(index_dir, EMBEDDING_DIM).load()
+    configure_search(index_store.index, IVF_NPROBE, HNSW_EF_SEARCH)
+    ensure_direct_map(index_store.index)
+    return index_store
+
+def get_index_store(index_dir=INDEX_DIR):
+    """Return the shared index store, reloading it only when the saved version changes"""
+    return load_index_store(index_dir, IndexStore(index_dir).disk_version())
+
+def setup_models():
+    """Initialize ML models, reusing cached instances across reruns and sessions"""
+    return get_index_store(), load_embedding_model(), load_llm()
 
 def initialize_storage():
     """Initialize storage directories"""
@@ -0,0 +1,80 @@
+import logging
+import numpy as np
+from chunking import count_tokens
+
+SEPARATOR = "\n\n"
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def mmr_order(query_embedding, vectors, lambda_=0.7):
+    """Order candidates by maximal marginal relevance.
+
+    Each step picks the candidate maximizing
+    lambda_ * sim(query, c) - (1 - lambda_) * max sim(c, already picked),
+    so near-duplicates of a chosen chunk drop down the list.
+    """
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    relevance = vectors @ _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(-1))
+    similarity = vectors @ vectors.T
+    redundancy = np.full(len(vectors), -np.inf)
+    remaining = list(range(len(vectors)))
+    order = []
+    while remaining:
+        scores = lambda_ * relevance[remaining] - (1 - lambda_) * np.maximum(redundancy[remaining], 0)
+        best = remaining.pop(int(np.argmax(scores)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+def _trim_overlap(record, kept, min_fraction):
+    """Return record's text minus spans already in kept chunks of the same page, or None if little is left"""
+    start, end = record.get("start"), record.get("end")
+    if start is None or end is None:
+        return record["text"]
+    for other in kept:
+        if (other["file"], other.get("page")) != (record["file"], record.get("page")) or other.get("start") is None:
+            continue
+        if other["start"] <= start < other["end"]:
+            start = other["end"]
+        if other["start"] < end <= other["end"]:
+            end = other["start"]
+        if start >= end:
+            return None
+    if end - start < min_fraction * (record["end"] - record["start"]):
+        return None
+    return record["text"][start - record["start"]:end - record["start"]]
+
+def build_context(records, query_embedding, vectors, tokenizer, token_budget, lambda_=0.7, min_fraction=0.25):
+    """Pack retrieved chunks into at most token_budget tokens of prompt context.
+
+    records are in retrieval order; vectors holds their embeddings (None
+    keeps that order instead of applying MMR). Exact repeats are dropped and
+    chunks overlapping one already packed from the same page keep only their
+    new text. Returns (context, packed records, tokens used).
+    """
+    order = mmr_order(query_embedding, vectors, lambda_) if vectors is not None and len(records) > 1 else range(len(records))
+    separator_tokens = count_tokens(SEPARATOR, tokenizer)
+    seen_texts = set()
+    kept, texts = [], []
+    used = 0
+    for i in order:
+        record = records[i]
+        key = " ".join(record["text"].split())
+        if key in seen_texts:
+            continue
+        text = _trim_overlap(record, kept, min_fraction)
+        if not text:
+            continue
+        tokens = record["tokens"] if text == record["text"] and "tokens" in record else count_tokens(text, tokenizer)
+        cost = tokens + (separator_tokens if texts else 0)
+        if used + cost > token_budget:
+            # A shorter chunk further down may still fit
+            continue
+        seen_texts.add(key)
+        kept.append(record)
+        texts.append(text)
+        used += cost
+    logging.info(f"Context: {used}/{token_budget} tokens from {len(kept)} of {len(records)} retrieved chunks")
+    return SEPARATOR.join(texts), kept, used
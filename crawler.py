@@ -0,0 +1,119 @@
+import time
+import logging
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin, urlsplit, urldefrag
+from bs4 import BeautifulSoup
+
+# Links to these are documents or assets, not documentation pages
+SKIPPED_EXTENSIONS = (".pdf", ".zip", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".css", ".js", ".ico", ".xml")
+
+def extract_links(html, base_url):
+    """Return absolute http(s) links in an HTML page, without fragments"""
+    links = []
+    for anchor in BeautifulSoup(html, "html.parser").find_all("a", href=True):
+        url, _ = urldefrag(urljoin(base_url, anchor["href"]))
+        if urlsplit(url).scheme in ("http", "https"):
+            links.append(url)
+    return links
+
+def parse_sitemap(xml_text):
+    """Return (page_urls, nested_sitemap_urls) listed in a sitemap or sitemap index"""
+    root = ET.fromstring(xml_text)
+    locs = [element.text.strip() for element in root.iter()
+            if element.tag.rsplit("}", 1)[-1] == "loc" and element.text]
+    if root.tag.rsplit("}", 1)[-1] == "sitemapindex":
+        return [], locs
+    return locs, []
+
+class Crawler:
+    """Breadth-first, same-domain crawler built on a Scraper.
+
+    Each depth level is fetched concurrently. Pages seen before are requested
+    conditionally; for a 304 the links stored from the previous crawl are
+    followed instead, so a recrawl of an unchanged site downloads almost
+    nothing. get_previous(url) returns that stored state, or None.
+    """
+
+    def __init__(self, scraper, max_depth=2, max_pages=500):
+        self.scraper = scraper
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+
+    def sitemap_urls(self, sitemap_url, max_sitemaps=50):
+        """Collect page URLs from a sitemap, following sitemap indexes"""
+        pages, pending, seen = [], [sitemap_url], set()
+        while pending and len(seen) < max_sitemaps:
+            url = pending.pop(0)
+            if url in seen:
+                continue
+            seen.add(url)
+            result = self.scraper.fetch(url)
+            if result["error"] or not result["html"]:
+                continue
+            try:
+                found_pages, found_sitemaps = parse_sitemap(result["html"])
+            except ET.ParseError as e:
+                logging.error(f"Invalid sitemap {url}: {e}")
+                continue
+            pages.extend(found_pages)
+            pending.extend(found_sitemaps)
+        return pages
+
+    def crawl(self, seeds, get_previous=None, on_progress=None):
+        """Crawl from seed URLs, yielding fetch results with "depth" and "links" added.
+
+        on_progress receives a stats dict after every page.
+        """
+        get_previous = get_previous or (lambda url: None)
+        domains = {urlsplit(seed).netloc for seed in seeds}
+        seen = set()
+        level = []
+        for seed in seeds:
+            if seed not in seen:
+                seen.add(seed)
+                level.append(seed)
+
+        stats = {"fetched": 0, "downloaded": 0, "not_modified": 0, "errors": 0,
+                 "queued": len(level), "depth": 0, "pages_per_sec": 0.0}
+        start = time.perf_counter()
+        for depth in range(self.max_depth + 1):
+            if not level:
+                break
+            stats["depth"] = depth
+            validators = {}
+            for url in level:
+                previous = get_previous(url)
+                if previous:
+                    validators[url] = (previous.get("etag"), previous.get("last_modified"))
+
+            next_level = []
+            for result in self.scraper.fetch_all(level, validators):
+                stats["fetched"] += 1
+                stats["queued"] -= 1
+                if result["error"]:
+                    stats["errors"] += 1
+                    links = []
+                elif result["not_modified"]:
+                    stats["not_modified"] += 1
+                    links = (get_previous(result["url"]) or {}).get("links", [])
+                else:
+                    stats["downloaded"] += 1
+                    links = extract_links(result["html"], result["url"])
+                result["depth"] = depth
+                result["links"] = links
+
+                if depth < self.max_depth:
+                    for link in links:
+                        if (link not in seen and urlsplit(link).netloc in domains
+                                and not urlsplit(link).path.lower().endswith(SKIPPED_EXTENSIONS)
+                                and len(seen) < self.max_pages):
+                            seen.add(link)
+                            next_level.append(link)
+                            stats["queued"] += 1
+
+                elapsed = time.perf_counter() - start
+                stats["pages_per_sec"] = stats["fetched"] / elapsed if elapsed > 0 else 0.0
+                if on_progress:
+                    on_progress(dict(stats))
+                yield result
+            level = next_level
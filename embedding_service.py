@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import queue
+import socket
+import logging
+import tempfile
+import ipaddress
+import threading
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, deliver_challenge, answer_challenge
+import numpy as np
+
+# Connections unpickle whatever the peer sends, so both ends must share a
+# secret key; there is deliberately no built-in default
+AUTHKEY_ENV = "RAILGPT_EMBEDDING_AUTHKEY"
+MIN_AUTHKEY_LENGTH = 16
+
+def default_address():
+    """A Unix socket in the temp directory where supported, else loopback TCP"""
+    if sys.platform != "win32":
+        return os.path.join(tempfile.gettempdir(), f"railgpt-embeddings-{os.getuid()}.sock")
+    return "127.0.0.1:6100"
+
+def load_authkey(authkey=None):
+    """Return authkey, or the key in RAILGPT_EMBEDDING_AUTHKEY, as bytes; raises RuntimeError if none is set"""
+    key = os.environ.get(AUTHKEY_ENV, "") if authkey is None else authkey
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    if len(key) < MIN_AUTHKEY_LENGTH:
+        raise RuntimeError(
+            f"Set {AUTHKEY_ENV} to the same secret of at least {MIN_AUTHKEY_LENGTH} characters "
+            "for the embedding service and the apps"
+        )
+    return key
+
+def parse_address(address):
+    """Turn "host:port" into a (host, port) tuple; anything else is a Unix socket (or Windows pipe) path"""
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit() and "/" not in address and "\\" not in address:
+        return host, int(port)
+    return address
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+class MicroBatcher:
+    """Coalesces concurrent encode requests into micro-batches on one worker thread.
+
+    The worker takes the first waiting request, then keeps collecting requests
+    for up to max_wait seconds or until max_batch_size texts are gathered, and
+    encodes them all with a single model call.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=64, max_wait=0.005):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._texts = 0
+        self._largest_batch = 0
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, texts):
+        """Queue texts for encoding and return a Future of their embedding matrix"""
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts):
+        return self.submit(texts).result()
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                embeddings = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self._batches += 1
+                self._texts += len(texts)
+                self._largest_batch = max(self._largest_batch, len(texts))
+            start = 0
+            for request_texts, future in requests:
+                future.set_result(embeddings[start:start + len(request_texts)])
+                start += len(request_texts)
+
+    def stats(self):
+        """Return queue depth and batch-size statistics"""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "texts": self._texts,
+                "mean_batch_size": self._texts / self._batches if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+            }
+
+class BatchingEmbeddingModel:
+    """In-process model wrapper that routes encode() through a MicroBatcher"""
+
+    def __init__(self, model, max_batch_size=64, max_wait=0.005):
+        self.model = model
+        self.batcher = MicroBatcher(
+            lambda texts: model.encode(texts, batch_size=max_batch_size, show_progress_bar=False),
+            max_batch_size,
+            max_wait,
+        )
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    def encode(self, sentences, batch_size=None, **kwargs):
+        if isinstance(sentences, str):
+            return self.batcher.encode([sentences])[0]
+        return self.batcher.encode(sentences)
+
+    def stats(self):
+        return self.batcher.stats()
+
+class RemoteEmbeddingModel:
+    """Client for an EmbeddingServer with the same encode() interface as SentenceTransformer"""
+
+    def __init__(self, address, authkey=None):
+        self.address = parse_address(address)
+        self.authkey = load_authkey(authkey)
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = Client(self.address, authkey=self.authkey)
+        return self._local.connection
+
+    def _call(self, message):
+        connection = self._connection()
+        try:
+            connection.send(message)
+            status, payload = connection.recv()
+        except (EOFError, OSError):
+            self._local.connection = None
+            raise
+        if status == "error":
+            raise RuntimeError(f"Embedding service error: {payload}")
+        return payload
+
+    def encode(self, sentences, batch_size=None, **kwargs):
+        if isinstance(sentences, str):
+            return self._call(("encode", [sentences]))[0]
+        return self._call(("encode", list(sentences)))
+
+    def stats(self):
+        return self._call(("stats", None))
+
+class EmbeddingServer:
+    """Serves one embedding model to several app processes over a local socket.
+
+    Clients must authenticate with the shared key (RAILGPT_EMBEDDING_AUTHKEY),
+    and the server refuses to start without one. Unix sockets are created
+    accessible to their owner only; TCP addresses should stay on loopback.
+    """
+
+    def __init__(self, model, address=None, authkey=None, max_batch_size=64, max_wait=0.005):
+        authkey = load_authkey(authkey)
+        address = parse_address(address or default_address())
+        if isinstance(address, tuple) and not is_loopback(address[0]):
+            logging.warning(f"Embedding service bound to non-loopback {address[0]}; anyone holding the key can connect")
+        unix_socket = isinstance(address, str) and not address.startswith("\\\\")
+        if unix_socket and os.path.exists(address):
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(address)
+                raise RuntimeError(f"An embedding service is already listening on {address}")
+            except OSError:
+                # Left behind by a server that did not shut down cleanly
+                os.unlink(address)
+            finally:
+                probe.close()
+        self.model = BatchingEmbeddingModel(model, max_batch_size, max_wait)
+        self.authkey = authkey
+        # Only the owner may connect to the socket file
+        umask = os.umask(0o177) if unix_socket else None
+        try:
+            # Clients are authenticated on their own thread (see _serve), so a
+            # stalled handshake cannot block accept()
+            self.listener = Listener(address, backlog=64)
+        finally:
+            if umask is not None:
+                os.umask(umask)
+
+    def _serve(self, connection):
+        with connection:
+            try:
+                deliver_challenge(connection, self.authkey)
+                answer_challenge(connection, self.authkey)
+            except (AuthenticationError, EOFError, OSError) as e:
+                logging.warning(f"Rejected embedding service client: {e}")
+                return
+            while True:
+                try:
+                    command, payload = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if command == "encode":
+                        connection.send(("ok", self.model.encode(payload)))
+                    elif command == "stats":
+                        connection.send(("ok", self.model.stats()))
+                    else:
+                        connection.send(("error", f"unknown command {command!r}"))
+                except Exception as e:
+                    connection.send(("error", str(e)))
+
+    def serve_forever(self):
+        logging.info(f"Embedding service listening on {self.listener.address}")
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError as e:
+                logging.warning(f"Embedding service accept failed: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+
+    logging.basicConfig(level=logging.INFO)
+    address = sys.argv[1] if len(sys.argv) > 1 else default_address()
+    try:
+        load_authkey()
+    except RuntimeError as e:
+        sys.exit(str(e))
+    EmbeddingServer(SentenceTransformer("all-MiniLM-L6-v2"), address).serve_forever()
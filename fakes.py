@@ -0,0 +1,344 @@
+import io
+import os
+import time
+import uuid
+import hashlib
+import datetime
+import threading
+
+class FakeResponse:
+    """Minimal stand-in for a Gemini response or stream chunk"""
+
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel that echoes the prompt.
+
+    With stream=True it yields the answer word by word, sleeping delay seconds
+    between chunks, like a streamed Gemini response.
+    """
+
+    def __init__(self, answer=None, delay=0.05):
+        self.answer = answer
+        self.delay = delay
+
+    def _answer(self, prompt):
+        return self.answer if self.answer is not None else f"Echo: {prompt}"
+
+    def _stream(self, text):
+        for word in text.split(" "):
+            time.sleep(self.delay)
+            yield FakeResponse(word + " ")
+
+    def generate_content(self, prompt, stream=False):
+        text = self._answer(prompt)
+        if stream:
+            return self._stream(text)
+        return FakeResponse(text)
+
+class FakeOcrClient:
+    """Offline stand-in for an OCR client; returns a label derived from the image bytes"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    def detect_text(self, image_bytes):
+        self.calls += 1
+        time.sleep(self.delay)
+        return f"OCR text for image {hashlib.sha256(image_bytes).hexdigest()[:12]}"
+
+class FakeCrossEncoder:
+    """Offline stand-in for a sentence-transformers CrossEncoder; scores pairs by shared words"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.calls += 1
+        time.sleep(self.delay)
+        scores = []
+        for query, text in pairs:
+            query_words = set(query.lower().split())
+            scores.append(len(query_words & set(text.lower().split())) / (len(query_words) or 1))
+        return scores
+
+class FakeDocumentSnapshot:
+    """Stand-in for a Firestore DocumentSnapshot"""
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data[field]
+
+class FakeDocumentReference:
+    """Stand-in for a Firestore DocumentReference"""
+
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, self.path + (name,))
+
+    def set(self, data, merge=False):
+        with self._client._lock:
+            existing = self._client._documents.get(self.path) if merge else None
+            self._client._documents[self.path] = {**(existing or {}), **data}
+
+    def get(self):
+        with self._client._lock:
+            return FakeDocumentSnapshot(self, self._client._documents.get(self.path))
+
+# Firestore where() operators; documents without the field never match
+_MISSING = object()
+_OPERATORS = {
+    "==": lambda value, operand: value == operand,
+    "!=": lambda value, operand: value != operand,
+    "<": lambda value, operand: value < operand,
+    "<=": lambda value, operand: value <= operand,
+    ">": lambda value, operand: value > operand,
+    ">=": lambda value, operand: value >= operand,
+    "in": lambda value, operand: value in operand,
+    "not-in": lambda value, operand: value not in operand,
+    "array-contains": lambda value, operand: isinstance(value, list) and operand in value,
+    "array-contains-any": lambda value, operand: isinstance(value, list) and any(item in value for item in operand),
+}
+
+def _matches(data, field, op, operand):
+    value = data.get(field, _MISSING)
+    if value is _MISSING:
+        return False
+    try:
+        return _OPERATORS[op](value, operand)
+    except TypeError:
+        # Firestore only compares values of the same type
+        return False
+
+class FakeQuery:
+    """Stand-in for a Firestore query: where, order_by, limit and start_after"""
+
+    def __init__(self, client, path, filters=(), orders=(), limit_count=None, cursor=None):
+        self._client = client
+        self.path = path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        fields = {"filters": self._filters, "orders": self._orders, "limit_count": self._limit, "cursor": self._cursor}
+        fields.update(changes)
+        return FakeQuery(self._client, self.path, **fields)
+
+    def where(self, field, op, value):
+        if op not in _OPERATORS:
+            raise ValueError(f"Unsupported where() operator {op!r}; expected one of {', '.join(_OPERATORS)}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, snapshot):
+        return self._copy(cursor=snapshot)
+
+    def stream(self):
+        self._client.reads += 1
+        with self._client._lock:
+            items = [
+                (path, data) for path, data in self._client._documents.items()
+                if path[:-1] == self.path and all(_matches(data, *condition) for condition in self._filters)
+            ]
+        snapshots = [FakeDocumentSnapshot(FakeDocumentReference(self._client, path), data) for path, data in items]
+        # Stable sorts applied last-to-first give a multi-field order
+        for field, direction in reversed(self._orders):
+            snapshots.sort(key=lambda snapshot: snapshot.get(field), reverse=direction == "DESCENDING")
+        if self._cursor is not None:
+            ids = [snapshot.id for snapshot in snapshots]
+            if self._cursor.id in ids:
+                snapshots = snapshots[ids.index(self._cursor.id) + 1:]
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        return iter(snapshots)
+
+    def get(self):
+        return list(self.stream())
+
+class FakeCollectionReference(FakeQuery):
+    """Stand-in for a Firestore CollectionReference"""
+
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, self.path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data):
+        self._client.writes += 1
+        time.sleep(self._client.latency)
+        reference = self.document()
+        reference.set(data)
+        return datetime.datetime.now(), reference
+
+class FakeWriteBatch:
+    """Stand-in for a Firestore WriteBatch; commits all writes or none"""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data):
+        self._writes.append((reference, data))
+
+    def commit(self):
+        time.sleep(self._client.latency)
+        with self._client._lock:
+            if self._client.fail_commits:
+                self._client.fail_commits -= 1
+                raise Exception("Simulated Firestore outage")
+            self._client.commits += 1
+            self._client.writes += len(self._writes)
+        for reference, data in self._writes:
+            reference.set(data)
+
+class FakeFirestoreClient:
+    """In-memory stand-in for firestore.Client for offline runs.
+
+    latency simulates the round trip of each write call and fail_commits
+    makes that many batch commits fail, for exercising retries. Counters
+    record reads, writes and committed batches.
+    """
+
+    def __init__(self, latency=0.0, fail_commits=0):
+        self.latency = latency
+        self.fail_commits = fail_commits
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollectionReference(self, (name,))
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+class FakeBlob:
+    """Stand-in for a google.cloud.storage Blob backed by a FakeBucket"""
+
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.metadata = None
+
+    @property
+    def public_url(self):
+        return f"https://storage.example.invalid/{self.bucket.name}/{self.name}"
+
+    def exists(self):
+        self.bucket.exists_calls += 1
+        time.sleep(self.bucket.latency)
+        return self.bucket._read(self.name) is not None
+
+    def upload_from_file(self, file_obj, rewind=False, size=None, content_type=None):
+        if rewind:
+            file_obj.seek(0)
+        data = file_obj.read() if size is None else file_obj.read(size)
+        # One round trip per resumable chunk, or one for a simple upload
+        requests = -(-len(data) // self.chunk_size) if self.chunk_size else 1
+        time.sleep(self.bucket.latency * max(1, requests))
+        self.bucket._write(self.name, data, self.metadata)
+        with self.bucket._lock:
+            self.bucket.uploads += 1
+            self.bucket.upload_requests += max(1, requests)
+
+    def upload_from_filename(self, filename, content_type=None):
+        with open(filename, "rb") as f:
+            self.upload_from_file(f, content_type=content_type)
+
+    def upload_from_string(self, data, content_type=None):
+        self.upload_from_file(io.BytesIO(data.encode("utf-8") if isinstance(data, str) else data))
+
+    def download_as_bytes(self):
+        return self.bucket._read(self.name)
+
+    def download_to_filename(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.bucket._read(self.name))
+
+    def make_public(self):
+        time.sleep(self.bucket.latency)
+        with self.bucket._lock:
+            self.bucket.public.add(self.name)
+
+class FakeBucket:
+    """In-memory (or local directory) stand-in for a storage bucket.
+
+    With a directory, blobs are written there as files so uploads can be
+    inspected. latency simulates each request's round trip; counters record
+    uploads, upload requests and existence checks, and public holds the
+    names of blobs made public.
+    """
+
+    def __init__(self, name="fake-bucket", directory=None, latency=0.0):
+        self.name = name
+        self.directory = directory
+        self.latency = latency
+        self.uploads = 0
+        self.upload_requests = 0
+        self.exists_calls = 0
+        self.public = set()
+        self._blobs = {}
+        self._metadata = {}
+        self._lock = threading.Lock()
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name, chunk_size)
+
+    def _write(self, name, data, metadata):
+        with self._lock:
+            self._metadata[name] = metadata
+            if self.directory is None:
+                self._blobs[name] = data
+                return
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _read(self, name):
+        if self.directory is None:
+            with self._lock:
+                return self._blobs.get(name)
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def list_blobs(self, prefix=""):
+        if self.directory is None:
+            with self._lock:
+                names = list(self._blobs)
+        else:
+            names = [
+                os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, "/")
+                for root, _, filenames in os.walk(self.directory) for filename in filenames
+            ]
+        return [self.blob(name) for name in sorted(names) if name.startswith(prefix)]
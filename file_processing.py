@@ -1,79 +1,100 @@
-import os
 import streamlit as st
-import PyPDF2
-import requests
 from bs4 import BeautifulSoup
+import logging
 import numpy as np
-from datetime import datetime
+import faiss
+from config import EMBEDDING_BATCH_SIZE, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, REPLACE_BY_FILENAME
+from pdf_extraction import iter_pdf_pages, new_timings, format_timings
+from chunking import chunk_pages
+from ingest_manifest import content_hash, url_key
 
-def process_pdf(file_path, embedding_model):
-    """Extract and process text from PDF"""
+def process_pdf(file_path, tokenizer):
+    """Extract a PDF page by page and lazily yield token-aware chunks with page metadata"""
+    timings = new_timings()
     try:
-        text_chunks = []
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                # Split text into chunks (adjust chunk size as needed)
-                chunks = [text[i:i+512] for i in range(0, len(text), 512)]
-                text_chunks.extend(chunks)
-        return text_chunks
+        yield from chunk_pages(
+            iter_pdf_pages(file_path, timings=timings), tokenizer, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+        )
     except Exception as e:
         st.error(f"Error processing PDF: {e}")
-        return []
+    logging.info(f"Extracted {file_path}: {format_timings(timings)}")
 
-def process_url(url):
-    """Scrape and process text from URL"""
-    try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        text = soup.get_text()
-        # Split into chunks
-        chunks = [text[i:i+512] for i in range(0, len(text), 512)]
-        return chunks
-    except Exception as e:
-        st.error(f"Error processing URL: {e}")
-        return []
+def html_to_text(html):
+    """Return the visible text of an HTML page"""
+    soup = BeautifulSoup(html, 'html.parser')
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return soup.get_text()
 
-def process_uploaded_files(uploaded_files, upload_dir, faiss_index, embedding_model, bucket):
-    """Process uploaded PDF files"""
-    for uploaded_file in uploaded_files:
-        try:
-            # Save file locally
-            file_path = os.path.join(upload_dir, uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+def chunk_web_text(text, tokenizer):
+    """Lazily yield token-aware chunks of a scraped page"""
+    return chunk_pages([{"page": None, "text": text}], tokenizer, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
 
-            # Upload to Firebase Storage
-            blob = bucket.blob(f"pdfs/{uploaded_file.name}")
-            blob.upload_from_filename(file_path)
+def embed_chunks(chunks, embedding_model, batch_size=EMBEDDING_BATCH_SIZE):
+    """Encode text chunks in batches into a normalized float32 matrix"""
+    batches = []
+    for i in range(0, len(chunks), batch_size):
+        batch = embedding_model.encode(chunks[i:i + batch_size], batch_size=batch_size)
+        batches.append(np.asarray(batch, dtype=np.float32))
+    embeddings = np.ascontiguousarray(np.vstack(batches))
+    faiss.normalize_L2(embeddings)
+    return embeddings
 
-            # Process text
-            text_chunks = process_pdf(file_path, embedding_model)
-            
-            # Create embeddings and add to FAISS index
-            for chunk in text_chunks:
-                embedding = embedding_model.encode([chunk])[0]
-                faiss_index.add(np.array([embedding]))
+def record_documents(index_store, documents, chunks, ids, replace_by_name=REPLACE_BY_FILENAME):
+    """Record each ingested document in the manifest with the ids of its chunks.
 
-            st.success(f"Successfully processed {uploaded_file.name}")
-            
-            # Clean up local file
-            os.remove(file_path)
-            
-        except Exception as e:
-            st.error(f"Error processing {uploaded_file.name}: {e}")
+    The version a document replaces is tombstoned: the previous content of
+    a changed web page and, when the document's "replace_by_name" (default
+    replace_by_name) is set, earlier uploads of a PDF with the same file name.
+    """
+    manifest = index_store.manifest
+    ids_by_doc = {}
+    for chunk, chunk_id in zip(chunks, ids):
+        ids_by_doc.setdefault(chunk["doc_key"], []).append(chunk_id)
+    for document in documents:
+        replaced = [document["key"]] if document["key"] in manifest else []
+        if document.get("replace_by_name", replace_by_name) and document["fields"].get("source_type") == "pdf":
+            replaced.extend(
+                key for key, entry in manifest.documents.items()
+                if key != document["key"] and entry.get("source_type") == "pdf" and entry["name"] == document["name"]
+            )
+        if replaced:
+            deleted = index_store.delete_documents(replaced)
+            logging.info(f"{document['name']} replaces {len(replaced)} earlier versions ({deleted} chunks tombstoned)")
+        manifest.record(
+            document["key"], document["name"], ids_by_doc.get(document["key"], []), **document["fields"]
+        )
 
-def process_url_input(url, upload_dir, faiss_index, embedding_model):
-    """Process input URL"""
-    try:
-        text_chunks = process_url(url)
-        for chunk in text_chunks:
-            embedding = embedding_model.encode([chunk])[0]
-            faiss_index.add(np.array([embedding]))
-        st.success(f"Successfully processed URL: {url}")
-    except Exception as e:
-        st.error(f"Error processing URL: {e}")
+def collect_page_chunks(result, manifest, tokenizer):
+    """Chunk a fetched web page if its content changed since it was indexed.
+
+    Returns the chunks and the document entry, or ([], None) when the page
+    failed or was not modified. A page with the same content hash as before
+    comes back without chunks as an "unchanged" document, whose fresh
+    validators the publisher records. manifest is only read.
+    """
+    url = result["url"]
+    if result["error"]:
+        st.error(f"Error processing URL {url}: {result['error']}")
+        return [], None
+    if result["not_modified"]:
+        logging.info(f"Skipping {url}: not modified")
+        return [], None
+
+    key = url_key(url)
+    fields = {
+        "etag": result["headers"].get("ETag"),
+        "last_modified": result["headers"].get("Last-Modified"),
+    }
+    if "links" in result:
+        fields["links"] = result["links"]
+    text = html_to_text(result["html"])
+    sha256 = content_hash(text)
+    document = {"key": key, "name": url, "fields": {"source_type": "url", "sha256": sha256, **fields}}
+    if manifest.is_current(key, sha256):
+        logging.info(f"Skipping {url}: content unchanged")
+        return [], dict(document, unchanged=True)
+
+    chunks = [dict(chunk, file=url, doc_key=key) for chunk in chunk_web_text(text, tokenizer)]
+    return chunks, document
@@ -6,22 +6,28 @@ st.set_page_config(page_title="RaiLChatbot", layout="wide")
 # Now you can proceed with the rest of your code
 import google.generativeai as genai
 import fitz  # PyMuPDF
-import pdfplumber
 import faiss
 import os
 import pickle
 import datetime
-import io
 import logging
-import requests
 import json
-from sentence_transformers import SentenceTransformer
-from bs4 import BeautifulSoup
 from google.cloud import vision, storage
 from google.oauth2 import service_account
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
-from pdf2image import convert_from_path
+from index_store import IndexStore
+from file_processing import embed_chunks, html_to_text
+from pdf_extraction import iter_pdf_pages, new_timings, format_timings
+from ingest_manifest import content_hash
+from ocr import OcrPipeline, GoogleVisionOcrClient
+from chat import generate_answer, retrieve_context, retrieval_caption, source_filter_controls
+from ingest_jobs import IngestJobHandler, start_ingest_workers, enqueue_ingest, show_ingest_jobs, manage_documents
+from config import load_embedding_model, get_index_store
+from config import OCR_MAX_CONCURRENCY, OCR_DPI, OCR_CACHE_DIR
+from config import load_tokenizer, get_scraper, get_chat_writer, get_uploader, REPLACE_BY_FILENAME
+from config import SESSION_PAGE_SIZE, SESSION_CACHE_TTL, MESSAGE_PAGE_SIZE
+from session_cache import SessionListCache, fetch_page
 
 # Check if FIREBASE_CREDENTIALS exists
 if "FIREBASE_CREDENTIALS" not in st.secrets:
@@ -35,27 +41,24 @@ except Exception as e:
     st.error("Failed to parse Firebase credentials. Please check your secrets.toml file.")
     st.stop()
 
-# Initialize Firebase
-if not firebase_admin._apps:
-    try:
+STORAGE_BUCKET_NAME = "railchatbot-cb553.appspot.com"
+
+# Clients are cached so reruns and other sessions reuse them
+@st.cache_resource
+def init_firebase():
+    """Initialize Firebase, Firebase Storage and Firestore once per process."""
+    if not firebase_admin._apps:
         cred = credentials.Certificate(firebase_creds)
         firebase_admin.initialize_app(cred)
-    except Exception as e:
-        st.error("Failed to initialize Firebase. Please check your Firebase credentials.")
-        st.stop()
+    storage_client = storage.Client.from_service_account_info(firebase_creds)
+    return storage_client.bucket(STORAGE_BUCKET_NAME), firestore.client()
 
-# Initialize Firebase Storage
-STORAGE_BUCKET_NAME = "railchatbot-cb553.appspot.com"
 try:
-    storage_client = storage.Client.from_service_account_info(firebase_creds)
-    bucket = storage_client.bucket(STORAGE_BUCKET_NAME)
+    bucket, db = init_firebase()
 except Exception as e:
-    st.error("Failed to initialize Firebase Storage. Please check your Firebase credentials.")
+    st.error("Failed to initialize Firebase. Please check your Firebase credentials.")
     st.stop()
 
-# Initialize Firestore
-db = firestore.client()
-
 # -------------------- Gemini AI Setup --------------------
 try:
     GENAI_API_KEY = st.secrets["gemini_api_key"]
@@ -64,29 +67,55 @@ except KeyError:
     st.stop()
 
 GENAI_MODEL = "gemini-2.0-flash"
-genai.configure(api_key=GENAI_API_KEY)
-model = genai.GenerativeModel(GENAI_MODEL)
+
+@st.cache_resource
+def init_gemini(api_key, model_name):
+    """Configure Gemini once per process."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+model = init_gemini(GENAI_API_KEY, GENAI_MODEL)
 
 # -------------------- Streamlit UI --------------------
 st.title("📜 RaiLChatBot 🤖")
 st.markdown("💬 **Ask me anything about the uploaded files or websites:**")
 
 # -------------------- Sentence Transformer for Embeddings --------------------
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+embedding_model = load_embedding_model()
 
 # -------------------- File Storage & FAISS Index --------------------
 UPLOAD_DIR = "uploaded_files"
-INDEX_FILE = "faiss_index.bin"
-METADATA_FILE = "metadata.pkl"
+INDEX_DIR = "index_data"
+INDEX_FILE = "faiss_index.bin"  # Legacy location, imported once into INDEX_DIR
+METADATA_FILE = "metadata.pkl"  # Legacy metadata, imported once into the chunk store
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-if os.path.exists(INDEX_FILE) and os.path.exists(METADATA_FILE):
-    faiss_index = faiss.read_index(INDEX_FILE)
-    with open(METADATA_FILE, "rb") as f:
-        pdf_metadata = pickle.load(f)
-else:
-    faiss_index = faiss.IndexFlatL2(384)  
-    pdf_metadata = {}
+@st.cache_resource
+def import_legacy_index():
+    """Import a legacy faiss_index.bin / metadata.pkl into the index store once."""
+    index_store = IndexStore(INDEX_DIR, 384)
+    if index_store.disk_version() != 0 or not os.path.exists(INDEX_FILE):
+        return True
+    with index_store.writing():
+        if index_store.version != 0:
+            return True
+        # Legacy vectors were stored unnormalized; normalize them like new embeddings
+        legacy_index = faiss.read_index(INDEX_FILE)
+        legacy_vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+        faiss.normalize_L2(legacy_vectors)
+        records = [{"text": "", "file": "legacy"}] * len(legacy_vectors)
+        if os.path.exists(METADATA_FILE):
+            with open(METADATA_FILE, "rb") as f:
+                legacy_metadata = pickle.load(f)
+            records = [legacy_metadata[i] for i in sorted(legacy_metadata)]
+        index_store.add(legacy_vectors, records)
+        index_store.save()
+    return True
+
+import_legacy_index()
+
+# Shared across reruns and sessions; reloaded only when the saved index version changes
+index_store = get_index_store(INDEX_DIR)
 
 # -------------------- Streamlit UI --------------------
 st.set_page_config(page_title="RaiLChatbot", layout="wide")
@@ -202,6 +231,15 @@ if st.session_state.user and st.sidebar.button("Logout"):
     st.sidebar.success("Logged out successfully.")
 
 # -------------------- Session Management --------------------
+@st.cache_resource
+def get_session_cache():
+    """Per-user cache of session lists, shared by all sessions of this process."""
+    return SessionListCache(SESSION_PAGE_SIZE, SESSION_CACHE_TTL)
+
+def user_sessions():
+    """Firestore collection holding the logged-in user's sessions."""
+    return db.collection("sessions").document(st.session_state.user.uid).collection("user_sessions")
+
 def create_session(title):
     """Create a new session and store it in Firestore."""
     if st.session_state.user:
@@ -210,15 +248,30 @@ def create_session(title):
             "time": datetime.datetime.now().strftime("%H:%M:%S"),
             "timestamp": firestore.SERVER_TIMESTAMP,
         }
-        db.collection("sessions").document(st.session_state.user.uid).collection("user_sessions").add(session_data)
+        _, session_ref = user_sessions().add(session_data)
+        get_session_cache().add(st.session_state.user.uid, session_ref.id, session_data)
+
+def session_messages(session_id):
+    """Firestore collection holding a session's chat messages."""
+    return db.collection("chats").document(st.session_state.user.uid).collection("session_chats").document(session_id).collection("messages")
+
+def save_chat_entry(session_id, chat_entry):
+    """Queue a chat message for a batched background write."""
+    get_chat_writer(db).add(session_messages(session_id), {**chat_entry, "timestamp": firestore.SERVER_TIMESTAMP})
+
+def get_session_chats(session_id, cursor=None):
+    """Retrieve one page of a session's chat history, newest page first.
 
-def get_session_chats(session_id):
-    """Retrieve chat history for a specific session."""
+    Returns the page's chats in chronological order, the cursor for the
+    next (older) page and whether there is one.
+    """
     if st.session_state.user:
-        chats_ref = db.collection("chats").document(st.session_state.user.uid).collection("session_chats").document(session_id).collection("messages")
-        chats = chats_ref.order_by("timestamp").stream()
-        return [chat.to_dict() for chat in chats]
-    return []
+        # Messages are written in the background; make sure this session's are stored
+        get_chat_writer(db).flush(timeout=5)
+        query = session_messages(session_id).order_by("timestamp", direction=firestore.Query.DESCENDING)
+        chats, cursor, has_more = fetch_page(query, MESSAGE_PAGE_SIZE, cursor)
+        return [chat.to_dict() for chat in reversed(chats)], cursor, has_more
+    return [], cursor, False
 
 # -------------------- PDF Processing Functions --------------------
 def is_valid_pdf(file_path):
@@ -230,155 +283,122 @@ def is_valid_pdf(file_path):
         logging.error(f"Invalid PDF: {e}")
         return False
 
-def extract_text_with_pdfplumber(file_path):
-    """Extract text using pdfplumber."""
-    try:
-        text = ""
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ""  # Handle None returns
-        return text.strip()
-    except Exception as e:
-        logging.error(f"pdfplumber failed to extract text: {e}")
-        return None
+def get_vision_client():
+    """Create a Google Cloud Vision client."""
+    # Set up Google Cloud Vision credentials
+    if "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ:
+        credentials_path = "C:\\Users\\sanja\\.streamlit\\GoogleVisionAPI(OCR)\\credentials.json"
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
+
+    credentials = service_account.Credentials.from_service_account_file(
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
+    )
+    return vision.ImageAnnotatorClient(credentials=credentials)
+
+@st.cache_resource
+def get_ocr_pipeline():
+    """Shared OCR pipeline (Google Cloud Vision, or a local stand-in for offline runs)."""
+    if os.environ.get("RAILGPT_FAKE_OCR"):
+        from fakes import FakeOcrClient
+        logging.warning("RAILGPT_FAKE_OCR is set: scanned pages get placeholder text")
+        client = FakeOcrClient()
+    else:
+        client = GoogleVisionOcrClient(get_vision_client())
+    return OcrPipeline(client, OCR_MAX_CONCURRENCY, OCR_DPI, OCR_CACHE_DIR)
 
-def extract_text_with_pymupdf(file_path):
-    """Extract text using PyMuPDF."""
+def ocr_pdf_pages(file_path, page_numbers):
+    """OCR the given 1-based PDF pages, returning {page: text}."""
     try:
-        text = ""
-        with fitz.open(file_path) as pdf:
-            for page in pdf:
-                text += page.get_text() or ""  # Handle None returns
-        return text.strip()
+        return get_ocr_pipeline().ocr_pages(file_path, page_numbers)
     except Exception as e:
-        logging.error(f"PyMuPDF failed to extract text: {e}")
-        return None
+        logging.error(f"Google Cloud Vision failed to extract text: {e}")
+        return {}
 
 def extract_text_with_google_vision(file_path):
-    """Extract text from image-based PDF using Google Cloud Vision API."""
+    """Extract text from an image file using Google Cloud Vision API."""
     try:
-        # Set up Google Cloud Vision credentials
-        if "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ:
-            credentials_path = "C:\\Users\\sanja\\.streamlit\\GoogleVisionAPI(OCR)\\credentials.json"
-            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-
-        credentials = service_account.Credentials.from_service_account_file(
-            os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
-        )
-        client = vision.ImageAnnotatorClient(credentials=credentials)
-
-        text = ""
-
-        # Convert PDF to images
-        images = convert_from_path(file_path)
-
-        for i, image in enumerate(images):
-            # Save the image temporarily
-            image_path = f"temp_page_{i + 1}.jpg"
-            image.save(image_path, "JPEG")
-
-            # Read the image
-            with io.open(image_path, "rb") as image_file:
-                content = image_file.read()
-
-            # Perform OCR using Google Cloud Vision
-            image = vision.Image(content=content)
-            response = client.text_detection(image=image)
-
-            if response.error.message:
-                raise Exception(f"Google Cloud Vision Error: {response.error.message}")
-
-            if response.text_annotations:
-                text += response.text_annotations[0].description + "\n"
-
-            # Clean up temporary image file
-            os.remove(image_path)
-
-        return text.strip()
+        with open(file_path, "rb") as f:
+            return get_ocr_pipeline().ocr_image(f.read()).strip()
     except Exception as e:
         logging.error(f"Google Cloud Vision failed to extract text: {e}")
         return None
 
-def extract_text(file_path):
-    """Extract text using the appropriate method based on file type."""
+def extract_pages(file_path):
+    """Lazily extract text page by page using the appropriate method based on file type."""
     if is_valid_pdf(file_path):
-        # Try pdfplumber first
-        text = extract_text_with_pdfplumber(file_path)
-        if not text:  # Fallback to PyMuPDF
-            text = extract_text_with_pymupdf(file_path)
-        if not text:  # Fallback to Google Cloud Vision (OCR)
-            text = extract_text_with_google_vision(file_path)
+        # PyMuPDF per page in parallel, pdfplumber and OCR only for pages that need them
+        timings = new_timings()
+        yield from iter_pdf_pages(file_path, ocr_pages=ocr_pdf_pages, timings=timings)
+        logging.info(f"Extracted {file_path}: {format_timings(timings)}")
     else:
         # Treat as an image and use OCR
-        text = extract_text_with_google_vision(file_path)
-    return text
-
-# -------------------- Firebase Storage Upload --------------------
-def upload_to_firebase(file_path, filename):
-    """Uploads file to Firebase Storage and returns the public URL."""
-    try:
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"🚨 File not found: {file_path}")
-
-        blob = bucket.blob(f"documents/{filename}")
-        blob.upload_from_filename(file_path)
-
-        if not blob.exists():
-            raise Exception("🚨 Upload failed! Blob does not exist in Firebase.")
+        yield {"page": 1, "text": extract_text_with_google_vision(file_path) or ""}
 
-        blob.make_public()
-        file_url = blob.public_url
-        st.sidebar.success(f"✅ File uploaded: {file_url}")
-        return file_url
-    except Exception as e:
-        st.sidebar.error(f"❌ Upload failed: {e}")
-        return None
+# -------------------- Background Ingestion --------------------
+FIRSTAPP_INGEST_JOB = "firstapp_ingest"
 
-def download_from_firebase(filename, destination_path):
-    """Download a file from Firebase Storage."""
-    try:
-        blob = bucket.blob(f"documents/{filename}")
-        blob.download_to_filename(destination_path)
-        st.sidebar.success(f"✅ File downloaded from Firebase: {filename}")
-        return True
-    except Exception as e:
-        st.sidebar.error(f"❌ Failed to download file from Firebase: {e}")
-        return False
+@st.cache_resource
+def get_ingest_workers():
+    """Background workers that extract (with OCR), embed and index uploaded files."""
+    handler = IngestJobHandler(
+        INDEX_DIR, embedding_model, load_tokenizer(), get_scraper(),
+        extract_pages=extract_pages, uploader=get_uploader(bucket), upload_prefix="documents", public=True
+    )
+    return start_ingest_workers(handler, FIRSTAPP_INGEST_JOB)
 
 # -------------------- Website Scraping Functions --------------------
-def scrape_website(url):
-    """Scrape text content from a website."""
-    try:
-        response = requests.get(url, verify=False)  # Disable SSL verification
-        soup = BeautifulSoup(response.text, "html.parser")
-        website_text = soup.get_text()
-        return website_text.strip()
-    except Exception as e:
-        logging.error(f"Error scraping website {url}: {e}")
-        return None
-
-def save_scraped_content_to_firebase(url, content):
-    """Save scraped content to Firebase Storage and Firestore."""
-    try:
-        # Save content to a text file
-        filename = f"website_content_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(content)
-
-        # Upload to Firebase Storage
-        file_url = upload_to_firebase(file_path, filename)
-        if file_url:
+@st.cache_resource
+def scraped_url_validators():
+    """Per-process {url: (etag, last_modified, content hash)} of pages already saved."""
+    return {}
+
+def scrape_websites(urls):
+    """Scrape websites concurrently, yielding (url, text) for new or changed pages only."""
+    validators = scraped_url_validators()
+    conditional = {url: validators[url][:2] for url in urls if url in validators}
+    for result in get_scraper().fetch_all(urls, conditional):
+        url = result["url"]
+        if result["error"]:
+            st.sidebar.error(f"❌ Error scraping website {url}: {result['error']}")
+            continue
+        if result["not_modified"]:
+            continue
+        website_text = html_to_text(result["html"]).strip()
+        sha256 = content_hash(website_text)
+        if url in validators and validators[url][2] == sha256:
+            continue
+        validators[url] = (result["headers"].get("ETag"), result["headers"].get("Last-Modified"), sha256)
+        yield url, website_text
+
+def save_scraped_content_to_firebase(pages):
+    """Upload scraped (url, content) pages to Firebase Storage in parallel and record them in Firestore."""
+    urls, items = [], []
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    for url, content in pages:
+        if content:
+            urls.append(url)
+            items.append((content.encode("utf-8"), f"website_content_{stamp}_{len(items)}.txt"))
+        else:
+            st.sidebar.error(f"❌ Failed to scrape content from {url}")
+
+    # Straight from memory, no temp files
+    results = get_uploader(bucket).upload_many(items, "documents", "text/plain; charset=utf-8", public=True)
+    for url, result in zip(urls, results):
+        if result["error"]:
+            st.sidebar.error(f"❌ Failed to save scraped content from {url}: {result['error']}")
+            continue
+        try:
             # Save metadata in Firestore
             metadata = {
                 "url": url,
-                "filename": filename,
+                "filename": result["name"],
+                "blob_name": result["blob_name"],
                 "timestamp": firestore.SERVER_TIMESTAMP,
             }
             db.collection("scraped_content").add(metadata)
             st.sidebar.success(f"✅ Scraped content from {url} uploaded to Firebase!")
-    except Exception as e:
-        st.sidebar.error(f"❌ Failed to save scraped content: {e}")
+        except Exception as e:
+            st.sidebar.error(f"❌ Failed to save scraped content: {e}")
 
 # -------------------- File Upload & Processing --------------------
 if user_role in ["Admin", "Superadmin"] and st.session_state.user:
@@ -388,56 +408,31 @@ if user_role in ["Admin", "Superadmin"] and st.session_state.user:
     uploaded_files = st.sidebar.file_uploader(
         "Upload PDFs", type=["pdf"], accept_multiple_files=True
     )
+    replace_by_name = st.sidebar.checkbox("Replace earlier uploads with the same file name", value=REPLACE_BY_FILENAME)
     
     # URL Input for Multiple Websites
     url_input = st.sidebar.text_area("Enter URLs to scrape content (one URL per line)")
 
-    # Process Uploaded Files
-    if uploaded_files:
-        for uploaded_file in uploaded_files:
-            file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-            
-            # Save the file locally
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-            # Extract text from the file
-            text = extract_text(file_path)
-            if text:
-                # Generate embeddings
-                text_embedding = embedding_model.encode([text])
-
-                # Add to FAISS index
-                faiss_index.add(text_embedding.reshape(1, -1))
-                pdf_metadata[len(pdf_metadata)] = {"file": uploaded_file.name, "text": text}
-
-                # Upload to Firebase Storage
-                file_url = upload_to_firebase(file_path, uploaded_file.name)
-                if file_url:
-                    st.sidebar.success(f"✅ File uploaded to Firebase: {file_url}")
-            else:
-                st.sidebar.error(f"❌ Failed to extract text from {uploaded_file.name}")
-
-        # Save the updated FAISS index and metadata
-        faiss.write_index(faiss_index, INDEX_FILE)
-        with open(METADATA_FILE, "wb") as f:
-            pickle.dump(pdf_metadata, f)
+    # Queue uploaded files for the background workers (extraction, OCR, embedding,
+    # Firebase upload); the index reloads once a job publishes a new version
+    ingest_workers = get_ingest_workers()
+    if uploaded_files and st.sidebar.button("Ingest in background"):
+        job_id = enqueue_ingest(
+            ingest_workers, uploaded_files, [], index_store.manifest, UPLOAD_DIR, FIRSTAPP_INGEST_JOB, replace_by_name
+        )
+        if job_id:
+            st.sidebar.success(f"✅ Queued ingestion job #{job_id}")
+        else:
+            st.sidebar.info("These files are already indexed")
+    with st.sidebar:
+        show_ingest_jobs(ingest_workers.queue, FIRSTAPP_INGEST_JOB)
+        manage_documents(ingest_workers, index_store.manifest, FIRSTAPP_INGEST_JOB)
 
     # Process URL Input for Multiple Websites
     if url_input:
-        urls = url_input.strip().split("\n")
-        for url in urls:
-            if url.strip():
-                try:
-                    # Scrape website content
-                    website_text = scrape_website(url.strip())
-                    if website_text:
-                        # Save scraped content to Firebase
-                        save_scraped_content_to_firebase(url.strip(), website_text)
-                    else:
-                        st.sidebar.error(f"❌ Failed to scrape content from {url.strip()}")
-                except Exception as e:
-                    st.sidebar.error(f"❌ Error scraping website {url.strip()}: {e}")
+        urls = [url.strip() for url in url_input.strip().split("\n") if url.strip()]
+        # Fetch concurrently; pages unchanged since the last scrape are skipped
+        save_scraped_content_to_firebase(scrape_websites(urls))
 
 # -------------------- Chatbot UI --------------------
 st.title("📜 RaiLChatBot 🤖")
@@ -448,6 +443,7 @@ answer_source = st.selectbox(
     "Select Answer Source",
     ["Working Model (Uploaded PDFs)", "Gemini (Uploaded PDFs)", "Gemini AI (General Knowledge)"]
 )
+filters = source_filter_controls(index_store) if answer_source != "Gemini AI (General Knowledge)" else None
 
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
@@ -466,23 +462,14 @@ if st.button("Ask", key="ask_button"):
         st.session_state.current_session = session_title
 
     if answer_source == "Working Model (Uploaded PDFs)":
-        if faiss_index.ntotal == 0:
+        if index_store.index.ntotal == 0:
             st.error("⚠️ No files uploaded. Please upload a file first.")
         else:
-            query_embedding = embedding_model.encode([query])
-            D, I = faiss_index.search(query_embedding, k=5)
-            
-            retrieved_texts = []
-            source_docs = set()
-
-            for idx in I[0]:
-                if idx != -1:
-                    retrieved_texts.append(pdf_metadata[idx]["text"])
-                    source_docs.add(pdf_metadata[idx]["file"])
-
-            context = "\n\n".join(retrieved_texts)
-            response = model.generate_content(query + "\n\nContext:\n" + context)
-            answer = response.text.strip()
+            query_embedding = embed_chunks([query], embedding_model)
+            # Hybrid retrieval and reranking, then deduplicated, MMR-ordered chunks within the token budget
+            context, source_docs, timings, tokens = retrieve_context(query, query_embedding, index_store, filters=filters)
+            st.caption(retrieval_caption(timings, tokens))
+            answer = generate_answer(model, query + "\n\nContext:\n" + context).strip()
 
             timestamp = datetime.datetime.now().strftime("%H:%M:%S")
             chat_entry = {
@@ -494,29 +481,17 @@ if st.button("Ask", key="ask_button"):
             st.session_state.chat_history.append(chat_entry)
 
             if st.session_state.user:
-                db.collection("chats").document(st.session_state.user.uid).collection("session_chats").document(st.session_state.current_session).collection("messages").add({
-                    **chat_entry,
-                    "timestamp": firestore.SERVER_TIMESTAMP
-                })
+                save_chat_entry(st.session_state.current_session, chat_entry)
 
     elif answer_source == "Gemini (Uploaded PDFs)":
-        if faiss_index.ntotal == 0:
+        if index_store.index.ntotal == 0:
             st.error("⚠️ No files uploaded. Please upload a file first.")
         else:
-            query_embedding = embedding_model.encode([query])
-            D, I = faiss_index.search(query_embedding, k=5)
-            
-            retrieved_texts = []
-            source_docs = set()
-
-            for idx in I[0]:
-                if idx != -1:
-                    retrieved_texts.append(pdf_metadata[idx]["text"])
-                    source_docs.add(pdf_metadata[idx]["file"])
-
-            context = "\n\n".join(retrieved_texts)
-            response = model.generate_content(query + "\n\nContext:\n" + context)
-            answer = response.text.strip()
+            query_embedding = embed_chunks([query], embedding_model)
+            # Hybrid retrieval and reranking, then deduplicated, MMR-ordered chunks within the token budget
+            context, source_docs, timings, tokens = retrieve_context(query, query_embedding, index_store, filters=filters)
+            st.caption(retrieval_caption(timings, tokens))
+            answer = generate_answer(model, query + "\n\nContext:\n" + context).strip()
 
             timestamp = datetime.datetime.now().strftime("%H:%M:%S")
             chat_entry = {
@@ -528,14 +503,10 @@ if st.button("Ask", key="ask_button"):
             st.session_state.chat_history.append(chat_entry)
 
             if st.session_state.user:
-                db.collection("chats").document(st.session_state.user.uid).collection("session_chats").document(st.session_state.current_session).collection("messages").add({
-                    **chat_entry,
-                    "timestamp": firestore.SERVER_TIMESTAMP
-                })
+                save_chat_entry(st.session_state.current_session, chat_entry)
 
     elif answer_source == "Gemini AI (General Knowledge)":
-        response = model.generate_content(query)
-        answer = response.text.strip()
+        answer = generate_answer(model, query).strip()
 
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         chat_entry = {
@@ -547,25 +518,40 @@ if st.button("Ask", key="ask_button"):
         st.session_state.chat_history.append(chat_entry)
 
         if st.session_state.user:
-            db.collection("chats").document(st.session_state.user.uid).collection("session_chats").document(st.session_state.current_session).collection("messages").add({
-                **chat_entry,
-                "timestamp": firestore.SERVER_TIMESTAMP
-            })
+            save_chat_entry(st.session_state.current_session, chat_entry)
 
 # -------------------- Sidebar Session History --------------------
 if st.session_state.user:
     st.sidebar.markdown("### 📜 Session History")
-    sessions_ref = db.collection("sessions").document(st.session_state.user.uid).collection("user_sessions")
-    sessions = sessions_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).stream()
+    # Sessions come a page at a time from the per-user cache
+    if "session_pages" not in st.session_state:
+        st.session_state.session_pages = 1
+    sessions, more_sessions = get_session_cache().sessions(
+        st.session_state.user.uid,
+        user_sessions().order_by("timestamp", direction=firestore.Query.DESCENDING),
+        st.session_state.session_pages,
+    )
 
-    for session in sessions:
-        session_data = session.to_dict()
-        if st.sidebar.button(f"{session_data['title']} - {session_data['time']}"):
+    for session_id, session_data in sessions:
+        if st.sidebar.button(f"{session_data['title']} - {session_data['time']}", key=session_id):
             st.session_state.current_session = session_data["title"]
-            st.session_state.chat_history = get_session_chats(session.id)
+            chats, cursor, has_more = get_session_chats(session_id)
+            st.session_state.chat_history = chats
+            st.session_state.history_session = session_id
+            st.session_state.history_cursor = cursor
+            st.session_state.history_has_more = has_more
+
+    if more_sessions and st.sidebar.button("Show older sessions"):
+        st.session_state.session_pages += 1
+        st.rerun()
 
 # -------------------- Chat History --------------------
 st.subheader("📜 Chat History")
+if st.session_state.get("history_has_more") and st.button("Load earlier messages"):
+    chats, cursor, has_more = get_session_chats(st.session_state.history_session, st.session_state.history_cursor)
+    st.session_state.chat_history = chats + st.session_state.chat_history
+    st.session_state.history_cursor = cursor
+    st.session_state.history_has_more = has_more
 for chat in st.session_state.chat_history:
     st.markdown(f"**🕒 {chat['time']} | You:** {chat['user']}")
     st.markdown(f"**🤖 AI:** {chat['bot']}")
@@ -0,0 +1,205 @@
+import os
+import json
+import datetime
+import contextlib
+import numpy as np
+import faiss
+from atomic_io import atomic_write, atomic_write_bytes, file_lock
+from chunk_store import ChunkStore
+from ingest_manifest import IngestManifest
+from lexical_index import BM25Index
+from chunk_metadata import ChunkMetadata
+from vector_index import new_index, ensure_id_map
+
+INDEX_FILENAME = "faiss_index.bin"
+MANIFEST_FILENAME = "manifest.json"
+LEXICAL_FILENAME = "bm25.npz"
+METADATA_FILENAME = "chunk_meta.npz"
+LOCK_FILENAME = "write.lock"
+
+# Chunks read per batch when building the BM25 index or metadata from the chunk store
+LEXICAL_BACKFILL_BATCH = 10000
+
+class IndexStore:
+    """FAISS index, BM25 index, chunk metadata and chunk store persisted on disk with a version number and atomic saves.
+
+    The manifest is written after the index files, so its version only ever
+    points at fully written indexes. Chunk ids are assigned in order and
+    never reused; the FAISS index maps them explicitly (IndexIDMap2), so
+    deleted chunks can be tombstoned now and their vectors compacted away
+    later without renumbering anything. Any number of processes may read
+    the directory, but changes go through writing(), which serializes
+    writers across processes and starts them from the latest saved version.
+    """
+
+    def __init__(self, directory, dim=384):
+        self.directory = directory
+        self.dim = dim
+        self.index = None
+        self.chunks = ChunkStore(directory)
+        self.manifest = IngestManifest(directory)
+        self.lexical = BM25Index()
+        self.metadata = ChunkMetadata()
+        self.version = 0
+        self.next_id = 0
+        self.mmapped = False
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILENAME)
+
+    @property
+    def lexical_path(self):
+        return os.path.join(self.directory, LEXICAL_FILENAME)
+
+    @property
+    def metadata_path(self):
+        return os.path.join(self.directory, METADATA_FILENAME)
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.directory, LOCK_FILENAME)
+
+    def read_manifest(self):
+        """Return the on-disk manifest, or an empty one if nothing is saved yet"""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0}
+
+    def disk_version(self):
+        """Return the version currently saved on disk"""
+        return self.read_manifest().get("version", 0)
+
+    def load(self, mmap=True):
+        """Load the saved index (memory-mapped where supported) or start an empty one"""
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.read_manifest()
+        if manifest.get("version", 0) and os.path.exists(self.index_path):
+            flags = faiss.IO_FLAG_MMAP if mmap else 0
+            self.index = faiss.read_index(self.index_path, flags)
+            self.mmapped = mmap
+        else:
+            self.index = new_index(self.dim)
+            self.mmapped = False
+        self.manifest.load()
+        self.version = manifest.get("version", 0)
+        # Indexes saved before ids were mapped hold chunks 0..ntotal-1
+        self.next_id = manifest.get("next_id", self.index.ntotal)
+        # Records past next_id were appended by a writer that never saved
+        self.chunks.truncate(self.next_id)
+        self.load_lexical()
+        self.load_metadata()
+        return self
+
+    def load_lexical(self):
+        """Load the BM25 index, indexing any chunks it is missing (e.g. saved before it existed)"""
+        if self.version and os.path.exists(self.lexical_path):
+            self.lexical = BM25Index.load(self.lexical_path)
+        else:
+            self.lexical = BM25Index()
+        self.lexical.truncate(self.next_id)
+        for start in range(len(self.lexical), self.next_id, LEXICAL_BACKFILL_BATCH):
+            end = min(start + LEXICAL_BACKFILL_BATCH, self.next_id)
+            records = self.chunks.get(range(start, end))
+            self.lexical.add([record["text"] if record else "" for record in records], start)
+
+    def load_metadata(self):
+        """Load chunk metadata, rebuilding any missing entries from the chunk store and manifest"""
+        if self.version and os.path.exists(self.metadata_path):
+            self.metadata = ChunkMetadata.load(self.metadata_path)
+        else:
+            self.metadata = ChunkMetadata()
+        self.metadata.truncate(self.next_id)
+        for start in range(len(self.metadata), self.next_id, LEXICAL_BACKFILL_BATCH):
+            end = min(start + LEXICAL_BACKFILL_BATCH, self.next_id)
+            records = []
+            for record in self.chunks.get(range(start, end)):
+                record = record or {}
+                entry = self.manifest.get(record.get("doc_key", "")) or {}
+                ingested_at = entry.get("ingested_at")
+                added_at = datetime.datetime.fromisoformat(ingested_at).timestamp() if ingested_at else 0.0
+                records.append({"doc_key": record.get("doc_key"), "page": record.get("page"), "added_at": added_at})
+            self.metadata.add(records, start)
+
+    @contextlib.contextmanager
+    def writing(self):
+        """Hold the directory's writer lock, first reloading (into RAM) any version saved by another writer"""
+        with file_lock(self.lock_path):
+            if self.index is None or self.mmapped or self.disk_version() != self.version:
+                self.load(mmap=False)
+            yield self
+
+    def filter_mask(self, filters):
+        """Boolean mask of live chunk ids passing filters, or None when every indexed chunk qualifies"""
+        return self.metadata.mask(filters)
+
+    def stale_ratio(self):
+        """Fraction of the vectors in the index that belong to deleted chunks"""
+        return self.metadata.stale_count() / max(self.index.ntotal, 1)
+
+    def replace_index(self, index):
+        """Swap in a rebuilt in-memory index (e.g. after promotion)"""
+        self.index = index
+        self.mmapped = False
+
+    def ensure_writable(self):
+        """Reload a memory-mapped index into RAM (mmapped IVF lists are read-only) with an id map"""
+        if self.mmapped:
+            self.replace_index(faiss.read_index(self.index_path))
+        if not isinstance(self.index, faiss.IndexIDMap):
+            self.replace_index(ensure_id_map(self.index))
+
+    def add(self, embeddings, records):
+        """Append chunk records and their vectors under the next chunk ids; call inside writing()"""
+        self.ensure_writable()
+        # Orphaned records left behind by an interrupted ingestion are overwritten
+        self.chunks.truncate(self.next_id)
+        self.lexical.truncate(self.next_id)
+        self.metadata.truncate(self.next_id)
+        ids = self.chunks.append(records)
+        if ids:
+            self.index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+        self.lexical.add([record["text"] for record in records], ids[0] if ids else None)
+        self.metadata.add(records, ids[0] if ids else None)
+        self.next_id = len(self.chunks)
+        return ids
+
+    def delete_chunks(self, ids):
+        """Tombstone chunks so searches skip them at once; compaction removes their vectors later"""
+        return self.metadata.delete(ids)
+
+    def delete_documents(self, keys):
+        """Remove documents from the manifest and tombstone their chunks; returns the number of chunks"""
+        deleted = 0
+        for key in keys:
+            entry = self.manifest.documents.pop(key, None)
+            if entry:
+                deleted += self.delete_chunks(entry["chunk_ids"])
+        return deleted
+
+    def save(self):
+        """Atomically write the indexes and ingest manifest, then bump the on-disk version"""
+        atomic_write(self.index_path, lambda tmp_path: faiss.write_index(self.index, tmp_path))
+        self.lexical.save(self.lexical_path)
+        self.metadata.save(self.metadata_path)
+        self.manifest.save()
+        self.version = max(self.version, self.disk_version()) + 1
+        manifest = {
+            "version": self.version,
+            "ntotal": int(self.index.ntotal),
+            "chunks": len(self.chunks),
+            "next_id": self.next_id,
+            "deleted_in_index": self.metadata.stale_count(),
+            "lexical_docs": len(self.lexical),
+            "metadata_chunks": len(self.metadata),
+            "dim": self.dim,
+            "saved_at": datetime.datetime.now().isoformat(),
+        }
+        atomic_write_bytes(self.manifest_path, json.dumps(manifest).encode("utf-8"))
+        return self.version
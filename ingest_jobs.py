@@ -0,0 +1,425 @@
+import os
+import re
+import time
+import logging
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import faiss
+import streamlit as st
+from index_store import IndexStore
+from job_queue import JobQueue, JobWorkerPool
+from ingest_manifest import file_key, url_key
+from file_processing import process_pdf, embed_chunks, record_documents, collect_page_chunks
+from chunking import chunk_pages
+from crawler import Crawler
+from vector_index import maybe_promote, configure_search, index_ids, index_mode, index_encoding, chunk_vectors
+from vector_index import empty_like, add_with_ids, ensure_direct_map
+from config import INDEX_DIR, EMBEDDING_DIM, INDEX_MODE, ANN_PROMOTION_THRESHOLD, IVF_NPROBE, HNSW_EF_SEARCH
+from config import INDEX_ENCODING, PQ_SUBQUANTIZERS
+from config import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from config import INGEST_WORKERS, INGEST_QUEUE_FILENAME, INGEST_POLL_SECONDS
+from config import COMPACTION_THRESHOLD, COMPACTION_THREADS, COMPACTION_PAUSE
+from config import CRAWL_MAX_PAGES, CRAWL_FLUSH_CHUNKS
+from config import load_embedding_model, load_tokenizer, get_scraper, get_uploader
+
+INGEST_JOB = "ingest"
+
+# Vectors copied per batch when compacting the index
+COMPACTION_BATCH = 8192
+
+def _throughput(chunks, seconds):
+    """Embedding throughput as a " (N chunks/sec)" message suffix; empty when nothing was embedded"""
+    return f" ({chunks / seconds:.1f} chunks/sec)" if chunks and seconds > 0 else ""
+
+class IngestJobHandler:
+    """Runs ingestion jobs on worker threads.
+
+    Uploading, extraction, scraping and embedding run in parallel across
+    workers; adding to the index and saving happen one job at a time on a
+    private writable IndexStore, so readers only ever load a complete saved
+    version. A job's files are uploaded while they are being extracted.
+    extract_pages(file_path), upload_prefix and public let each app plug in
+    its own OCR and storage layout. Jobs with a "crawl" payload crawl a site
+    and publish its pages in batches, and jobs with a "delete" payload
+    tombstone documents; once tombstones pass compaction_threshold the
+    index is compacted on a background thread.
+    """
+
+    def __init__(self, index_dir, embedding_model, tokenizer, scraper, extract_pages=None, uploader=None,
+                 upload_prefix="pdfs", public=False, dim=EMBEDDING_DIM, compaction_threshold=COMPACTION_THRESHOLD):
+        self.index_store = IndexStore(index_dir, dim)
+        self.embedding_model = embedding_model
+        self.tokenizer = tokenizer
+        self.scraper = scraper
+        self.extract_pages = extract_pages
+        self.uploader = uploader
+        self.upload_prefix = upload_prefix
+        self.public = public
+        self.compaction_threshold = compaction_threshold
+        self._publish_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Hold the publish lock and the index directory's writer lock on the latest saved version"""
+        with self._publish_lock, self.index_store.writing() as index_store:
+            yield index_store
+
+    def _file_chunks(self, path, name, key):
+        if self.extract_pages:
+            pages = chunk_pages(self.extract_pages(path), self.tokenizer, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+        else:
+            pages = process_pdf(path, self.tokenizer)
+        return [dict(chunk, file=name, doc_key=key) for chunk in pages]
+
+    def _upload(self, files, progress):
+        """Upload spooled files in parallel; returns error messages"""
+        start = time.perf_counter()
+        results = self.uploader.upload_many(
+            [(spooled["path"], spooled["name"], spooled["key"].split(":", 1)[1]) for spooled in files],
+            self.upload_prefix, public=self.public
+        )
+        progress.add_time("upload", time.perf_counter() - start)
+        return [f"upload of {result['name']}: {result['error']}" for result in results if result["error"]]
+
+    def __call__(self, job, progress):
+        if "delete" in job["payload"]:
+            return self._delete(job["payload"]["delete"], progress)
+        if "crawl" in job["payload"]:
+            return self._crawl(job["payload"]["crawl"], progress)
+        files = job["payload"].get("files", [])
+        urls = job["payload"].get("urls", [])
+        total = len(files) + len(urls) or 1
+        chunks, documents, errors = [], [], []
+        done = 0
+
+        with self._writing() as index_store:
+            known = set(index_store.manifest.documents)
+        new_files = [spooled for spooled in files if spooled["key"] not in known and os.path.exists(spooled["path"])]
+        done += len(files) - len(new_files)
+
+        # Upload the job's files in parallel while extraction runs
+        with ThreadPoolExecutor(max_workers=1) as upload_executor:
+            uploads = upload_executor.submit(self._upload, new_files, progress) if self.uploader and new_files else None
+            for spooled in new_files:
+                progress.stage("extract", done / total)
+                start = time.perf_counter()
+                file_chunks = self._file_chunks(spooled["path"], spooled["name"], spooled["key"])
+                progress.add_time("extract", time.perf_counter() - start)
+                if file_chunks:
+                    chunks.extend(file_chunks)
+                    documents.append({
+                        "key": spooled["key"],
+                        "name": spooled["name"],
+                        "replace_by_name": job["payload"].get("replace_by_name", False),
+                        "fields": {"source_type": "pdf", "sha256": spooled["key"].split(":", 1)[1]},
+                    })
+                else:
+                    errors.append(f"no text in {spooled['name']}")
+                done += 1
+            if uploads:
+                errors.extend(uploads.result())
+
+        if urls:
+            progress.stage("fetch", done / total)
+            start = time.perf_counter()
+            with self._writing() as index_store:
+                manifest = index_store.manifest
+                validators = {}
+                for url in urls:
+                    entry = manifest.get(url_key(url))
+                    if entry:
+                        validators[url] = (entry.get("etag"), entry.get("last_modified"))
+            for result in self.scraper.fetch_all(urls, validators):
+                if result["error"]:
+                    errors.append(f"{result['url']}: {result['error']}")
+                    continue
+                page_chunks, document = collect_page_chunks(result, manifest, self.tokenizer)
+                if document:
+                    chunks.extend(page_chunks)
+                    documents.append(document)
+            progress.add_time("fetch", time.perf_counter() - start)
+
+        embed_seconds = 0.0
+        if documents:
+            progress.stage("embed", 0.8)
+            start = time.perf_counter()
+            embeddings = self._embed(chunks)
+            embed_seconds = time.perf_counter() - start
+            progress.add_time("embed", embed_seconds)
+
+            progress.stage("publish", 0.95)
+            start = time.perf_counter()
+            self._publish(embeddings, chunks, documents)
+            progress.add_time("publish", time.perf_counter() - start)
+
+        for spooled in files:
+            if os.path.exists(spooled["path"]):
+                os.remove(spooled["path"])
+
+        indexed = sum(not document.get("unchanged") for document in documents)
+        message = f"Embedded {len(chunks)} chunks from {indexed} documents{_throughput(len(chunks), embed_seconds)}"
+        logging.info(message)
+        if errors:
+            message += f" ({len(errors)} failed: {'; '.join(errors)})"
+        return message
+
+    def _crawl(self, crawl, progress):
+        """Crawl same-domain pages from seeds and/or a sitemap, publishing new or changed pages in batches"""
+        crawler = Crawler(self.scraper, crawl.get("depth", 0), CRAWL_MAX_PAGES)
+        seeds = list(crawl.get("seeds", []))
+        if crawl.get("sitemap"):
+            seeds.extend(crawler.sitemap_urls(crawl["sitemap"]))
+        # Read-only snapshot for validators and links; _publish records changes under the writer lock
+        with self._writing() as index_store:
+            manifest = index_store.manifest
+
+        def show_progress(stats):
+            progress.stage(
+                f"crawl depth {stats['depth']}: {stats['fetched']} fetched, {stats['queued']} queued",
+                stats["fetched"] / max(stats["fetched"] + stats["queued"], 1),
+            )
+
+        # Embed and publish in batches as pages arrive so a large crawl never holds every chunk
+        pending_chunks, pending_documents = [], []
+        published = chunk_count = errors = 0
+        embed_seconds = 0.0
+        def flush():
+            nonlocal pending_chunks, pending_documents, published, chunk_count, embed_seconds
+            start = time.perf_counter()
+            embeddings = self._embed(pending_chunks)
+            seconds = time.perf_counter() - start
+            embed_seconds += seconds
+            progress.add_time("embed", seconds)
+            start = time.perf_counter()
+            published += self._publish(embeddings, pending_chunks, pending_documents)
+            progress.add_time("publish", time.perf_counter() - start)
+            chunk_count += len(pending_chunks)
+            pending_chunks, pending_documents = [], []
+
+        for result in crawler.crawl(seeds, lambda url: manifest.get(url_key(url)), show_progress):
+            if result["error"]:
+                errors += 1
+                continue
+            chunks, document = collect_page_chunks(result, manifest, self.tokenizer)
+            if document:
+                pending_chunks.extend(chunks)
+                pending_documents.append(document)
+            if len(pending_chunks) >= CRAWL_FLUSH_CHUNKS:
+                flush()
+        if pending_documents:
+            flush()
+        message = (
+            f"Crawl finished: {published} new or changed pages, "
+            f"{chunk_count} chunks embedded{_throughput(chunk_count, embed_seconds)}, {errors} errors"
+        )
+        logging.info(message)
+        return message
+
+    def _embed(self, chunks):
+        if not chunks:
+            return np.empty((0, self.index_store.dim), dtype=np.float32)
+        return embed_chunks([chunk["text"] for chunk in chunks], self.embedding_model)
+
+    def _publish(self, embeddings, chunks, documents):
+        """Add embedded chunks to the index, save it as a new version and return the number of documents added.
+
+        Manifest changes happen here, on the writer's freshly loaded manifest:
+        documents whose content is already indexed (by another job meanwhile,
+        or "unchanged" pages) only refresh their validators.
+        """
+        with self._writing() as index_store:
+            duplicates = set()
+            for document in documents:
+                if index_store.manifest.is_current(document["key"], document["fields"]["sha256"]):
+                    index_store.manifest.update(document["key"], **document["fields"])
+                    duplicates.add(document["key"])
+                elif document.get("unchanged"):
+                    # Re-indexed with other content since the page was fetched
+                    duplicates.add(document["key"])
+            if duplicates:
+                keep = [chunk["doc_key"] not in duplicates for chunk in chunks]
+                embeddings = np.ascontiguousarray(embeddings[np.asarray(keep, dtype=bool)])
+                chunks = [chunk for chunk, kept in zip(chunks, keep) if kept]
+                documents = [document for document in documents if document["key"] not in duplicates]
+            if not documents:
+                if duplicates:
+                    index_store.save()
+                return 0
+            ids = index_store.add(embeddings, chunks)
+            record_documents(index_store, documents, chunks, ids)
+            recall = maybe_promote(
+                index_store, INDEX_MODE, ANN_PROMOTION_THRESHOLD, IVF_NPROBE, HNSW_EF_SEARCH, INDEX_ENCODING, PQ_SUBQUANTIZERS
+            )
+            if recall is not None:
+                logging.info(f"Index switched to {INDEX_MODE}/{INDEX_ENCODING} (recall@10 vs flat: {recall:.3f})")
+            index_store.save()
+            stale_ratio = index_store.stale_ratio()
+        self._maybe_compact(stale_ratio)
+        return len(documents)
+
+    def _delete(self, keys, progress):
+        """Tombstone documents and their chunks and save, so searches stop returning them"""
+        progress.stage("delete", 0.5)
+        start = time.perf_counter()
+        with self._writing() as index_store:
+            found = [key for key in keys if key in index_store.manifest]
+            deleted = index_store.delete_documents(found)
+            if found:
+                index_store.save()
+            stale_ratio = index_store.stale_ratio()
+        progress.add_time("delete", time.perf_counter() - start)
+        self._maybe_compact(stale_ratio)
+        return f"Deleted {len(found)} documents ({deleted} chunks)"
+
+    def _maybe_compact(self, stale_ratio):
+        if stale_ratio >= self.compaction_threshold and not self._compact_lock.locked():
+            threading.Thread(target=self.compact, name="index-compaction", daemon=True).start()
+
+    def compact(self):
+        """Rebuild the index without tombstoned vectors; returns how many were dropped (None if skipped).
+
+        The rebuild reads the saved index file (memory-mapped where FAISS
+        supports it) outside the publish lock, on COMPACTION_THREADS OpenMP
+        threads with a short pause between batches, so ingestion carries on
+        and searches in this process keep their CPU. Searches use the saved
+        version until the compacted one is saved. Chunks published meanwhile
+        are copied over before the swap; chunks deleted meanwhile wait for
+        the next round.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return None
+        # OpenMP thread counts are per calling thread, so searches elsewhere are unaffected
+        threads = faiss.omp_get_max_threads()
+        faiss.omp_set_num_threads(COMPACTION_THREADS)
+        try:
+            start = time.perf_counter()
+            with self._writing() as index_store:
+                stale = index_store.metadata.deleted_ids()
+                if not len(stale):
+                    return None
+                saved = faiss.read_index(index_store.index_path, faiss.IO_FLAG_MMAP)
+                layout = (index_mode(saved), index_encoding(saved))
+                next_id = index_store.next_id
+            ids = index_ids(saved)
+            live = ids[~np.isin(ids, stale)]
+            compacted = empty_like(saved)
+            ensure_direct_map(saved)
+            for batch_start in range(0, len(live), COMPACTION_BATCH):
+                batch = live[batch_start:batch_start + COMPACTION_BATCH]
+                vectors = chunk_vectors(saved, batch)
+                if vectors is None:
+                    return None
+                add_with_ids(compacted, vectors, batch)
+                time.sleep(COMPACTION_PAUSE)
+            del saved
+
+            with self._writing() as index_store:
+                index_store.ensure_writable()
+                if (index_mode(index_store.index), index_encoding(index_store.index)) != layout:
+                    logging.info("Index was rebuilt while compacting; compaction skipped")
+                    return None
+                ids = index_ids(index_store.index)
+                added = ids[ids >= next_id]
+                if len(added):
+                    ensure_direct_map(index_store.index)
+                    add_with_ids(compacted, chunk_vectors(index_store.index, added), added)
+                configure_search(compacted, IVF_NPROBE, HNSW_EF_SEARCH)
+                index_store.replace_index(compacted)
+                index_store.metadata.purge(stale)
+                index_store.lexical.remove(stale)
+                index_store.save()
+            logging.info(
+                f"Compacted index: dropped {len(stale)} deleted vectors, kept {compacted.ntotal} "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+            return len(stale)
+        finally:
+            faiss.omp_set_num_threads(threads)
+            self._compact_lock.release()
+
+def start_ingest_workers(handler, kind=INGEST_JOB, queue_path=os.path.join(INDEX_DIR, INGEST_QUEUE_FILENAME),
+                         workers=INGEST_WORKERS):
+    """Open the on-disk queue, requeue jobs whose process died and start the worker threads"""
+    os.makedirs(os.path.dirname(os.path.abspath(queue_path)), exist_ok=True)
+    return JobWorkerPool(JobQueue(queue_path), {kind: handler}, workers).start()
+
+@st.cache_resource
+def get_ingest_workers(_bucket):
+    """Background ingestion workers shared by every session of this process"""
+    handler = IngestJobHandler(
+        INDEX_DIR, load_embedding_model(), load_tokenizer(), get_scraper(), uploader=get_uploader(_bucket)
+    )
+    return start_ingest_workers(handler)
+
+def spool_uploads(uploaded_files, spool_dir, manifest):
+    """Write new uploaded files to the spool directory so queued jobs survive a restart"""
+    os.makedirs(spool_dir, exist_ok=True)
+    spooled = []
+    for uploaded_file in uploaded_files:
+        key = file_key(uploaded_file.getbuffer())
+        if key in manifest or any(entry["key"] == key for entry in spooled):
+            continue
+        safe_name = re.sub(r"[^\w.-]", "_", uploaded_file.name)
+        path = os.path.join(spool_dir, f"{key.split(':', 1)[1][:16]}-{safe_name}")
+        with open(path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        spooled.append({"path": path, "name": uploaded_file.name, "key": key})
+    return spooled
+
+def enqueue_ingest(workers, uploaded_files, urls, manifest, spool_dir, kind=INGEST_JOB, replace_by_name=False):
+    """Spool uploads and queue one ingestion job for them and the URLs; returns the job id or None.
+
+    With replace_by_name the uploads replace indexed PDFs that have the same file name.
+    """
+    files = spool_uploads(uploaded_files, spool_dir, manifest)
+    if not files and not urls:
+        return None
+    job_id = workers.queue.enqueue(kind, {"files": files, "urls": list(urls), "replace_by_name": replace_by_name})
+    workers.notify()
+    return job_id
+
+def enqueue_crawl(workers, seeds, sitemap_url, max_depth, kind=INGEST_JOB):
+    """Queue a job that crawls a site from seed URLs and/or a sitemap; returns the job id"""
+    job_id = workers.queue.enqueue(kind, {"crawl": {"seeds": list(seeds), "sitemap": sitemap_url, "depth": max_depth}})
+    workers.notify()
+    return job_id
+
+def enqueue_delete(workers, keys, kind=INGEST_JOB):
+    """Queue a job that deletes documents by manifest key; returns the job id"""
+    job_id = workers.queue.enqueue(kind, {"delete": list(keys)})
+    workers.notify()
+    return job_id
+
+def manage_documents(workers, manifest, kind=INGEST_JOB):
+    """Let admins pick indexed documents and queue their deletion"""
+    documents = manifest.documents
+    with st.expander("🗑️ Manage documents"):
+        keys = st.multiselect(
+            "Indexed documents", sorted(documents, key=lambda key: documents[key]["name"]),
+            format_func=lambda key: documents[key]["name"], key=f"delete_{kind}"
+        )
+        if keys and st.button("Delete selected", key=f"delete_button_{kind}"):
+            st.success(f"Queued deletion job #{enqueue_delete(workers, keys, kind)}")
+
+def format_stage_timings(timings):
+    return ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timings.items())
+
+@st.fragment(run_every=INGEST_POLL_SECONDS)
+def show_ingest_jobs(queue, kind=INGEST_JOB, limit=5):
+    """Show recent ingestion jobs with progress and stage timings, refreshing on a timer"""
+    jobs = queue.recent(kind, limit)
+    if not jobs:
+        return
+    counts = queue.counts(kind)
+    st.markdown(f"**Ingestion jobs** ({counts['queued']} queued, {counts['running']} running)")
+    for job in jobs:
+        label = f"#{job['id']} {job['status']}"
+        if job["status"] == "running":
+            st.progress(job["progress"], text=f"{label}: {job['stage'] or 'starting'}")
+        else:
+            st.caption(label + (f": {job['message']}" if job["message"] else ""))
+        if job["timings"]:
+            st.caption(format_stage_timings(job["timings"]))
@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+import datetime
+from atomic_io import atomic_write_bytes
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+def content_hash(data):
+    """Return the SHA-256 hex digest of text or a bytes-like buffer"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(memoryview(data)).hexdigest()
+
+def file_key(data):
+    """Manifest key for an uploaded file: the hash of its bytes"""
+    return "sha256:" + content_hash(data)
+
+def url_key(url):
+    """Manifest key for a web source"""
+    return "url:" + url
+
+class IngestManifest:
+    """Record of every ingested document and the vector ids that belong to it.
+
+    Files are keyed by the SHA-256 of their bytes and web pages by URL (with
+    their content hash, ETag and Last-Modified stored in the entry), so
+    checking whether something is already indexed is a dict lookup.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_FILENAME)
+        self.documents = {}
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.documents = json.load(f)
+        except FileNotFoundError:
+            self.documents = {}
+        return self
+
+    def __contains__(self, key):
+        return key in self.documents
+
+    def get(self, key):
+        return self.documents.get(key)
+
+    def is_current(self, key, sha256):
+        """True if key was ingested with exactly this content"""
+        entry = self.documents.get(key)
+        return entry is not None and entry.get("sha256") == sha256
+
+    def record(self, key, name, chunk_ids, **fields):
+        """Record (or replace) a document entry with its vector ids"""
+        self.documents[key] = {
+            "name": name,
+            "chunk_ids": [int(chunk_id) for chunk_id in chunk_ids],
+            "ingested_at": datetime.datetime.now().isoformat(),
+            **fields,
+        }
+
+    def update(self, key, **fields):
+        """Update fields of an existing entry (e.g. a fresh ETag) without touching its ids"""
+        self.documents[key].update(fields)
+
+    def save(self):
+        atomic_write_bytes(self.path, json.dumps(self.documents).encode("utf-8"))
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+
+STATUSES = ("queued", "running", "done", "failed")
+
+class JobQueue:
+    """Durable job queue in a local SQLite file.
+
+    Jobs carry a JSON payload, a status, a 0-1 progress value and per-stage
+    timings. Every state change is committed immediately, so queued work
+    survives a restart. Several processes may share the file: a claimed job
+    is leased to its queue instance for lease_seconds and the lease is kept
+    alive by heartbeat(). requeue_expired() only puts back jobs whose owner
+    stopped heartbeating, i.e. died.
+    """
+
+    def __init__(self, path, lease_seconds=60):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                progress REAL NOT NULL DEFAULT 0,
+                stage TEXT,
+                timings TEXT NOT NULL DEFAULT '{}',
+                message TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        # Queue files created before leases existed lack these columns
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        if "lease_until" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _row(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["timings"] = json.loads(job["timings"])
+        return job
+
+    def enqueue(self, kind, payload):
+        """Add a job and return its id"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, kinds):
+        """Lease the oldest queued job of one of these kinds to this queue, mark it running and return it (or None)"""
+        placeholders = ", ".join("?" for _ in kinds)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT * FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) ORDER BY id LIMIT 1",
+                    tuple(kinds),
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?, "
+                        "updated_at = ? WHERE id = ?",
+                        (self.owner, now + self.lease_seconds, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._row(row)
+        if job is not None:
+            job["status"] = "running"
+            job["attempts"] += 1
+            job["owner"] = self.owner
+        return job
+
+    def update(self, job_id, progress=None, stage=None, timings=None, message=None):
+        """Record progress, the current stage and/or stage timings of a job this queue holds the lease on"""
+        fields = {"updated_at": time.time()}
+        if progress is not None:
+            fields["progress"] = progress
+        if stage is not None:
+            fields["stage"] = stage
+        if timings is not None:
+            fields["timings"] = json.dumps(timings)
+        if message is not None:
+            fields["message"] = message
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?", (*fields.values(), job_id, self.owner)
+            )
+
+    def finish(self, job_id, message=None, timings=None):
+        self.update(job_id, progress=1.0, stage="", timings=timings, message=message)
+        self._set_status(job_id, "done")
+
+    def fail(self, job_id, message, timings=None):
+        self.update(job_id, timings=timings, message=message)
+        self._set_status(job_id, "failed")
+
+    def _set_status(self, job_id, status):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = NULL, updated_at = ? WHERE id = ? AND owner = ?",
+                (status, time.time(), job_id, self.owner),
+            )
+
+    def heartbeat(self):
+        """Extend the lease of every job this queue is running; returns how many"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (now + self.lease_seconds, self.owner),
+            )
+            return cursor.rowcount
+
+    def requeue_expired(self, kinds):
+        """Put running jobs of these kinds whose lease expired (their process died) back in the queue; returns how many"""
+        placeholders = ", ".join("?" for _ in kinds)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL, updated_at = ? "
+                f"WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?) AND kind IN ({placeholders})",
+                (now, now, *kinds),
+            )
+            return cursor.rowcount
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def recent(self, kind, limit=10):
+        """Return the most recent jobs of a kind, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? ORDER BY id DESC LIMIT ?", (kind, limit)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def counts(self, kind):
+        """Return the number of jobs of a kind in each status"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE kind = ? GROUP BY status", (kind,)
+            ).fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+class JobProgress:
+    """Reports a running job's progress and stage timings back to the queue"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.timings = {}
+
+    def stage(self, name, progress=None):
+        """Mark the start of a stage"""
+        self.queue.update(self.job_id, progress=progress, stage=name)
+
+    def add_time(self, name, seconds):
+        """Add seconds to a stage's total and publish the timings"""
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        self.queue.update(self.job_id, timings=self.timings)
+
+class JobWorkerPool:
+    """Worker threads that claim jobs from a JobQueue and run the handler for their kind.
+
+    Workers only claim kinds they have a handler for, so apps with different
+    handlers can share one queue file. A handler is called as
+    handler(job, progress) and returns a short result message; an exception
+    marks the job as failed. A heartbeat thread keeps this process's leases
+    alive and requeues jobs abandoned by processes that died.
+    """
+
+    def __init__(self, queue, handlers, workers=2, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+
+    def start(self):
+        self._requeue_expired()
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _requeue_expired(self):
+        requeued = self.queue.requeue_expired(list(self.handlers))
+        if requeued:
+            logging.info(f"Requeued {requeued} jobs abandoned by a stopped process")
+            self.notify()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.heartbeat()
+                self._requeue_expired()
+            except sqlite3.Error as e:
+                logging.error(f"Job queue heartbeat failed: {e}")
+
+    def notify(self):
+        """Wake idle workers after a job is enqueued"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            job = self.queue.claim(list(self.handlers))
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            progress = JobProgress(self.queue, job["id"])
+            try:
+                message = self.handlers[job["kind"]](job, progress)
+                self.queue.finish(job["id"], message, progress.timings)
+            except Exception as e:
+                logging.exception(f"Job {job['id']} ({job['kind']}) failed")
+                self.queue.fail(job["id"], str(e), progress.timings)
@@ -0,0 +1,165 @@
+import re
+import math
+from array import array
+import numpy as np
+from atomic_io import atomic_write
+
+# Words, plus identifiers joined by - _ . / : (part numbers, fault codes, signal IDs)
+TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+TOKEN_PART = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Lowercase terms of text; compound identifiers also yield their parts"""
+    terms = []
+    for match in TOKEN.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        parts = TOKEN_PART.findall(term)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+class BM25Index:
+    """Inverted index scored with Okapi BM25, grown incrementally alongside FAISS.
+
+    Document ids are chunk ids. Each term's postings are compact arrays of
+    ids and term frequencies appended in id order, so adding chunks never
+    rewrites existing postings and a query only touches its own terms.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = array("I")
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, texts, first_id=None):
+        """Index texts as consecutive documents starting at first_id (default: the next id)"""
+        if first_id is not None and first_id != len(self):
+            raise ValueError(f"BM25 index holds {len(self)} documents, cannot add at id {first_id}")
+        for text in texts:
+            doc_id = len(self.doc_lengths)
+            terms = tokenize(text)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                ids, tfs = self.postings.get(term) or self.postings.setdefault(term, (array("q"), array("I")))
+                ids.append(doc_id)
+                tfs.append(count)
+            self.doc_lengths.append(len(terms))
+            self.total_length += len(terms)
+
+    def truncate(self, count):
+        """Drop documents with ids >= count"""
+        if len(self) <= count:
+            return
+        for term in list(self.postings):
+            ids, tfs = self.postings[term]
+            keep = int(np.searchsorted(np.frombuffer(ids, dtype=np.int64), count))
+            if keep == 0:
+                del self.postings[term]
+            else:
+                del ids[keep:]
+                del tfs[keep:]
+        del self.doc_lengths[count:]
+        self.total_length = sum(self.doc_lengths)
+
+    def remove(self, ids):
+        """Drop documents from the postings; their ids stay taken, as empty documents"""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[ids < len(self)]
+        if not len(ids):
+            return
+        for term in list(self.postings):
+            term_ids, tfs = self.postings[term]
+            keep = ~np.isin(np.frombuffer(term_ids, dtype=np.int64), ids)
+            if keep.all():
+                continue
+            if not keep.any():
+                del self.postings[term]
+                continue
+            self.postings[term] = (
+                array("q", np.frombuffer(term_ids, dtype=np.int64)[keep].tobytes()),
+                array("I", np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes()),
+            )
+        for doc_id in ids:
+            self.doc_lengths[doc_id] = 0
+        self.total_length = sum(self.doc_lengths)
+
+    def search(self, query, k=10, allowed=None):
+        """Return (ids, scores) of the k best-scoring documents, best first.
+
+        allowed is an optional boolean mask over document ids; documents
+        outside it are skipped before scoring.
+        """
+        n = len(self)
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.postings]
+        if not n or not terms:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+        average_length = self.total_length / n or 1.0
+        all_ids, all_scores = [], []
+        for term in terms:
+            ids, tfs = self.postings[term]
+            ids = np.frombuffer(ids, dtype=np.int64)
+            tfs = np.frombuffer(tfs, dtype=np.uint32).astype(np.float32)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            if allowed is not None:
+                keep = allowed[ids]
+                ids, tfs = ids[keep], tfs[keep]
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[ids] / average_length)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not any(len(ids) for ids in all_ids):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores)).astype(np.float32)
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+    def save(self, path):
+        """Atomically write the index as flat arrays (terms, offsets, ids, tfs, lengths)"""
+        terms = list(self.postings)
+        lengths = [len(self.postings[term][0]) for term in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.empty(int(offsets[-1]), dtype=np.int64)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint32)
+        for i, term in enumerate(terms):
+            term_ids, term_tfs = self.postings[term]
+            ids[offsets[i]:offsets[i + 1]] = np.frombuffer(term_ids, dtype=np.int64)
+            tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(term_tfs, dtype=np.uint32)
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    terms=np.array(terms, dtype=str),
+                    offsets=offsets,
+                    ids=ids,
+                    tfs=tfs,
+                    doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.uint32),
+                    params=np.array([self.k1, self.b]),
+                )
+        atomic_write(path, write)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            k1, b = data["params"]
+            index = cls(float(k1), float(b))
+            offsets, ids, tfs = data["offsets"], data["ids"], data["tfs"]
+            for i, term in enumerate(data["terms"].tolist()):
+                start, end = offsets[i], offsets[i + 1]
+                index.postings[term] = (array("q", ids[start:end].tobytes()), array("I", tfs[start:end].tobytes()))
+            index.doc_lengths = array("I", data["doc_lengths"].astype(np.uint32).tobytes())
+        index.total_length = sum(index.doc_lengths)
+        return index
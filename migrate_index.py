@@ -0,0 +1,117 @@
+"""Compare FAISS vector encodings on the saved index and rebuild it in a new one.
+
+    python migrate_index.py --report                     # compare, change nothing
+    python migrate_index.py --encoding sq8 [--mode ivf]  # rebuild and save
+
+Pause background ingestion while migrating; the save is refused if another
+process saved the index in the meantime.
+"""
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import faiss
+from index_store import IndexStore
+from vector_index import INDEX_MODES, INDEX_ENCODINGS, index_mode, index_encoding, index_vectors, index_ids
+from vector_index import build_index, configure_search, compare_encodings, measure_recall
+from config import INDEX_DIR, EMBEDDING_DIM, INDEX_MODE, IVF_NPROBE, HNSW_EF_SEARCH, PQ_SUBQUANTIZERS
+
+# Chunks read and re-embedded per batch with --reembed
+REEMBED_BATCH = 10000
+
+def source_vectors(index_store, reembed=False):
+    """Float32 vectors to encode and their chunk ids: decoded from the index, or re-embedded from the chunk texts"""
+    ids = index_ids(index_store.index)
+    if not reembed:
+        if index_encoding(index_store.index) != "float32":
+            logging.warning(
+                f"Index is {index_encoding(index_store.index)}-encoded; re-encoding its decoded vectors adds "
+                "to the existing error. Use --reembed to start from the chunk texts."
+            )
+        return np.ascontiguousarray(index_vectors(index_store.index), dtype=np.float32), ids
+
+    from config import load_embedding_model
+    from file_processing import embed_chunks
+
+    embedding_model = load_embedding_model()
+    batches = []
+    for start in range(0, len(ids), REEMBED_BATCH):
+        records = index_store.chunks.get(ids[start:start + REEMBED_BATCH])
+        batches.append(embed_chunks([record["text"] if record else "" for record in records], embedding_model))
+        logging.info(f"Re-embedded {min(start + REEMBED_BATCH, len(ids))}/{len(ids)} chunks")
+    vectors = np.vstack(batches) if batches else np.empty((0, index_store.dim), dtype=np.float32)
+    return vectors, ids
+
+def format_report(rows, count):
+    """Render compare_encodings rows as a fixed-width table"""
+    baseline = rows[0]
+    lines = [
+        f"{count} vectors, recall@k and latency against exact float32 search",
+        f"{'index':<16}{'memory':>12}{'B/vector':>10}{'vs f32':>8}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall':>8}",
+    ]
+    for row in rows:
+        if "error" in row:
+            lines.append(f"{row['name']:<16}  skipped: {row['error']}")
+            continue
+        lines.append(
+            f"{row['name']:<16}{row['bytes'] / 1024 / 1024:>10.1f}MB{row['bytes'] / max(count, 1):>10.0f}"
+            f"{baseline['bytes'] / row['bytes']:>7.1f}x{row['build_seconds']:>9.2f}"
+            f"{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}{row['recall']:>8.3f}"
+        )
+    return "\n".join(lines)
+
+def migrate(index_store, vectors, ids, mode, encoding, pq_m=PQ_SUBQUANTIZERS):
+    """Rebuild the store's index in mode and encoding, save it as a new version and return recall@10"""
+    start = time.perf_counter()
+    index = build_index(mode, vectors, index_store.dim, encoding=encoding, pq_m=pq_m, ids=ids)
+    configure_search(index, IVF_NPROBE, HNSW_EF_SEARCH)
+    recall = measure_recall(index, vectors=vectors, ids=ids)
+    version = index_store.version
+    with index_store.writing():
+        if index_store.version != version:
+            raise RuntimeError("The index was saved by another process during the migration; run it again")
+        index_store.replace_index(index)
+        version = index_store.save()
+    logging.info(
+        f"Saved {mode}/{encoding} index version {version} ({index.ntotal} vectors) in "
+        f"{time.perf_counter() - start:.1f}s, recall@10 {recall:.3f}"
+    )
+    return recall
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--mode", choices=INDEX_MODES, default=INDEX_MODE)
+    parser.add_argument("--encoding", choices=INDEX_ENCODINGS, help="rebuild and save the index in this encoding")
+    parser.add_argument("--pq-m", type=int, default=PQ_SUBQUANTIZERS, help="PQ bytes per vector")
+    parser.add_argument("--report", action="store_true", help="compare every encoding against float32")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--reembed", action="store_true", help="encode fresh embeddings of the chunk texts")
+    args = parser.parse_args(argv)
+    if not args.report and not args.encoding:
+        parser.error("nothing to do: pass --report and/or --encoding")
+
+    index_store = IndexStore(args.index_dir, EMBEDDING_DIM).load(mmap=False)
+    if index_store.index.ntotal == 0:
+        print(f"No vectors in {args.index_dir}")
+        return 1
+    print(f"Current index: {index_mode(index_store.index)}/{index_encoding(index_store.index)}, "
+          f"{index_store.index.ntotal} vectors, version {index_store.version}")
+    vectors, ids = source_vectors(index_store, args.reembed)
+    faiss.normalize_L2(vectors)
+
+    if args.report:
+        rows = compare_encodings(
+            vectors, args.mode, k=args.k, sample_size=args.queries, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH,
+            pq_m=args.pq_m
+        )
+        print(format_report(rows, len(vectors)))
+    if args.encoding:
+        migrate(index_store, vectors, ids, args.mode, args.encoding, args.pq_m)
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
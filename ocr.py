@@ -0,0 +1,132 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import fitz  # PyMuPDF
+
+class GoogleVisionOcrClient:
+    """OCR client backed by Google Cloud Vision text detection"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def detect_text(self, image_bytes):
+        from google.cloud import vision
+
+        response = self.client.text_detection(image=vision.Image(content=image_bytes))
+        if response.error.message:
+            raise Exception(f"Google Cloud Vision Error: {response.error.message}")
+        if response.text_annotations:
+            return response.text_annotations[0].description
+        return ""
+
+def render_page_jpeg(pdf, page_number, dpi=200):
+    """Render one 1-based PDF page to an in-memory JPEG"""
+    return pdf[page_number - 1].get_pixmap(dpi=dpi).tobytes("jpeg")
+
+class OcrPipeline:
+    """Page-streaming OCR with bounded concurrency and a page-hash result cache.
+
+    Pages are rendered one at a time to in-memory JPEGs. At most
+    max_concurrency rendered pages are held while their OCR requests are in
+    flight, so memory stays bounded regardless of document length. The client
+    is anything with detect_text(image_bytes) -> str.
+    """
+
+    def __init__(self, client, max_concurrency=4, dpi=200, cache_dir=None, cache_size=1024):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.dpi = dpi
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def _cache_get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        if self.cache_dir and os.path.exists(self._cache_path(key)):
+            with open(self._cache_path(key), "r", encoding="utf-8") as f:
+                text = f.read()
+            self._cache_put(key, text, persist=False)
+            with self._lock:
+                self.hits += 1
+            return text
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _cache_put(self, key, text, persist=True):
+        with self._lock:
+            self._cache[key] = text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        if persist and self.cache_dir:
+            with open(self._cache_path(key), "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def ocr_image(self, image_bytes):
+        """OCR one image, consulting the cache by content hash first"""
+        key = hashlib.sha256(image_bytes).hexdigest()
+        text = self._cache_get(key)
+        if text is None:
+            text = self.client.detect_text(image_bytes)
+            self._cache_put(key, text)
+        return text
+
+    def ocr_pages(self, file_path, page_numbers):
+        """OCR the given 1-based PDF pages, returning {page_number: text}"""
+        results = {}
+        in_flight = threading.BoundedSemaphore(self.max_concurrency)
+
+        def run(page_number, image_bytes):
+            try:
+                return page_number, self.ocr_image(image_bytes)
+            finally:
+                in_flight.release()
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor, fitz.open(file_path) as pdf:
+            for page_number in page_numbers:
+                # Wait for a free slot before rendering, so only a few page images exist at once
+                in_flight.acquire()
+                try:
+                    image_bytes = render_page_jpeg(pdf, page_number, self.dpi)
+                except Exception:
+                    in_flight.release()
+                    raise
+                futures.append(executor.submit(run, page_number, image_bytes))
+                del image_bytes
+
+            for future in futures:
+                try:
+                    page_number, text = future.result()
+                    results[page_number] = text
+                except Exception as e:
+                    logging.error(f"OCR failed: {e}")
+        return results
+
+    def ocr_pdf(self, file_path):
+        """OCR every page of a PDF and return the text in page order"""
+        with fitz.open(file_path) as pdf:
+            page_count = pdf.page_count
+        texts = self.ocr_pages(file_path, range(1, page_count + 1))
+        return "\n".join(texts[n] for n in sorted(texts) if texts[n]).strip()
+
+    def stats(self):
+        """Return cache hit/miss counters"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache)}
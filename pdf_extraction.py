@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import fitz  # PyMuPDF
+import pdfplumber
+
+# Pages with fewer characters than this from PyMuPDF are retried with pdfplumber
+MIN_PAGE_CHARS = 20
+PAGES_PER_TASK = 8
+BACKENDS = ("pymupdf", "pdfplumber", "ocr")
+# Extraction processes shared by every ingestion in this process
+PDF_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Shared extraction pool, started on first use.
+
+    Workers are spawned rather than forked: a fork copies whatever locks the
+    server, model and FAISS threads hold at that moment into the child.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next extraction starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def new_timings():
+    return {backend: {"pages": 0, "seconds": 0.0} for backend in BACKENDS}
+
+def _record(timings, backend, seconds):
+    timings[backend]["pages"] += 1
+    timings[backend]["seconds"] += seconds
+
+def _merge_timings(total, timings):
+    for backend, stats in timings.items():
+        total[backend]["pages"] += stats["pages"]
+        total[backend]["seconds"] += stats["seconds"]
+
+def extract_page_range(file_path, start, end):
+    """Extract pages [start, end) with PyMuPDF, using pdfplumber only for pages that need it.
+
+    Runs inside a worker process. Pages that still have no text are returned
+    with backend None so the caller can OCR them.
+    """
+    pages = []
+    timings = new_timings()
+    plumber = None
+    try:
+        with fitz.open(file_path) as pdf:
+            for page_no in range(start, end):
+                t0 = time.perf_counter()
+                text = pdf[page_no].get_text() or ""
+                _record(timings, "pymupdf", time.perf_counter() - t0)
+                backend = "pymupdf"
+
+                if len(text.strip()) < MIN_PAGE_CHARS:
+                    t0 = time.perf_counter()
+                    try:
+                        if plumber is None:
+                            plumber = pdfplumber.open(file_path)
+                        plumber_text = plumber.pages[page_no].extract_text() or ""
+                    except Exception as e:
+                        logging.error(f"pdfplumber failed on page {page_no + 1}: {e}")
+                        plumber_text = ""
+                    _record(timings, "pdfplumber", time.perf_counter() - t0)
+                    if len(plumber_text.strip()) > len(text.strip()):
+                        text, backend = plumber_text, "pdfplumber"
+
+                if not text.strip():
+                    text, backend = "", None
+                pages.append({"page": page_no + 1, "text": text, "backend": backend})
+    finally:
+        if plumber is not None:
+            plumber.close()
+    return pages, timings
+
+def _ocr_missing(file_path, pages, ocr_pages, timings):
+    missing = [page["page"] for page in pages if page["backend"] is None]
+    if not missing or not ocr_pages:
+        return
+    t0 = time.perf_counter()
+    ocr_texts = ocr_pages(file_path, missing)
+    timings["ocr"]["pages"] += len(missing)
+    timings["ocr"]["seconds"] += time.perf_counter() - t0
+    for page in pages:
+        if page["backend"] is None and ocr_texts.get(page["page"]):
+            page["text"], page["backend"] = ocr_texts[page["page"]], "ocr"
+
+def _finish(future, file_path, ocr_pages, timings):
+    range_pages, range_timings = future.result()
+    _merge_timings(timings, range_timings)
+    _ocr_missing(file_path, range_pages, ocr_pages, timings)
+    return range_pages
+
+def iter_pdf_pages(file_path, ocr_pages=None, timings=None, max_workers=None, pages_per_task=PAGES_PER_TASK):
+    """Yield pages in order as the shared worker processes finish extracting them.
+
+    ocr_pages(file_path, page_numbers) -> {page_number: text} is called with
+    the 1-based numbers of pages without a text layer. Pages are dicts with
+    "page", "text" and "backend"; per-backend page counts and seconds are
+    accumulated into timings if given. At most max_workers page ranges
+    (default PDF_WORKERS) of this file are in flight at once.
+    """
+    timings = timings if timings is not None else new_timings()
+    with fitz.open(file_path) as pdf:
+        page_count = pdf.page_count
+    ranges = [(start, min(start + pages_per_task, page_count))
+              for start in range(0, page_count, pages_per_task)]
+
+    if len(ranges) <= 1:
+        for start, end in ranges:
+            range_pages, range_timings = extract_page_range(file_path, start, end)
+            _merge_timings(timings, range_timings)
+            _ocr_missing(file_path, range_pages, ocr_pages, timings)
+            yield from range_pages
+        return
+
+    pool = _get_pool()
+    in_flight = max_workers or PDF_WORKERS
+    pending = deque()
+    try:
+        for start, end in ranges:
+            pending.append(pool.submit(extract_page_range, file_path, start, end))
+            if len(pending) < in_flight:
+                continue
+            yield from _finish(pending.popleft(), file_path, ocr_pages, timings)
+        while pending:
+            yield from _finish(pending.popleft(), file_path, ocr_pages, timings)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+def extract_pdf_pages(file_path, ocr_pages=None, max_workers=None, pages_per_task=PAGES_PER_TASK):
+    """Extract text page by page across the shared process pool, keeping page order.
+
+    Returns the list of pages (see iter_pdf_pages) and per-backend timings.
+    """
+    timings = new_timings()
+    pages = list(iter_pdf_pages(file_path, ocr_pages, timings, max_workers, pages_per_task))
+    return pages, timings
+
+def format_timings(timings):
+    """Summarize per-backend timings for logging"""
+    return ", ".join(
+        f"{backend}: {stats['pages']} pages in {stats['seconds']:.2f}s"
+        for backend, stats in timings.items() if stats["pages"]
+    )
@@ -0,0 +1,67 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+
+class CrossEncoderReranker:
+    """Reorders retrieved candidates by cross-encoder relevance within a latency budget.
+
+    All (query, candidate) pairs are scored in a single batch on one of
+    max_workers threads. The budget is measured from when scoring starts; if
+    it does not finish in time the caller gets the original order back. A
+    late batch cannot be interrupted and keeps its thread until predict
+    returns, so when every thread is busy the rerank is skipped rather than
+    queued behind it. The model is anything with
+    predict(pairs, batch_size=...) -> scores, such as a sentence-transformers
+    CrossEncoder.
+    """
+
+    def __init__(self, model, budget=0.5, max_workers=2):
+        self.model = model
+        self.budget = budget
+        self.fallbacks = 0
+        self.skipped = 0
+        self.calls = 0
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+
+    def _score(self, query, texts, started):
+        try:
+            started["at"] = time.perf_counter()
+            started["event"].set()
+            return np.asarray(self.model.predict([(query, text) for text in texts], batch_size=len(texts)))
+        finally:
+            self._slots.release()
+
+    def rerank(self, query, texts, k):
+        """Return (positions of the k best texts, best first, and whether it fell back to the input order)"""
+        self.calls += 1
+        if len(texts) <= 1:
+            return list(range(len(texts)))[:k], False
+        if not self._slots.acquire(blocking=False):
+            self.skipped += 1
+            self.fallbacks += 1
+            logging.warning("Reranker busy with earlier batches; keeping retrieval order")
+            return list(range(len(texts)))[:k], True
+        started = {"event": threading.Event()}
+        future = self._executor.submit(self._score, query, texts, started)
+        try:
+            if not started["event"].wait(self.budget):
+                # Only a batch that has not started can be cancelled
+                if future.cancel():
+                    self._slots.release()
+                raise TimeoutError()
+            scores = future.result(timeout=max(0.0, started["at"] + self.budget - time.perf_counter()))
+        except TimeoutError:
+            self.fallbacks += 1
+            logging.warning(f"Rerank of {len(texts)} candidates exceeded {self.budget * 1000:.0f} ms; keeping retrieval order")
+            return list(range(len(texts)))[:k], True
+        except Exception as e:
+            self.fallbacks += 1
+            logging.error(f"Rerank failed, keeping retrieval order: {e}")
+            return list(range(len(texts)))[:k], True
+        return [int(i) for i in np.argsort(-scores, kind="stable")[:k]], False
+
+    def stats(self):
+        return {"calls": self.calls, "fallbacks": self.fallbacks, "skipped": self.skipped}
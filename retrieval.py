@@ -0,0 +1,200 @@
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import faiss
+from vector_index import base_index, chunk_vectors
+
+# FAISS and numpy release the GIL, so the two retrievers overlap on threads
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+class LatencyTracker:
+    """Rolling per-stage latency samples for p50/p95 reporting"""
+
+    def __init__(self, window=1000):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, timings):
+        with self._lock:
+            for stage, seconds in timings.items():
+                self._samples[stage].append(seconds)
+
+    def percentiles(self, q=(50, 95)):
+        """Return {stage: {"p50": seconds, "p95": seconds, "n": samples}}"""
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+        return {
+            stage: dict({f"p{p}": float(np.percentile(values, p)) for p in q}, n=len(values))
+            for stage, values in samples.items() if values
+        }
+
+latency = LatencyTracker()
+
+def reciprocal_rank_fusion(rankings, k=60, limit=None):
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            doc_id = int(doc_id)
+            if doc_id >= 0:
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+    return fused[:limit] if limit is not None else fused
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def search_parameters(index, selector):
+    """Search parameters restricting index to selector, keeping its nprobe / efSearch"""
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+# Index types whose search rejects an ID selector (flat PQ); others are added when a search fails
+_no_selector = {faiss.IndexPQ}
+
+def accepts_selector(index):
+    """Whether searches of index can be restricted with an ID selector"""
+    return type(base_index(index)) not in _no_selector
+
+def exact_search(query_embedding, index, ids, k):
+    """Brute-force L2 search over a subset of ids using their stored vectors"""
+    vectors = chunk_vectors(index, ids)
+    if vectors is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    distances = ((vectors - query_embedding.reshape(1, -1)) ** 2).sum(axis=1)
+    top = np.argsort(distances, kind="stable")[:k]
+    return np.asarray(ids, dtype=np.int64)[top], distances[top].astype(np.float32)
+
+def _post_filtered_search(query_embedding, index, k, allowed, allowed_ids, exact_limit):
+    """Filtered search for indexes without selector support.
+
+    When at most exact_limit vectors are excluded (e.g. only tombstones),
+    an unrestricted search for k plus that many hits is trimmed to the
+    allowed ones; otherwise the allowed ids are searched exactly.
+    """
+    excluded = index.ntotal - len(allowed_ids)
+    if excluded > exact_limit:
+        return exact_search(query_embedding, index, allowed_ids, k)
+    distances, ids = index.search(query_embedding, min(k + excluded, index.ntotal))
+    ids, distances = ids[0], distances[0]
+    keep = (ids >= 0) & (ids < len(allowed))
+    keep[keep] = allowed[ids[keep]]
+    return ids[keep][:k], distances[keep][:k]
+
+def vector_search(query_embedding, index, k, allowed=None, exact_limit=4096):
+    """Return vector search hits as (ids, distances), dropping FAISS's -1 padding.
+
+    allowed is an optional boolean mask over chunk ids, applied inside the
+    search through an ID selector. ANN indexes only visit part of the graph
+    or lists, so subsets of up to exact_limit ids are searched exactly, as
+    are somewhat larger ones when the filtered ANN search comes up short.
+    Indexes that take no selector (flat PQ) are filtered after searching.
+    """
+    if index.ntotal == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if allowed is None:
+        distances, ids = index.search(query_embedding, k)
+    else:
+        approximate = isinstance(base_index(index), (faiss.IndexIVF, faiss.IndexHNSW))
+        allowed_ids = np.flatnonzero(allowed)
+        if not accepts_selector(index):
+            return _post_filtered_search(query_embedding, index, k, allowed, allowed_ids, exact_limit)
+        if approximate and len(allowed_ids) <= exact_limit:
+            return exact_search(query_embedding, index, allowed_ids, k)
+        # The selector reads the bitmap in place, so it must outlive the search
+        bitmap = np.packbits(allowed, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+        try:
+            distances, ids = index.search(query_embedding, k, params=search_parameters(index, selector))
+        except RuntimeError as e:
+            logging.warning(f"{type(base_index(index)).__name__} rejects ID selectors, filtering after search: {e}")
+            _no_selector.add(type(base_index(index)))
+            return _post_filtered_search(query_embedding, index, k, allowed, allowed_ids, exact_limit)
+        if approximate and (ids[0] < 0).any() and k <= len(allowed_ids) <= 4 * exact_limit:
+            return exact_search(query_embedding, index, allowed_ids, k)
+    found = ids[0] >= 0
+    return ids[0][found], distances[0][found]
+
+def hybrid_search(query, query_embedding, index_store, k=5, candidates=50, rrf_k=60, lexical=True, allowed=None):
+    """Run vector and BM25 retrieval in parallel and fuse them with reciprocal rank fusion.
+
+    Returns the top k chunk ids and per-retriever latencies in seconds.
+    With lexical=False only the vector retriever runs; allowed restricts
+    both retrievers to a boolean mask of chunk ids.
+    """
+    vector_future = _pool.submit(_timed, vector_search, query_embedding, index_store.index, candidates, allowed)
+    lexical_future = (
+        _pool.submit(_timed, index_store.lexical.search, query, candidates, allowed) if lexical else None
+    )
+    (vector_ids, _), vector_seconds = vector_future.result()
+    timings = {"vector": vector_seconds}
+    if lexical_future is None:
+        return [int(doc_id) for doc_id in vector_ids[:k]], timings
+
+    (lexical_ids, _), lexical_seconds = lexical_future.result()
+    timings["bm25"] = lexical_seconds
+    start = time.perf_counter()
+    ids = reciprocal_rank_fusion([vector_ids, lexical_ids], rrf_k, k)
+    timings["fusion"] = time.perf_counter() - start
+    logging.info(
+        "Hybrid retrieval: "
+        + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+        + f" ({len(vector_ids)} vector / {len(lexical_ids)} BM25 candidates)"
+    )
+    return ids, timings
+
+def retrieve_records(query, query_embedding, index_store, k=5, candidates=50, rrf_k=60, lexical=True,
+                     reranker=None, rerank_candidates=50, filters=None):
+    """Retrieve the k best chunk records, optionally reranking a wider candidate set.
+
+    filters (see ChunkMetadata) limit the search to matching chunks.
+    Returns the records, each with its chunk "id", and per-stage latencies
+    in seconds (plus a "total"); timings["reranked"] is False when the
+    reranker fell back to the retrieval order.
+    """
+    start = time.perf_counter()
+    allowed = index_store.filter_mask(filters)
+    filter_seconds = time.perf_counter() - start
+    wanted = max(k, rerank_candidates) if reranker else k
+    ids, timings = hybrid_search(
+        query, query_embedding, index_store, wanted, max(candidates, wanted), rrf_k, lexical, allowed
+    )
+    if allowed is not None:
+        timings["filter"] = filter_seconds
+
+    fetch_start = time.perf_counter()
+    records = [dict(record, id=chunk_id) for chunk_id, record in zip(ids, index_store.chunks.get(ids)) if record]
+    timings["fetch"] = time.perf_counter() - fetch_start
+
+    fell_back = None
+    if reranker and len(records) > k:
+        rerank_start = time.perf_counter()
+        order, fell_back = reranker.rerank(query, [record["text"] for record in records], k)
+        records = [records[i] for i in order]
+        timings["rerank"] = time.perf_counter() - rerank_start
+    records = records[:k]
+    timings["total"] = time.perf_counter() - start
+    latency.record(timings)
+    if fell_back is not None:
+        timings["reranked"] = not fell_back
+    return records, timings
+
+def format_retrieval_timings(timings):
+    text = " · ".join(
+        f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items() if not isinstance(seconds, bool)
+    )
+    if timings.get("reranked") is False:
+        text += " · rerank skipped (over budget)"
+    total = latency.percentiles().get("total")
+    if total:
+        text += f" · p95 {total['p95'] * 1000:.1f} ms over {total['n']} queries"
+    return text
@@ -0,0 +1,50 @@
+import time
+import threading
+from collections import OrderedDict
+
+class RoleCache:
+    """TTL cache of user roles keyed by uid, shared by every session of the process.
+
+    Roles are filled in at login and on the first lookup after expiry;
+    changing a role must call invalidate() so the new role applies on the
+    user's next rerun rather than after the TTL.
+    """
+
+    def __init__(self, ttl=600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+        """Return the cached role, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                self._entries.pop(uid, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(uid)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, uid, role):
+        with self._lock:
+            self._entries[uid] = (role, time.monotonic())
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, uid):
+        with self._lock:
+            self._entries.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached": len(self._entries)}
@@ -0,0 +1,200 @@
+import time
+import socket
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Responses retried with backoff (honouring Retry-After) while the deadline allows
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# The deadline of the fetch running on each thread, so its connection can be cut off
+_current = threading.local()
+
+class _Deadline:
+    """Shuts down the connection of a fetch that outlives its deadline.
+
+    Socket timeouts only bound each read, so a server dripping bytes can keep
+    a request alive indefinitely; shutting the socket down from a timer
+    thread makes the blocked read fail instead.
+    """
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+        self.expired = False
+        self.sock = None
+        self._timer = threading.Timer(seconds, self.cut)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def cut(self):
+        self.expired = True
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def cancel(self):
+        self._timer.cancel()
+
+def _deadline_pool(pool_cls):
+    """Connection pool class whose sockets register with the calling thread's deadline"""
+    class Connection(pool_cls.ConnectionCls):
+        def request(self, *args, **kwargs):
+            super().request(*args, **kwargs)
+            # The response keeps reading this socket even if the connection lets go of it
+            deadline = getattr(_current, "deadline", None)
+            if deadline is not None:
+                deadline.sock = self.sock
+                if deadline.expired:
+                    deadline.cut()
+
+    return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": Connection})
+
+class DeadlineAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections a _Deadline can cut off"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _deadline_pool(HTTPConnectionPool),
+            "https": _deadline_pool(HTTPSConnectionPool),
+        }
+
+class Scraper:
+    """Fetches many URLs concurrently over one pooled session.
+
+    Each host gets at most per_host requests in flight, started at least
+    min_interval seconds apart. Every request has a (connect, read) socket
+    timeout and is retried with exponential backoff on connection errors and
+    429/5xx responses; deadline caps the total time spent on one URL,
+    retries and slow responses included. Passing the ETag/Last-Modified of a
+    previous fetch makes the request conditional, so unchanged pages come
+    back as 304 without a body.
+    """
+
+    def __init__(self, max_workers=8, per_host=2, timeout=(5, 20), retries=3, backoff=0.5, verify=True,
+                 min_interval=0.0, deadline=60.0):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self.timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.deadline = deadline
+        self.verify = verify
+        adapter = DeadlineAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._next_start = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _slot(self, url):
+        with self._lock:
+            return self._host_slots[urlsplit(url).netloc]
+
+    def _wait_turn(self, url):
+        """Sleep until this host's rate limit allows another request"""
+        if not self.min_interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start[host])
+            self._next_start[host] = start + self.min_interval
+        time.sleep(max(0.0, start - now))
+
+    def fetch(self, url, etag=None, last_modified=None):
+        """Fetch one URL and return a result dict; errors are reported, not raised.
+
+        The result has "url", "status", "html", "headers", "not_modified",
+        "error" and "seconds".
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        result = {"url": url, "status": None, "html": None, "headers": {},
+                  "not_modified": False, "error": None, "seconds": 0.0}
+        start = time.perf_counter()
+        deadline = None
+        try:
+            # Retries keep the host slot; the deadline starts once it is ours
+            with self._slot(url):
+                deadline = _current.deadline = _Deadline(self.deadline)
+                response = self._get(url, headers, deadline)
+            result["status"] = response.status_code
+            result["headers"] = response.headers
+            if response.status_code == 304:
+                result["not_modified"] = True
+            else:
+                response.raise_for_status()
+                result["html"] = response.text
+        except requests.RequestException as e:
+            if deadline is not None and deadline.expired:
+                e = f"gave up after the {self.deadline:g}s deadline ({e})"
+            logging.error(f"Error fetching {url}: {e}")
+            result["error"] = str(e)
+        finally:
+            if deadline is not None:
+                deadline.cancel()
+            _current.deadline = None
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying: the response's Retry-After if numeric, else exponential backoff"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.strip().isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+    def _get(self, url, headers, deadline):
+        """GET url, retrying connection errors and RETRY_STATUSES within the deadline; call holding the host slot"""
+        connect_timeout, read_timeout = self.timeout
+        for attempt in range(self.retries + 1):
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise requests.Timeout("deadline exceeded")
+            try:
+                self._wait_turn(url)
+                response = self.session.get(
+                    url, headers=headers, verify=self.verify,
+                    timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)),
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if deadline.expired or attempt == self.retries:
+                    raise
+                response = None
+            if response is not None and (response.status_code not in RETRY_STATUSES or attempt == self.retries):
+                return response
+            delay = self._retry_delay(response, attempt)
+            if response is not None and delay >= deadline.remaining():
+                return response
+            time.sleep(max(0.0, min(delay, deadline.remaining())))
+        return response
+
+    def fetch_all(self, urls, validators=None):
+        """Fetch URLs concurrently, yielding result dicts as they complete.
+
+        validators maps a URL to the (etag, last_modified) of its last fetch.
+        """
+        validators = validators or {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.fetch, url, *validators.get(url, (None, None))) for url in urls]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,83 @@
+import time
+import threading
+from collections import OrderedDict
+
+class SessionListCache:
+    """Per-user cache of chat session lists, fetched from Firestore in pages.
+
+    Sessions are read page_size at a time with limit/start_after, and only
+    as many pages as the sidebar shows. A user's entry expires after ttl
+    seconds. Sessions created through this process are written through with
+    add(), so a new session appears without refetching the list.
+    """
+
+    def __init__(self, page_size=20, ttl=300, max_users=1000):
+        self.page_size = page_size
+        self.ttl = ttl
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fresh_entry(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry["loaded_at"] > self.ttl:
+            return {"sessions": [], "cursor": None, "exhausted": False, "loaded_at": time.monotonic()}
+        return entry
+
+    def sessions(self, user_id, query, pages=1):
+        """Return ([(session_id, data)], has_more) for the first pages of a newest-first query"""
+        wanted = pages * self.page_size
+        with self._lock:
+            entry = self._fresh_entry(user_id)
+            cached = len(entry["sessions"]) >= wanted or entry["exhausted"]
+            if cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+                entry = dict(entry, sessions=list(entry["sessions"]))
+
+        while len(entry["sessions"]) < wanted and not entry["exhausted"]:
+            page = query.limit(self.page_size)
+            if entry["cursor"] is not None:
+                page = page.start_after(entry["cursor"])
+            snapshots = list(page.stream())
+            entry["sessions"].extend((snapshot.id, snapshot.to_dict()) for snapshot in snapshots)
+            if snapshots:
+                entry["cursor"] = snapshots[-1]
+            if len(snapshots) < self.page_size:
+                entry["exhausted"] = True
+
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+            has_more = len(entry["sessions"]) > wanted or not entry["exhausted"]
+            return entry["sessions"][:wanted], has_more
+
+    def add(self, user_id, session_id, data):
+        """Write a newly created session through to the user's cached list"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry["sessions"].insert(0, (session_id, data))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "users": len(self._entries)}
+
+def fetch_page(query, page_size, cursor=None):
+    """Fetch one page of a query after cursor; returns (snapshots, cursor, has_more)"""
+    if cursor is not None:
+        query = query.start_after(cursor)
+    # One extra document tells whether another page exists
+    snapshots = list(query.limit(page_size + 1).stream())
+    has_more = len(snapshots) > page_size
+    snapshots = snapshots[:page_size]
+    return snapshots, snapshots[-1] if snapshots else cursor, has_more
@@ -1,61 +1,102 @@
 import streamlit as st
 import datetime
+from config import get_chat_writer, SESSION_PAGE_SIZE, SESSION_CACHE_TTL, MESSAGE_PAGE_SIZE
+from session_cache import SessionListCache, fetch_page
+
+@st.cache_resource
+def get_session_cache():
+    """Process-wide per-user cache of session lists"""
+    return SessionListCache(SESSION_PAGE_SIZE, SESSION_CACHE_TTL)
 
 def create_session(db):
     """Create a new chat session"""
     try:
-        session_ref = db.collection('chat_sessions').add({
+        session_data = {
             'user_id': st.session_state.user['localId'],
             'start_time': datetime.datetime.now(),
             'status': 'active'
-        })
+        }
+        session_ref = db.collection('chat_sessions').add(session_data)
+        get_session_cache().add(st.session_state.user['localId'], session_ref[1].id, session_data)
         return session_ref[1].id
     except Exception as e:
         st.error(f"Error creating session: {e}")
         return None
 
-def get_session_chats(db, session_id):
-    """Retrieve chats for a specific session"""
+def get_session_chats(db, session_id, cursor=None, page_size=MESSAGE_PAGE_SIZE):
+    """Retrieve one page of a session's chats, newest page first.
+
+    Returns the page's chats in chronological order, the cursor for the
+    next (older) page and whether there is one.
+    """
     try:
-        chats = db.collection('chat_sessions').document(session_id).collection('chats').order_by('timestamp').stream()
-        return [chat.to_dict() for chat in chats]
+        # Chat records are written in the background; make sure this session's are stored
+        get_chat_writer(db).flush(timeout=5)
+        query = db.collection('chat_sessions').document(session_id).collection('chats').order_by(
+            'timestamp', direction='DESCENDING'
+        )
+        chats, cursor, has_more = fetch_page(query, page_size, cursor)
+        return [chat.to_dict() for chat in reversed(chats)], cursor, has_more
     except Exception as e:
         st.error(f"Error retrieving session chats: {e}")
-        return []
+        return [], cursor, False
+
+def format_chat(chat):
+    """Convert a stored chat record to a chat history entry"""
+    return {
+        'time': chat['timestamp'].strftime("%Y-%m-%d %H:%M:%S"),
+        'user': chat['user_message'],
+        'bot': chat['ai_response'],
+        'sources': chat['sources']
+    }
+
+def open_session(db, session_id):
+    """Make a session current and load its most recent page of chats"""
+    chats, cursor, has_more = get_session_chats(db, session_id)
+    st.session_state.current_session = session_id
+    st.session_state.chat_history = [format_chat(chat) for chat in chats]
+    st.session_state.history_cursor = cursor
+    st.session_state.history_has_more = has_more
+
+def load_earlier_chats(db):
+    """Prepend the next older page of the current session's chats"""
+    chats, cursor, has_more = get_session_chats(
+        db, st.session_state.current_session, st.session_state.history_cursor
+    )
+    st.session_state.chat_history = [format_chat(chat) for chat in chats] + st.session_state.chat_history
+    st.session_state.history_cursor = cursor
+    st.session_state.history_has_more = has_more
 
 def handle_session_history(db):
     """Handle chat session history"""
     try:
         st.sidebar.subheader("💭 Chat Sessions")
-        
+
         # Create new session button
         if st.sidebar.button("New Chat Session"):
             st.session_state.current_session = create_session(db)
             st.session_state.chat_history = []
+            st.session_state.history_has_more = False
             st.rerun()
 
-        # Get user's sessions
-        sessions = db.collection('chat_sessions').where('user_id', '==', st.session_state.user['localId']).order_by('start_time', direction='DESCENDING').stream()
-        
+        # Get user's sessions, one page at a time from the per-user cache
+        user_id = st.session_state.user['localId']
+        if "session_pages" not in st.session_state:
+            st.session_state.session_pages = 1
+        query = db.collection('chat_sessions').where('user_id', '==', user_id).order_by('start_time', direction='DESCENDING')
+        sessions, has_more = get_session_cache().sessions(user_id, query, st.session_state.session_pages)
+
         # Display sessions
-        for session in sessions:
-            session_data = session.to_dict()
+        for session_id, session_data in sessions:
             session_time = session_data['start_time'].strftime("%Y-%m-%d %H:%M:%S")
-            
-            if st.sidebar.button(f"Session: {session_time}", key=session.id):
-                st.session_state.current_session = session.id
-                # Load session chats
-                session_chats = get_session_chats(db, session.id)
-                st.session_state.chat_history = [
-                    {
-                        'time': chat['timestamp'].strftime("%Y-%m-%d %H:%M:%S"),
-                        'user': chat['user_message'],
-                        'bot': chat['ai_response'],
-                        'sources': chat['sources']
-                    }
-                    for chat in session_chats
-                ]
+
+            if st.sidebar.button(f"Session: {session_time}", key=session_id):
+                open_session(db, session_id)
                 st.rerun()
 
+        if has_more and st.sidebar.button("Show older sessions"):
+            st.session_state.session_pages += 1
+            st.rerun()
+
     except Exception as e:
         st.error(f"Error handling session history: {e}")
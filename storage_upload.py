@@ -0,0 +1,128 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Resumable upload chunks must be a multiple of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+
+def buffer_hash(buffer):
+    """SHA-256 hex digest of a bytes-like buffer, without copying it"""
+    return hashlib.sha256(memoryview(buffer)).hexdigest()
+
+def file_hash(file_obj, block_size=1024 * 1024):
+    """SHA-256 hex digest of a seekable file, read in blocks; rewinds it afterwards"""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(block_size), b""):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+class StorageUploader:
+    """Uploads files to a storage bucket in parallel, stored once per content hash.
+
+    Blobs are named <prefix>/<sha256><ext> with the original filename in
+    their metadata, so a file whose content is already in the bucket costs a
+    single metadata lookup (none if this process uploaded it) instead of an
+    upload. A public upload makes the blob public even when its content was
+    already stored, e.g. privately or by an older client. Data is streamed
+    from the caller's buffer or file; files larger than resumable_threshold
+    go up as resumable transfers in chunk_size pieces, which retry per chunk
+    instead of restarting the whole file.
+    """
+
+    def __init__(self, bucket, max_workers=4, chunk_size=8 * 1024 * 1024, resumable_threshold=8 * 1024 * 1024):
+        self.bucket = bucket
+        self.max_workers = max_workers
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+        self.resumable_threshold = resumable_threshold
+        self.uploaded = 0
+        self.skipped = 0
+        self.bytes_uploaded = 0
+        # Blob names seen by this process -> whether they are known to be public
+        self._known = {}
+        self._lock = threading.Lock()
+
+    def blob_name(self, prefix, sha256, filename):
+        return f"{prefix}/{sha256}{os.path.splitext(filename)[1].lower()}"
+
+    def upload(self, source, filename, prefix, content_type="application/pdf", public=False, sha256=None):
+        """Upload bytes, a bytes-like buffer, a file object or a local path; returns a result dict.
+
+        Pass sha256 when the content hash is already known to skip hashing.
+        The result has "name", "blob_name", "sha256", "size", "uploaded"
+        (False when the content was already stored), "url" and "seconds".
+        """
+        start = time.perf_counter()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            sha256, size = sha256 or buffer_hash(source), memoryview(source).nbytes
+            file_obj = io.BytesIO(source)
+        elif isinstance(source, str):
+            file_obj = open(source, "rb")
+            sha256, size = sha256 or file_hash(file_obj), os.path.getsize(source)
+        else:
+            file_obj = source
+            # In-memory uploads (BytesIO, Streamlit's UploadedFile) are hashed in place
+            if hasattr(source, "getbuffer"):
+                buffer = source.getbuffer()
+                sha256, size = sha256 or buffer_hash(buffer), buffer.nbytes
+                del buffer
+            else:
+                sha256 = sha256 or file_hash(source)
+                size = source.seek(0, io.SEEK_END)
+                source.seek(0)
+
+        try:
+            blob_name = self.blob_name(prefix, sha256, filename)
+            chunk_size = self.chunk_size if size > self.resumable_threshold else None
+            blob = self.bucket.blob(blob_name, chunk_size=chunk_size)
+            with self._lock:
+                known_public = self._known.get(blob_name)
+            uploaded = False
+            if known_public is None and not blob.exists():
+                blob.metadata = {"filename": filename, "sha256": sha256}
+                blob.upload_from_file(file_obj, rewind=True, size=size, content_type=content_type)
+                uploaded = True
+            if public and not known_public:
+                blob.make_public()
+        finally:
+            if isinstance(source, str):
+                file_obj.close()
+
+        with self._lock:
+            self._known[blob_name] = public or self._known.get(blob_name, False)
+            if uploaded:
+                self.uploaded += 1
+                self.bytes_uploaded += size
+            else:
+                self.skipped += 1
+        return {
+            "name": filename,
+            "blob_name": blob_name,
+            "sha256": sha256,
+            "size": size,
+            "uploaded": uploaded,
+            "url": blob.public_url if public else None,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def upload_many(self, items, prefix, content_type="application/pdf", public=False):
+        """Upload (source, filename[, sha256]) items concurrently; returns results in order, with "error" set on failure"""
+        def run(source, filename, sha256=None):
+            try:
+                return dict(self.upload(source, filename, prefix, content_type, public, sha256), error=None)
+            except Exception as e:
+                logging.error(f"Upload of {filename} failed: {e}")
+                return {"name": filename, "uploaded": False, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(run, *item) for item in items]
+            return [future.result() for future in futures]
+
+    def stats(self):
+        with self._lock:
+            return {"uploaded": self.uploaded, "skipped": self.skipped, "bytes_uploaded": self.bytes_uploaded}
@@ -0,0 +1,72 @@
+import os
+import threading
+import numpy as np
+import pytest
+from embedding_service import MicroBatcher, BatchingEmbeddingModel, EmbeddingServer, RemoteEmbeddingModel
+
+AUTHKEY = "test-key-0123456789abcdef"
+
+class LengthModel:
+    """Encodes a text as [len(text), index in its batch]; records batch sizes"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False):
+        self.batches.append(len(texts))
+        threading.Event().wait(self.delay)
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float32)
+
+def test_micro_batcher_coalesces_concurrent_requests():
+    model = LengthModel()
+    batcher = MicroBatcher(model.encode, max_batch_size=64, max_wait=0.2)
+    futures = [batcher.submit(["x" * n, "y"]) for n in range(1, 9)]
+    results = [future.result(timeout=5) for future in futures]
+    # Each caller gets its own rows back, in order
+    assert [result[:, 0].tolist() for result in results] == [[n, 1] for n in range(1, 9)]
+    assert sum(model.batches) == 16 and len(model.batches) < 8
+    stats = batcher.stats()
+    assert stats["texts"] == 16 and stats["largest_batch"] == max(model.batches)
+
+def test_micro_batcher_caps_batch_size():
+    model = LengthModel()
+    batcher = MicroBatcher(model.encode, max_batch_size=4, max_wait=0.2)
+    futures = [batcher.submit(["a", "b"]) for _ in range(6)]
+    [future.result(timeout=5) for future in futures]
+    assert max(model.batches) <= 4 and sum(model.batches) == 12
+
+def test_micro_batcher_propagates_errors():
+    def fail(texts):
+        raise ValueError("model failed")
+    batcher = MicroBatcher(fail)
+    with pytest.raises(ValueError, match="model failed"):
+        batcher.encode(["a"])
+
+def test_batching_model_single_sentence():
+    model = BatchingEmbeddingModel(LengthModel())
+    assert model.encode("four").tolist() == [4.0, 0.0]
+    assert model.encode(["a", "bb"])[:, 0].tolist() == [1.0, 2.0]
+
+@pytest.mark.skipif(os.name == "nt", reason="Unix socket")
+def test_remote_model_needs_the_shared_key(tmp_path):
+    address = str(tmp_path / "embeddings.sock")
+    server = EmbeddingServer(LengthModel(), address, authkey=AUTHKEY)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    assert os.stat(address).st_mode & 0o777 == 0o600
+
+    client = RemoteEmbeddingModel(address, authkey=AUTHKEY)
+    assert client.encode(["abc", "de"])[:, 0].tolist() == [3.0, 2.0]
+    assert client.stats()["texts"] == 2
+
+    with pytest.raises(Exception):
+        RemoteEmbeddingModel(address, authkey="another-key-0123456789").encode(["abc"])
+    # The server keeps serving after rejecting a client
+    assert client.encode("abcd").tolist() == [4.0, 0.0]
+
+def test_server_refuses_to_start_without_a_key(tmp_path, monkeypatch):
+    monkeypatch.delenv("RAILGPT_EMBEDDING_AUTHKEY", raising=False)
+    with pytest.raises(RuntimeError, match="RAILGPT_EMBEDDING_AUTHKEY"):
+        EmbeddingServer(LengthModel(), str(tmp_path / "embeddings.sock"))
+    with pytest.raises(RuntimeError):
+        RemoteEmbeddingModel(str(tmp_path / "embeddings.sock"), authkey="short")
@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+from index_store import IndexStore
+from vector_index import build_index, index_ids, index_mode, ensure_direct_map
+from retrieval import vector_search
+
+# The job handler pulls in the app configuration and its dependencies
+ingest_jobs = pytest.importorskip("ingest_jobs")
+
+DIM = 16
+rng = np.random.default_rng(0)
+
+class Progress:
+    def stage(self, name, fraction):
+        pass
+
+    def add_time(self, stage, seconds):
+        pass
+
+def document(key, name, count, replace_by_name=False):
+    """Embedded chunks and the document entry _publish expects for one PDF"""
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    chunks = [{"text": f"{name} chunk {i}", "file": name, "doc_key": key, "page": i} for i in range(count)]
+    entry = {
+        "key": key, "name": name, "replace_by_name": replace_by_name,
+        "fields": {"source_type": "pdf", "sha256": key.split(":", 1)[1]},
+    }
+    return vectors, chunks, [entry]
+
+class WordTokenizer:
+    def tokenize(self, text):
+        return text.split()
+
+class HashEmbedder:
+    """Stand-in for the sentence-transformers model: one random vector per distinct text"""
+
+    def encode(self, texts, batch_size=32):
+        return np.stack([
+            np.random.default_rng(abs(hash(text)) % 2**32).standard_normal(DIM) for text in texts
+        ]).astype(np.float32)
+
+def reader(directory):
+    index_store = IndexStore(str(directory), DIM).load()
+    ensure_direct_map(index_store.index)
+    return index_store
+
+@pytest.fixture
+def handler(tmp_path):
+    # A threshold above 1 keeps compaction off the background thread; tests call compact()
+    handler = ingest_jobs.IngestJobHandler(str(tmp_path), None, None, None, dim=DIM, compaction_threshold=2)
+    for key, name in [("sha256:a", "a.pdf"), ("sha256:b", "b.pdf"), ("sha256:c", "c.pdf")]:
+        handler._publish(*document(key, name, 300))
+    return handler
+
+def test_delete_job_tombstones_documents(handler, tmp_path):
+    deleted = set(handler.index_store.manifest.get("sha256:b")["chunk_ids"])
+    assert handler({"payload": {"delete": ["sha256:b", "sha256:missing"]}}, Progress()) == \
+        "Deleted 1 documents (300 chunks)"
+    index_store = reader(tmp_path)
+    assert "sha256:b" not in index_store.manifest
+    assert index_store.metadata.stale_count() == 300
+    ids, _ = vector_search(rng.standard_normal((1, DIM)).astype(np.float32), index_store.index, 50,
+                           index_store.filter_mask(None))
+    assert len(ids) == 50 and not set(ids.tolist()) & deleted
+
+def test_replace_by_name_is_opt_in(handler, tmp_path):
+    handler._publish(*document("sha256:a2", "a.pdf", 10))
+    assert {"sha256:a", "sha256:a2"} <= set(reader(tmp_path).manifest.documents)
+    handler._publish(*document("sha256:a3", "a.pdf", 10, replace_by_name=True))
+    index_store = reader(tmp_path)
+    assert "sha256:a" not in index_store.manifest and "sha256:a2" not in index_store.manifest
+    assert index_store.metadata.stale_count() == 310
+
+@pytest.mark.parametrize("mode", ["flat", "ivf", "hnsw"])
+def test_compaction_drops_tombstoned_vectors(handler, tmp_path, mode):
+    with handler.index_store.writing() as index_store:
+        vectors = index_store.index.reconstruct_batch(index_ids(index_store.index))
+        index_store.replace_index(build_index(mode, vectors, DIM, ids=index_ids(index_store.index)))
+        index_store.save()
+    handler({"payload": {"delete": ["sha256:a"]}}, Progress())
+    live = set(index_ids(reader(tmp_path).index).tolist()) - set(range(300))
+
+    assert handler.compact() == 300
+    index_store = reader(tmp_path)
+    assert index_mode(index_store.index) == mode
+    assert set(index_ids(index_store.index).tolist()) == live
+    assert index_store.metadata.stale_count() == 0 and index_store.filter_mask(None) is None
+    # Chunk ids survive compaction, so stored vectors still match their records
+    ids, distances = vector_search(vectors[450:451], index_store.index, 1)
+    assert ids[0] == 450 and distances[0] < 1e-4
+    assert handler.compact() is None
+
+def test_compaction_keeps_chunks_published_meanwhile(handler, tmp_path, monkeypatch):
+    handler({"payload": {"delete": ["sha256:a"]}}, Progress())
+    empty_like = ingest_jobs.empty_like
+
+    def publish_then_empty_like(index):
+        # Runs outside the writer lock, between the snapshot and the swap
+        handler._publish(*document("sha256:d", "d.pdf", 20))
+        return empty_like(index)
+
+    monkeypatch.setattr(ingest_jobs, "empty_like", publish_then_empty_like)
+    assert handler.compact() == 300
+    index_store = reader(tmp_path)
+    added = index_store.manifest.get("sha256:d")["chunk_ids"]
+    assert set(added) <= set(index_ids(index_store.index).tolist())
+    assert index_store.index.ntotal == 620
+
+def test_file_job_reports_throughput(tmp_path):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(b"%PDF")
+    pages = [{"page": 1, "text": "signal aspects and track circuits " * 40}]
+    handler = ingest_jobs.IngestJobHandler(
+        str(tmp_path / "index"), HashEmbedder(), WordTokenizer(), None, extract_pages=lambda file_path: pages, dim=DIM
+    )
+    job = {"payload": {"files": [{"path": str(path), "name": "signals.pdf", "key": "sha256:signals"}]}}
+    message = handler(job, Progress())
+    assert message.startswith("Embedded ") and "chunks/sec" in message
+    assert not path.exists()
+    assert reader(tmp_path / "index").manifest.get("sha256:signals")["name"] == "signals.pdf"
+
+class PageScraper:
+    """Serves the same page text with whatever ETag the test sets"""
+
+    def __init__(self):
+        self.etag = '"v1"'
+
+    def fetch_all(self, urls, validators=None):
+        for url in urls:
+            yield {"url": url, "error": None, "not_modified": False, "status": 200,
+                   "html": "<p>timetable for the northern line</p>", "headers": {"ETag": self.etag}}
+
+def test_unchanged_page_refreshes_validators_on_latest_manifest(tmp_path):
+    scraper = PageScraper()
+    handler = ingest_jobs.IngestJobHandler(str(tmp_path), HashEmbedder(), WordTokenizer(), scraper, dim=DIM)
+    job = {"payload": {"urls": ["https://example.org/timetable"]}}
+    assert handler(job, Progress()).startswith("Embedded 1 chunks from 1 documents")
+
+    # Another process saves a new version while the handler's copy is stale
+    other = ingest_jobs.IngestJobHandler(str(tmp_path), None, None, None, dim=DIM, compaction_threshold=2)
+    other._publish(*document("sha256:e", "e.pdf", 5))
+    scraper.etag = '"v2"'
+    assert handler(job, Progress()).startswith("Embedded 0 chunks from 0 documents")
+
+    index_store = reader(tmp_path)
+    assert index_store.manifest.get("url:https://example.org/timetable")["etag"] == '"v2"'
+    assert "sha256:e" in index_store.manifest
+    assert index_store.index.ntotal == 6
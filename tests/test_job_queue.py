@@ -0,0 +1,113 @@
+import time
+import sqlite3
+import threading
+from job_queue import JobQueue, JobWorkerPool
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_claim_leases_job_to_one_queue(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first, second = JobQueue(path), JobQueue(path)
+    job_id = first.enqueue("ingest", {"files": []})
+    job = first.claim(["ingest"])
+    assert job["id"] == job_id and job["owner"] == first.owner and job["attempts"] == 1
+    assert second.claim(["ingest"]) is None
+    assert first.claim(["other"]) is None
+
+def test_live_lease_is_not_requeued(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    worker, other = JobQueue(path, lease_seconds=0.3), JobQueue(path)
+    job_id = worker.enqueue("ingest", {})
+    worker.claim(["ingest"])
+    assert other.requeue_expired(["ingest"]) == 0
+    # Heartbeats keep the lease alive past lease_seconds
+    for _ in range(4):
+        time.sleep(0.1)
+        assert worker.heartbeat() == 1
+    assert other.requeue_expired(["ingest"]) == 0
+    assert other.get(job_id)["status"] == "running"
+
+def test_expired_lease_is_requeued_and_retried(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    dead, other = JobQueue(path, lease_seconds=0.05), JobQueue(path)
+    job_id = dead.enqueue("ingest", {"n": 1})
+    dead.claim(["ingest"])
+    time.sleep(0.1)
+    assert other.requeue_expired(["crawl"]) == 0
+    assert other.requeue_expired(["ingest"]) == 1
+    job = other.claim(["ingest"])
+    assert job["id"] == job_id and job["attempts"] == 2 and job["payload"] == {"n": 1}
+
+    # The old owner lost its lease: its late progress and result are ignored
+    dead.update(job_id, progress=0.5, message="stale")
+    dead.finish(job_id, "stale result")
+    assert other.get(job_id)["status"] == "running" and other.get(job_id)["message"] is None
+    other.finish(job_id, "done", {"embed": 1.0})
+    job = other.get(job_id)
+    assert (job["status"], job["message"], job["timings"], job["lease_until"]) == ("done", "done", {"embed": 1.0}, None)
+
+def test_queue_file_without_lease_columns(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+        "status TEXT NOT NULL DEFAULT 'queued', progress REAL NOT NULL DEFAULT 0, stage TEXT, "
+        "timings TEXT NOT NULL DEFAULT '{}', message TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO jobs (kind, payload, status, created_at, updated_at) VALUES ('ingest', '{}', 'running', 0, 0)")
+    conn.commit()
+    conn.close()
+    queue = JobQueue(path)
+    # A job left running by an old version has no lease, so it is requeued
+    assert queue.requeue_expired(["ingest"]) == 1
+    assert queue.claim(["ingest"])["owner"] == queue.owner
+
+def test_worker_pool_runs_and_fails_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+
+    def handler(job, progress):
+        progress.stage("work", 0.5)
+        progress.add_time("work", 0.25)
+        if job["payload"].get("fail"):
+            raise ValueError("bad payload")
+        return f"handled {job['payload']['n']}"
+
+    pool = JobWorkerPool(queue, {"ingest": handler}, workers=2, poll_interval=0.05).start()
+    try:
+        ok = queue.enqueue("ingest", {"n": 1})
+        bad = queue.enqueue("ingest", {"fail": True})
+        ignored = queue.enqueue("crawl", {})
+        pool.notify()
+        wait_for(lambda: queue.get(ok)["status"] == "done" and queue.get(bad)["status"] == "failed")
+    finally:
+        pool.stop()
+    assert queue.get(ok)["message"] == "handled 1" and queue.get(ok)["timings"] == {"work": 0.25}
+    assert queue.get(bad)["message"] == "bad payload"
+    assert queue.get(ignored)["status"] == "queued"
+    assert queue.counts("ingest") == {"queued": 0, "running": 0, "done": 1, "failed": 1}
+
+def test_worker_pool_retries_jobs_of_a_dead_process(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    dead = JobQueue(path, lease_seconds=0.05)
+    job_id = dead.enqueue("ingest", {"n": 2})
+    dead.claim(["ingest"])
+    ran = threading.Event()
+
+    def handler(job, progress):
+        ran.set()
+        return "retried"
+
+    queue = JobQueue(path, lease_seconds=0.3)
+    pool = JobWorkerPool(queue, {"ingest": handler}, workers=1, poll_interval=0.05).start()
+    try:
+        # The heartbeat thread notices the expired lease and a worker picks the job up again
+        wait_for(lambda: queue.get(job_id)["status"] == "done")
+    finally:
+        pool.stop()
+    job = queue.get(job_id)
+    assert ran.is_set() and job["attempts"] == 2 and job["message"] == "retried" and job["owner"] == queue.owner
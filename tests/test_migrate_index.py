@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from index_store import IndexStore
+from vector_index import INDEX_MODES, INDEX_ENCODINGS, index_mode, index_encoding, index_ids, ensure_direct_map
+from vector_index import compare_encodings, measure_recall, build_index, configure_search
+from retrieval import vector_search
+
+DIM = 16
+PQ_M = 4
+LAYOUTS = [(mode, encoding) for mode in INDEX_MODES for encoding in INDEX_ENCODINGS]
+
+def clustered_vectors(count, seed=0):
+    """Unit vectors around a few centres, so neighbours are well defined"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((20, DIM))
+    vectors = centres[rng.integers(0, 20, count)] + 0.1 * rng.standard_normal((count, DIM))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_compare_encodings_report():
+    vectors = clustered_vectors(1000)
+    rows = compare_encodings(vectors, "flat", k=10, sample_size=50, pq_m=PQ_M)
+    assert [row["name"] for row in rows] == ["flat/float32", "flat/fp16", "flat/sq8", "flat/pq"]
+    assert rows[0]["recall"] == 1.0
+    # On a corpus this small the PQ codebooks outweigh its codes, so only compare with float32
+    assert all(row["bytes"] < rows[0]["bytes"] for row in rows[1:])
+    assert all(0.5 <= row["recall"] <= 1.0 for row in rows)
+    assert all(row["p95_ms"] >= row["p50_ms"] >= 0 for row in rows)
+
+def test_compare_encodings_reports_pq_too_small():
+    rows = compare_encodings(clustered_vectors(100), "flat", k=5, sample_size=20, pq_m=PQ_M)
+    assert "256 vectors" in rows[-1]["error"]
+
+@pytest.mark.parametrize("layout", LAYOUTS, ids=["/".join(layout) for layout in LAYOUTS])
+def test_measure_recall(layout):
+    mode, encoding = layout
+    vectors = clustered_vectors(1000)
+    ids = np.arange(1000, dtype=np.int64) * 3
+    index = build_index(mode, vectors, DIM, encoding=encoding, pq_m=PQ_M, ids=ids)
+    assert index_ids(index).tolist() == ids.tolist()
+    configure_search(index, 16, 64)
+    recall = measure_recall(index, sample_size=100, vectors=vectors, ids=ids)
+    assert recall >= (0.95 if encoding in ("float32", "fp16") else 0.5)
+
+@pytest.fixture
+def store(tmp_path):
+    """Saved store of 600 chunks over two documents, with the second one deleted"""
+    vectors = clustered_vectors(600)
+    index_store = IndexStore(str(tmp_path), DIM)
+    with index_store.writing():
+        for first, key in [(0, "sha256:a"), (300, "sha256:b")]:
+            records = [{"text": f"{key} chunk {i}", "file": key, "doc_key": key, "page": i} for i in range(300)]
+            ids = index_store.add(vectors[first:first + 300], records)
+            index_store.manifest.record(key, key, ids, source_type="pdf")
+        index_store.delete_documents(["sha256:b"])
+        index_store.save()
+    return IndexStore(str(tmp_path), DIM).load(mmap=False), vectors
+
+@pytest.mark.parametrize("layout", LAYOUTS, ids=["/".join(layout) for layout in LAYOUTS])
+def test_migrate_round_trip(store, tmp_path, layout):
+    migrate_index = pytest.importorskip("migrate_index")
+    index_store, vectors = store
+    version = index_store.version
+    source, ids = migrate_index.source_vectors(index_store)
+    assert np.allclose(source, vectors) and ids.tolist() == list(range(600))
+
+    recall = migrate_index.migrate(index_store, source, ids, *layout, pq_m=PQ_M)
+    assert 0 < recall <= 1
+    migrated = IndexStore(str(tmp_path), DIM).load()
+    ensure_direct_map(migrated.index)
+    assert (index_mode(migrated.index), index_encoding(migrated.index)) == layout
+    assert migrated.version == version + 1 and migrated.next_id == 600
+    # Ids, chunks, manifest and tombstones carry over unchanged
+    assert index_ids(migrated.index).tolist() == list(range(600))
+    assert sorted(migrated.manifest.documents) == ["sha256:a"]
+    assert migrated.chunks.get([42])[0]["text"] == "sha256:a chunk 42"
+    assert migrated.metadata.stale_count() == 300
+    hits, _ = vector_search(vectors[42:43], migrated.index, 10, migrated.filter_mask(None))
+    assert len(hits) == 10 and 42 in hits.tolist() and hits.max() < 300
+
+def test_migrate_refuses_concurrent_save(store, tmp_path):
+    migrate_index = pytest.importorskip("migrate_index")
+    index_store, vectors = store
+    source, ids = migrate_index.source_vectors(index_store)
+    other = IndexStore(str(tmp_path), DIM)
+    with other.writing():
+        other.save()
+    with pytest.raises(RuntimeError, match="saved by another process"):
+        migrate_index.migrate(index_store, source, ids, "flat", "sq8")
+
+def test_format_report():
+    migrate_index = pytest.importorskip("migrate_index")
+    rows = compare_encodings(clustered_vectors(300), "flat", k=5, sample_size=20, pq_m=PQ_M)
+    report = migrate_index.format_report(rows, 300)
+    assert report.splitlines()[0].startswith("300 vectors")
+    assert all(row["name"] in report for row in rows)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from index_store import IndexStore
+from vector_index import INDEX_MODES, INDEX_ENCODINGS, build_index, configure_search, ensure_direct_map
+from retrieval import vector_search, retrieve_records, reciprocal_rank_fusion
+
+DIM = 16
+PQ_M = 4
+# Documents and their chunk counts; PQ needs 256 vectors to train
+DOCUMENTS = [("sha256:a", "a.pdf", 300), ("sha256:b", "b.pdf", 300), ("url:c", "https://c.example/", 300)]
+LAYOUTS = [(mode, encoding) for mode in INDEX_MODES for encoding in INDEX_ENCODINGS]
+VECTORS = np.random.default_rng(0).standard_normal((sum(count for *_, count in DOCUMENTS), DIM)).astype(np.float32)
+
+def make_store(directory, mode="flat", encoding="float32"):
+    """Store holding DOCUMENTS, rebuilt in mode/encoding the way migrate_index does"""
+    index_store = IndexStore(str(directory), DIM)
+    with index_store.writing():
+        for key, name, count in DOCUMENTS:
+            records = [{"text": f"{name} chunk {i}", "file": name, "doc_key": key, "page": i} for i in range(count)]
+            ids = index_store.add(VECTORS[index_store.next_id:index_store.next_id + count], records)
+            index_store.manifest.record(key, name, ids)
+        if (mode, encoding) != ("flat", "float32"):
+            index = build_index(mode, VECTORS, DIM, encoding=encoding, pq_m=PQ_M)
+            configure_search(index, 16, 64)
+            index_store.replace_index(index)
+        index_store.save()
+    return load_reader(directory)
+
+def load_reader(directory):
+    """Load the saved store the way config.load_index_store does for searches"""
+    index_store = IndexStore(str(directory), DIM).load()
+    configure_search(index_store.index, 16, 64)
+    ensure_direct_map(index_store.index)
+    return index_store
+
+def document_ids(index_store, key):
+    return set(index_store.manifest.get(key)["chunk_ids"])
+
+def query_for(chunk_id):
+    return VECTORS[chunk_id].reshape(1, -1)
+
+@pytest.fixture(scope="module", params=LAYOUTS, ids=["/".join(layout) for layout in LAYOUTS])
+def store(request, tmp_path_factory):
+    return make_store(tmp_path_factory.mktemp("index"), *request.param)
+
+def test_filtered_search_by_source_type(store):
+    url_ids = document_ids(store, "url:c")
+    allowed = store.filter_mask({"source_types": ["url"]})
+    ids, distances = vector_search(query_for(min(url_ids)), store.index, 10, allowed)
+    assert len(ids) == 10 and set(ids.tolist()) <= url_ids
+    assert np.all(np.diff(distances) >= 0)
+
+def test_filtered_search_by_document(store):
+    b_ids = document_ids(store, "sha256:b")
+    allowed = store.filter_mask({"documents": ["sha256:b"]})
+    ids, _ = vector_search(query_for(min(document_ids(store, "sha256:a"))), store.index, 10, allowed)
+    assert len(ids) == 10 and set(ids.tolist()) <= b_ids
+
+def test_filtered_search_exact_fallback(store):
+    # Forcing the exact path (also taken by flat PQ when most chunks are filtered out)
+    allowed = store.filter_mask({"documents": ["sha256:a"]})
+    ids, _ = vector_search(query_for(5), store.index, 10, allowed, exact_limit=10)
+    assert len(ids) == 10 and set(ids.tolist()) <= document_ids(store, "sha256:a")
+
+def test_filtered_retrieve_records(store):
+    records, timings = retrieve_records(
+        "c.example chunk 7", query_for(607), store, k=5, candidates=20,
+        filters={"source_types": ["url"]}
+    )
+    assert len(records) == 5
+    assert {record["file"] for record in records} == {"https://c.example/"}
+    assert "filter" in timings
+
+@pytest.mark.parametrize("layout", LAYOUTS, ids=["/".join(layout) for layout in LAYOUTS])
+def test_unfiltered_search_after_delete(tmp_path, layout):
+    make_store(tmp_path, *layout)
+    writer = IndexStore(str(tmp_path), DIM)
+    with writer.writing():
+        deleted = document_ids(writer, "sha256:a")
+        assert writer.delete_documents(["sha256:a"]) == len(deleted)
+        writer.save()
+    index_store = load_reader(tmp_path)
+    # Tombstones turn every query into a filtered one until compaction
+    allowed = index_store.filter_mask(None)
+    assert allowed is not None and not allowed[list(deleted)].any()
+    ids, _ = vector_search(query_for(3), index_store.index, 10, allowed)
+    assert len(ids) == 10 and not set(ids.tolist()) & deleted
+    records, _ = retrieve_records("a.pdf chunk 3", query_for(3), index_store, k=5, candidates=20)
+    assert len(records) == 5 and all(record["doc_key"] != "sha256:a" for record in records)
+
+def test_unfiltered_search_skips_no_chunks(tmp_path):
+    index_store = make_store(tmp_path)
+    assert index_store.filter_mask(None) is None
+    ids, _ = vector_search(query_for(0), index_store.index, 5)
+    assert ids[0] == 0
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1, -1]], k=60) == [1, 3, 2]
+    assert reciprocal_rank_fusion([[1, 2], [2, 1]], k=60, limit=1) == [1]
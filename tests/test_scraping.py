@@ -0,0 +1,158 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from scraping import Scraper
+
+class Handler(BaseHTTPRequestHandler):
+    """Test server routes; counters live on the server so each test starts clean"""
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body=b"<p>ok</p>", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+        if self.path.startswith("/slow/"):
+            with server.lock:
+                server.in_flight += 1
+                server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            time.sleep(0.2)
+            with server.lock:
+                server.in_flight -= 1
+            self.send_body(200)
+        elif self.path == "/busy":
+            self.send_body(429 if hits < 3 else 200, headers=[("Retry-After", "0")] if hits < 3 else [])
+        elif self.path == "/flaky":
+            self.send_body(503 if hits < 3 else 200)
+        elif self.path == "/down":
+            self.send_body(500)
+        elif self.path == "/etag":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_body(304, b"")
+            else:
+                self.send_body(200, headers=[("ETag", '"v1"')])
+        elif self.path == "/modified":
+            stamp = "Wed, 01 Jan 2025 00:00:00 GMT"
+            if self.headers.get("If-Modified-Since") == stamp:
+                self.send_body(304, b"")
+            else:
+                self.send_body(200, headers=[("Last-Modified", stamp)])
+        elif self.path == "/hang":
+            time.sleep(3)
+            self.send_body(200)
+        elif self.path == "/drip":
+            # Each byte arrives well within the read timeout, the whole body never does
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            try:
+                for _ in range(1000):
+                    self.wfile.write(b"x")
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            except OSError:
+                pass
+        else:
+            self.send_body(404, b"")
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.hits = {}
+    httpd.in_flight = httpd.max_in_flight = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_per_host_limit(server):
+    httpd, base = server
+    scraper = Scraper(max_workers=8, per_host=2)
+    results = list(scraper.fetch_all([f"{base}/slow/{i}" for i in range(6)]))
+    assert all(result["html"] == "<p>ok</p>" for result in results)
+    assert httpd.max_in_flight == 2
+
+def test_min_interval_spaces_requests(server):
+    _, base = server
+    scraper = Scraper(per_host=4, min_interval=0.1)
+    start = time.perf_counter()
+    list(scraper.fetch_all([f"{base}/etag?{i}" for i in range(4)]))
+    assert time.perf_counter() - start >= 0.3
+
+def test_retries_429_honouring_retry_after(server):
+    httpd, base = server
+    result = Scraper(retries=3, backoff=5).fetch(f"{base}/busy")
+    assert result["status"] == 200 and result["error"] is None
+    assert httpd.hits["/busy"] == 3
+    # Retry-After: 0 overrides the 5 s backoff
+    assert result["seconds"] < 2
+
+def test_retries_5xx_with_backoff(server):
+    httpd, base = server
+    result = Scraper(retries=3, backoff=0.1).fetch(f"{base}/flaky")
+    assert result["status"] == 200 and result["html"] == "<p>ok</p>"
+    assert httpd.hits["/flaky"] == 3
+    # Two backoff sleeps: 0.1 s, then 0.2 s
+    assert result["seconds"] >= 0.3
+
+def test_gives_up_after_retries(server):
+    httpd, base = server
+    result = Scraper(retries=2, backoff=0.01).fetch(f"{base}/down")
+    assert result["status"] == 500 and "500" in result["error"]
+    assert httpd.hits["/down"] == 3
+
+def test_etag_not_modified(server):
+    _, base = server
+    scraper = Scraper()
+    first = scraper.fetch(f"{base}/etag")
+    assert first["html"] and first["headers"]["ETag"] == '"v1"'
+    second = scraper.fetch(f"{base}/etag", etag=first["headers"]["ETag"])
+    assert second["not_modified"] and second["html"] is None and second["error"] is None
+
+def test_last_modified_not_modified(server):
+    _, base = server
+    scraper = Scraper()
+    first = scraper.fetch(f"{base}/modified")
+    second = scraper.fetch(f"{base}/modified", last_modified=first["headers"]["Last-Modified"])
+    assert second["status"] == 304 and second["not_modified"]
+
+def test_fetch_all_sends_validators(server):
+    _, base = server
+    results = list(Scraper().fetch_all([f"{base}/etag"], {f"{base}/etag": ('"v1"', None)}))
+    assert results[0]["not_modified"]
+
+def test_read_timeout(server):
+    _, base = server
+    result = Scraper(timeout=(1, 0.5), retries=0).fetch(f"{base}/hang")
+    assert result["error"] and result["seconds"] < 2
+
+def test_deadline_caps_slow_drip(server):
+    _, base = server
+    result = Scraper(timeout=(1, 1), retries=3, deadline=1).fetch(f"{base}/drip")
+    assert result["error"] and "deadline" in result["error"]
+    assert result["seconds"] < 2
+
+def test_deadline_caps_retries(server):
+    _, base = server
+    result = Scraper(retries=10, backoff=0.3, deadline=1).fetch(f"{base}/down")
+    assert result["error"]
+    assert result["seconds"] < 1.5
+
+def test_connection_error_reported(server):
+    httpd, base = server
+    result = Scraper(retries=1, backoff=0.01).fetch("http://127.0.0.1:9/")
+    assert result["status"] is None and result["error"]
@@ -0,0 +1,43 @@
+from fakes import FakeBucket
+from storage_upload import StorageUploader
+
+def test_same_content_is_uploaded_once():
+    bucket = FakeBucket()
+    uploader = StorageUploader(bucket)
+    first = uploader.upload(b"%PDF one", "a.pdf", "pdfs")
+    second = uploader.upload(b"%PDF one", "copy.pdf", "pdfs")
+    assert first["uploaded"] and not second["uploaded"]
+    assert first["blob_name"] == second["blob_name"] and bucket.uploads == 1
+    # This process uploaded the blob, so the second call needs no lookup either
+    assert bucket.exists_calls == 1
+
+def test_public_upload_of_private_blob_makes_it_public():
+    bucket = FakeBucket()
+    uploader = StorageUploader(bucket)
+    private = uploader.upload(b"%PDF two", "b.pdf", "pdfs")
+    assert private["url"] is None and not bucket.public
+    public = uploader.upload(b"%PDF two", "b.pdf", "pdfs", public=True)
+    assert not public["uploaded"] and public["url"]
+    assert bucket.public == {public["blob_name"]}
+
+def test_public_upload_of_blob_stored_by_another_client():
+    bucket = FakeBucket()
+    StorageUploader(bucket).upload(b"%PDF three", "c.pdf", "pdfs")
+    result = StorageUploader(bucket).upload(b"%PDF three", "c.pdf", "pdfs", public=True)
+    assert not result["uploaded"] and bucket.public == {result["blob_name"]}
+
+def test_known_public_blob_is_not_made_public_again(monkeypatch):
+    bucket = FakeBucket()
+    uploader = StorageUploader(bucket)
+    uploader.upload(b"%PDF four", "d.pdf", "pdfs", public=True)
+    calls = []
+    monkeypatch.setattr(type(bucket.blob("x")), "make_public", lambda blob: calls.append(blob.name))
+    uploader.upload(b"%PDF four", "d.pdf", "pdfs", public=True)
+    uploader.upload(b"%PDF four", "d.pdf", "pdfs")
+    assert calls == []
+
+def test_upload_many_reports_errors_in_order(tmp_path):
+    uploader = StorageUploader(FakeBucket())
+    results = uploader.upload_many([(b"%PDF five", "e.pdf"), (str(tmp_path / "missing.pdf"), "f.pdf")], "pdfs")
+    assert [result["name"] for result in results] == ["e.pdf", "f.pdf"]
+    assert results[0]["error"] is None and results[1]["error"]
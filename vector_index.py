@@ -0,0 +1,258 @@
+import math
+import time
+import logging
+import numpy as np
+import faiss
+
+INDEX_MODES = ("flat", "ivf", "hnsw")
+# Vector encodings: 4 * d bytes per vector for float32, 2 * d for fp16, d for sq8, pq_m for pq
+INDEX_ENCODINGS = ("float32", "fp16", "sq8", "pq")
+# Training sample cap for codebooks; k-means cost grows with it, quality barely does
+MAX_TRAINING_VECTORS = 100000
+
+def base_index(index):
+    """Return the index behind an id map (the index itself if it has none)"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def new_index(dim):
+    """Empty flat index whose ids are chunk ids rather than insertion positions"""
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+def index_ids(index):
+    """Chunk ids of the stored vectors, in storage order"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+def index_mode(index):
+    """Return the mode name of a FAISS index"""
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def index_encoding(index):
+    """Return how an index stores its vectors: float32, fp16, sq8 or pq"""
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float32"
+
+def index_bytes(index):
+    """Size of the serialized index, which is about what a loaded copy holds in memory"""
+    return int(faiss.serialize_index(index).nbytes)
+
+def ensure_direct_map(index):
+    """Let an IVF index reconstruct vectors by id; this modifies the index, so call it before searches share it"""
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF) and base.direct_map.type == faiss.DirectMap.NoMap:
+        base.make_direct_map()
+
+def index_vectors(index):
+    """Return all vectors stored in an index as a float32 matrix, in the order of index_ids"""
+    ensure_direct_map(index)
+    base = base_index(index)
+    return base.reconstruct_n(0, base.ntotal)
+
+def chunk_vectors(index, ids):
+    """Return the stored vectors for chunk ids, or None if the index cannot reconstruct them.
+
+    Read-only, so search threads may call it; IVF indexes need ensure_direct_map first.
+    """
+    try:
+        return index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+    except RuntimeError as e:
+        logging.warning(f"Cannot reconstruct vectors from a {type(index).__name__}: {e}")
+        return None
+
+def _codec(encoding, dim, pq_m):
+    """FAISS factory suffix for a vector encoding"""
+    if encoding == "float32":
+        return "Flat"
+    if encoding == "fp16":
+        return "SQfp16"
+    if encoding == "sq8":
+        return "SQ8"
+    if encoding == "pq":
+        if dim % pq_m:
+            raise ValueError(f"PQ needs a dimension divisible by pq_m, got {dim} and {pq_m}")
+        return f"PQ{pq_m}"
+    raise ValueError(f"Unknown index encoding: {encoding}")
+
+def build_index(mode, vectors, dim, hnsw_m=32, encoding="float32", pq_m=48, seed=0, ids=None):
+    """Build an index of the given mode and encoding holding vectors under ids (default 0..n-1), training it if needed"""
+    codec = _codec(encoding, dim, pq_m)
+    if encoding == "pq" and len(vectors) < 256:
+        raise ValueError(f"PQ needs at least 256 vectors to train its codebooks, got {len(vectors)}")
+    if mode == "ivf":
+        # Rule of thumb: about 4 * sqrt(n) lists, with enough points to train each
+        nlist = max(1, min(int(4 * math.sqrt(len(vectors))), len(vectors) // 39))
+        index = faiss.index_factory(dim, f"IVF{nlist},{codec}")
+    elif mode == "hnsw":
+        index = faiss.index_factory(dim, f"HNSW{hnsw_m},{codec}")
+    elif mode == "flat":
+        index = faiss.index_factory(dim, codec)
+    else:
+        raise ValueError(f"Unknown index mode: {mode}")
+    if not index.is_trained:
+        training = vectors
+        if len(vectors) > MAX_TRAINING_VECTORS:
+            rng = np.random.default_rng(seed)
+            training = vectors[np.sort(rng.choice(len(vectors), MAX_TRAINING_VECTORS, replace=False))]
+        index.train(training)
+    return add_with_ids(faiss.IndexIDMap2(index), vectors, ids)
+
+def add_with_ids(index, vectors, ids=None):
+    """Add vectors to an id-mapped index under ids (default 0..n-1) and return it"""
+    if ids is None:
+        ids = np.arange(len(vectors), dtype=np.int64)
+    if len(vectors):
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    return index
+
+def empty_like(index):
+    """Empty id-mapped index with the same mode, encoding and trained codebooks as index.
+
+    IVF indexes are cloned with their inverted lists briefly detached, so the
+    stored vectors are never copied (and may be memory-mapped); don't call it
+    on an index other threads are searching.
+    """
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        invlists, owned = base.invlists, base.own_invlists
+        base.own_invlists = False
+        placeholder = faiss.ArrayInvertedLists(base.nlist, base.code_size)
+        base.replace_invlists(placeholder, False)
+        try:
+            empty = faiss.clone_index(base)
+        finally:
+            base.replace_invlists(invlists, owned)
+    else:
+        empty = faiss.clone_index(base)
+    empty.reset()
+    return faiss.IndexIDMap2(empty)
+
+def ensure_id_map(index):
+    """Return index with an id map, converting a positional index (ids 0..n-1) if needed"""
+    if isinstance(index, faiss.IndexIDMap):
+        return index
+    return add_with_ids(empty_like(index), index_vectors(index))
+
+def configure_search(index, nprobe, ef_search):
+    """Apply the nprobe / efSearch knobs to an ANN index"""
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    return index
+
+def measure_recall(index, k=10, sample_size=200, seed=0, vectors=None, ids=None):
+    """Measure recall@k of an index against exact flat search on its own vectors.
+
+    A sample of stored vectors is used as queries, so the figure reflects the
+    current corpus rather than a synthetic benchmark. Pass the original
+    float32 vectors for a compressed index; its decoded copies would hide the
+    encoding error. ids are the chunk ids of vectors (default 0..n-1).
+    """
+    if vectors is None:
+        vectors, ids = index_vectors(index), index_ids(index)
+    if ids is None:
+        ids = np.arange(len(vectors), dtype=np.int64)
+    if len(vectors) == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)
+    queries = vectors[sample]
+    k = min(k, len(vectors))
+
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, expected = baseline.search(queries, k)
+    expected = np.asarray(ids, dtype=np.int64)[expected]
+    _, found = index.search(queries, k)
+
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / float(expected.size)
+
+def benchmark_index(index, queries, expected, k=10):
+    """Time single-query searches and score them against exact neighbours.
+
+    Returns memory bytes, p50/p95 latency in milliseconds and recall@k.
+    """
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return {
+        "bytes": index_bytes(index),
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "recall": hits / float(expected.size),
+    }
+
+def compare_encodings(vectors, mode, encodings=INDEX_ENCODINGS, k=10, sample_size=200, nprobe=16, ef_search=64,
+                      pq_m=48, seed=0):
+    """Build vectors in each encoding and benchmark them against an exact float32 flat baseline.
+
+    Returns one row per index, baseline first, with "name", "build_seconds"
+    and the benchmark_index figures. Encodings that cannot be built (e.g. PQ
+    on a tiny corpus) get an "error" instead.
+    """
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)]
+    k = min(k, len(vectors))
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    start = time.perf_counter()
+    baseline.add(vectors)
+    build_seconds = time.perf_counter() - start
+    _, expected = baseline.search(queries, k)
+    rows = [dict(benchmark_index(baseline, queries, expected, k), name="flat/float32", build_seconds=build_seconds)]
+    for encoding in encodings:
+        name = f"{mode}/{encoding}"
+        if name == "flat/float32":
+            continue
+        start = time.perf_counter()
+        try:
+            index = build_index(mode, vectors, vectors.shape[1], encoding=encoding, pq_m=pq_m, seed=seed)
+        except (ValueError, RuntimeError) as e:
+            rows.append({"name": name, "error": str(e)})
+            continue
+        build_seconds = time.perf_counter() - start
+        configure_search(index, nprobe, ef_search)
+        rows.append(dict(benchmark_index(index, queries, expected, k), name=name, build_seconds=build_seconds))
+    return rows
+
+def maybe_promote(index_store, mode, threshold, nprobe, ef_search, encoding="float32", pq_m=48):
+    """Rebuild a float32 flat index in the configured mode and encoding once it holds threshold vectors.
+
+    Returns the measured recall@10 of the new index, or None if nothing changed.
+    """
+    index = index_store.index
+    if (mode, encoding) == ("flat", "float32") or index.ntotal < threshold:
+        return None
+    if (index_mode(index), index_encoding(index)) != ("flat", "float32"):
+        return None
+    start = time.perf_counter()
+    vectors, ids = index_vectors(index), index_ids(index)
+    promoted = build_index(mode, vectors, index.d, encoding=encoding, pq_m=pq_m, ids=ids)
+    configure_search(promoted, nprobe, ef_search)
+    index_store.replace_index(promoted)
+    recall = measure_recall(promoted, vectors=vectors, ids=ids)
+    logging.info(
+        f"Promoted index to {mode}/{encoding} at {promoted.ntotal} vectors in "
+        f"{time.perf_counter() - start:.2f}s (recall@10 {recall:.3f})"
+    )
+    return recall